@@ -1,27 +1,104 @@
 """An AWS Python Pulumi program"""
 
+# First, it profiles the imports that follow with PULUMI_PROGRAM_PROFILE set
+import startup_profile
 import pulumi
 
-from api_gateway import create_api_gateway
-from cloudfront import upload_frontend
-from dynamodb import create_todo_table
+from api_gateway import create_api_gateway, create_api_domain, deployed_functions
+from app_config import config
+from archive import (get_completed_items_settings, create_archive_bucket, create_archive_read_policy,
+                     create_archiver, TTL_ATTRIBUTE, ARCHIVE_PREFIX)
+from cloudfront import upload_frontend, publish_frontend_config
+from cognito import create_cognito_user_pool
+from dynamodb import create_todo_table, create_versions_table
 from lambda_functions import create_lambda_dynamodb_policy
+from monitoring import get_monitoring_settings, create_monitoring
+from read_cache import get_read_cache_settings
+from regions import multi_region_settings, create_regions, in_region, any_region_arn, create_latency_record
 
+startup_profile.mark("imports")
 
-# DynamoDB
+# DynamoDB, completed items expire by TTL and the expired ones are archived from the table stream.
+# With `multiRegion`, the tables are global tables with a replica in every region of the API.
 table_name = "todo-api"
-todo_table = create_todo_table(table_name)
+replica_regions = multi_region_settings.replica_regions
+completed_items = get_completed_items_settings()
+archive_completed_items = bool(completed_items and completed_items.archive)
+todo_table = create_todo_table(table_name,
+                               ttl_attribute=TTL_ATTRIBUTE if completed_items else None,
+                               stream_view_type="OLD_IMAGE" if archive_completed_items else None,
+                               replica_regions=replica_regions)
+# The Lambda roles are shared by the regions, they may use every replica
 dynamodb_policy = create_lambda_dynamodb_policy(name=f"lambdaDynamoDBTodoPolicy",
-                                                dynamodb_table_arn=todo_table.arn)
+                                                dynamodb_table_arn=any_region_arn(todo_table.arn) if replica_regions
+                                                else todo_table.arn)
+lambda_policies = [dynamodb_policy]
+lambda_environment = {}
+if completed_items:
+    lambda_environment["COMPLETED_TTL_SECONDS"] = str(completed_items.ttl_seconds)
+if archive_completed_items:
+    archive_bucket = create_archive_bucket(completed_items)
+    create_archiver(todo_table, archive_bucket, completed_items)
+    lambda_policies.append(create_archive_read_policy("lambdaArchiveReadPolicy", archive_bucket))
+    lambda_environment["ARCHIVE_BUCKET"] = archive_bucket.bucket
+    lambda_environment["ARCHIVE_PREFIX"] = ARCHIVE_PREFIX
+
+# Per-user write versions of the Lambda read caches
+read_cache = get_read_cache_settings()
+if read_cache:
+    versions_table = create_versions_table(f"{table_name}-versions", replica_regions=replica_regions)
+    lambda_policies.append(create_lambda_dynamodb_policy(name="lambdaDynamoDBVersionsPolicy",
+                                                         dynamodb_table_arn=any_region_arn(versions_table.arn)
+                                                         if replica_regions else versions_table.arn))
+    lambda_environment.update(read_cache.environment(versions_table.name))
 
 # Frontend S3 and CloudFront
 cdn, frontend_s3_bucket = upload_frontend()
 frontend_url = pulumi.Output.concat("https://", cdn.domain_name)
 
-# API Gateway and Lambdas
-api_id, stage_name, invoke_url = create_api_gateway(redirect_url=frontend_url,
-                                                    lambda_policies=[dynamodb_policy],
-                                                    dynamodb_table=table_name)
+# Cognito User Pool
+user_pool, user_pool_client, cognito_hosted_domain = create_cognito_user_pool(redirect_url=frontend_url)
+
+# API Gateway and Lambdas: REST API (v1) or HTTP API (v2), in every region of `multiRegion`
+if config.get("apiGatewayType") == "http":
+    from http_api import create_http_api_gateway as create_api_gateway, create_http_api_domain as create_api_domain
+
+monitoring_settings = get_monitoring_settings()
+regional_apis = {}
+dashboards = {}
+for region in create_regions(multi_region_settings):
+    with in_region(region):
+        # The Lambdas of a region use the table replica of their region
+        regional_apis[region.name] = create_api_gateway(user_pool=user_pool,
+                                                        user_pool_client=user_pool_client,
+                                                        lambda_policies=lambda_policies,
+                                                        lambda_environment={**lambda_environment,
+                                                                            "REGION": region.name},
+                                                        dynamodb_table=table_name)
+        if multi_region_settings.domain_name:
+            # One hostname, answered by the closest region
+            target_domain_name, target_zone_id = create_api_domain(
+                multi_region_settings.domain_name,
+                multi_region_settings.certificate_arns[region.name],
+                api_id=regional_apis[region.name][0],
+                stage_name=regional_apis[region.name][1],
+            )
+            create_latency_record(multi_region_settings, target_domain_name, target_zone_id)
+
+        # CloudWatch alarms and dashboard of the Lambdas and the table
+        dashboards[region.name] = create_monitoring(deployed_functions(), todo_table, monitoring_settings)
+
+api_id, stage_name, invoke_url = regional_apis[multi_region_settings.primary_region]
+api_url = f"https://{multi_region_settings.domain_name}" if multi_region_settings.domain_name else invoke_url
+dashboard = dashboards[multi_region_settings.primary_region]
+
+# Runtime config of the frontend, see frontend-src/src/config.js
+publish_frontend_config(frontend_s3_bucket, {
+    "aws_user_pools_web_client_id": user_pool_client.id,
+    "api_base_url": api_url,
+    "cognito_hosted_domain": cognito_hosted_domain,
+    "redirect_url": frontend_url,
+})
 
 
 # Export the URLs and hostnames of the bucket and distribution.
@@ -37,4 +114,12 @@ pulumi.export("cdnHostname", cdn.domain_name)
 pulumi.export("rest_api_id", api_id)
 pulumi.export("stage_name", stage_name)
 pulumi.export("backend_invoke_url", invoke_url)
+if multi_region_settings.replica_regions:
+    pulumi.export("regional_invoke_urls", {region: api[2] for region, api in regional_apis.items()})
+if multi_region_settings.domain_name:
+    pulumi.export("api_url", api_url)
 pulumi.export("website_url", frontend_url)
+if dashboard:
+    pulumi.export("dashboard_name", dashboard.dashboard_name)
+
+startup_profile.finish()
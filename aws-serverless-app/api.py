@@ -1,12 +1,71 @@
+import functools
+import re
 import sys
 import os.path
 from collections import OrderedDict
-from typing import Optional, Dict, Literal, Any
-from pydantic import validator, BaseModel, ValidationError
+from typing import Optional, Dict, Literal, Any, List
+from pydantic import validator, root_validator, BaseModel, ValidationError
 from app_config import config
 
 
 backend_src_path = config.require("backendSRCPath")
+# "sync": addTodo writes the item, "queue": API Gateway enqueues it to SQS and a consumer writes it (REST API only)
+write_ingestion = config.get("writeIngestion") or "sync"
+
+# CORS headers returned by the OPTIONS methods
+cors_headers = {
+    "Access-Control-Allow-Origin": "'*'",
+    "Access-Control-Allow-Methods": "'OPTIONS,HEAD,GET,PUT,POST,DELETE'",
+    "Access-Control-Allow-Headers": "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,Cache-Control,If-None-Match'",
+}
+# Cache key parameter that keeps the cached responses of every user apart
+AUTHORIZATION_CACHE_KEY = "method.request.header.Authorization"
+
+
+class APIResourceCache(BaseModel):
+    enabled: bool = True
+    ttl: int = 300
+    key_parameters: List[str] = [AUTHORIZATION_CACHE_KEY]
+
+    @validator("ttl")
+    def _ttl_validator(cls, ttl: int) -> int:
+        if not 0 <= ttl <= 3600:
+            raise ValueError("API Gateway cache TTL must be between 0 and 3600 seconds")
+        return ttl
+
+
+class APIResourceQueue(BaseModel):
+    """SQS buffered writes: API Gateway enqueues the request, a consumer Lambda drains the queue"""
+    consumer: str  # backend-src directory of the consumer Lambda
+    handler: str = "app.handler"
+    timeout: int = 60
+    batch_size: int = 100
+    batching_window: int = 1  # seconds the event source waits to fill a batch
+    max_receive_count: int = 5  # deliveries before a message moves to the dead-letter queue
+    retention: int = 345600  # seconds
+    dlq_retention: int = 1209600  # seconds
+    max_concurrency: Optional[int]  # consumer concurrency limit, from 2
+    queue_: Any
+    dead_letter_queue_: Any
+    credentials_: Any  # role API Gateway sends messages with
+
+    @validator("batch_size")
+    def _batch_size_validator(cls, batch_size: int) -> int:
+        if not 1 <= batch_size <= 10000:
+            raise ValueError("SQS batch size must be between 1 and 10000")
+        return batch_size
+
+    @validator("batching_window")
+    def _batching_window_validator(cls, batching_window: int) -> int:
+        if not 0 <= batching_window <= 300:
+            raise ValueError("SQS batching window must be between 0 and 300 seconds")
+        return batching_window
+
+    @root_validator(skip_on_failure=True)
+    def _batch_validator(cls, values):
+        if values["batch_size"] > 10 and values["batching_window"] < 1:
+            raise ValueError("SQS batches of more than 10 messages require a batching window")
+        return values
 
 
 class APIResourceFunction(BaseModel):
@@ -22,12 +81,69 @@ class APIResourceFunction(BaseModel):
     description: Optional[str] = ""
     integration_type: Literal["HTTP", "AWS", "AWS_PROXY", "MOCK"] = "AWS_PROXY"
     integration_method: Literal["GET", "POST", "PUT", "DELETE", "HEAD", "OPTIONS", "ANY", "PATCH"] = "POST"  # For Lambdas it is always POST
+    # Validated by API Gateway, eg {"method.request.querystring.limit": False}, the value is `required`
+    request_parameters: Dict[str, bool] = {}
+    # Lambda settings, overridden per stack by the `lambdaSettings` config
+    memory_size: int = 256
+    architecture: Literal["x86_64", "arm64"] = "arm64"
+    ephemeral_storage: int = 512
+    reserved_concurrency: Optional[int]
+    provisioned_concurrency: Optional[int]  # requires an alias
+    alias: Optional[str] = "live"  # API Gateway invokes the alias if set
+    alias_: Any
+    # Extra inline policy documents of the function, functions with the same permissions share a role
+    policy_filenames: List[str] = []
+    dedicated_role: bool = False  # a role of its own, even if another function has the same permissions
+    # Stage cache settings of GET methods
+    cache: Optional[APIResourceCache]
+    # Cached GET paths a client may refetch with Cache-Control: max-age=0 after calling this method.
+    # That only flushes the entry of the refetched request, the other entries expire after their TTL.
+    invalidates: List[str] = []
+    # AWS (service) integrations: the request is sent to an SQS queue instead of a Lambda
+    queue: Optional[APIResourceQueue]
+
+    @validator("request_parameters")
+    def _request_parameters_validator(cls, request_parameters: Dict[str, bool]) -> Dict[str, bool]:
+        for parameter in request_parameters:
+            if not re.match(r"^method\.request\.(querystring|header|path)\.[\w-]+$", parameter):
+                raise ValueError(f"invalid request parameter {parameter}")
+        return request_parameters
+
+    @root_validator(skip_on_failure=True)
+    def _cache_validator(cls, values):
+        cache = values["cache"]
+        if cache and cache.enabled:
+            # API Gateway only accepts declared request parameters as cache keys
+            for parameter in cache.key_parameters:
+                values["request_parameters"].setdefault(parameter, False)
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def _queue_validator(cls, values):
+        if (values["integration_type"] == "AWS") != bool(values["queue"]):
+            raise ValueError(f"{values['name']}: AWS integrations are SQS queues and require queue settings")
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def _alias_validator(cls, values):
+        if values["provisioned_concurrency"] and not values["alias"]:
+            raise ValueError(f"{values['name']}: provisioned concurrency requires an alias")
+        return values
+
+    @property
+    def is_lambda(self) -> bool:
+        return self.integration_type == "AWS_PROXY"
+
+    @property
+    def invoke_arn(self) -> Any:
+        return (self.alias_ or self.lambda_).invoke_arn
 
     @validator("filename", always=True)
     def _filename_validator(cls, filename: Optional[str], values) -> str:
         if filename:
             return filename
-        return os.path.join(backend_src_path, values["name"], f"{values['name']}.zip")
+        # Function source directory, packaged by lambda_packaging at deploy time
+        return os.path.join(backend_src_path, values["name"])
 
 
 class APIResourceDescription(BaseModel):
@@ -46,88 +162,296 @@ class APIResourceDescription(BaseModel):
         return values["name"]
 
 
-addTodo = APIResourceFunction(
-    name="addTodo",
-    allowed_path="*/POST/item",
-    handler="app.addToDoItem",
-    environment={
-        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
-        "ENDPOINT_OVERRIDE": ""
-    }
-)
-getAllTodo = APIResourceFunction(
-    name="getAllTodo",
-    allowed_path="*/GET/item",
-    handler="app.getAllToDoItem",
-    environment={
-        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
-        "ENDPOINT_OVERRIDE": ""
-    }
-)
-completeTodo = APIResourceFunction(
-    name="completeTodo",
-    allowed_path="*/POST/item/*/done",
-    handler="app.completeToDoItem",
-    environment={
-        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
-        "ENDPOINT_OVERRIDE": ""
-    }
-)
-getTodo = APIResourceFunction(
-    name="getTodo",
-    allowed_path="*/GET/item/*",
-    handler="app.getToDoItem",
-    environment={
-        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
-        "USE_DYNAMODB_LOCAL": "0",
-        "DYNAMODB_LOCAL_URI": ""
+class LambdaSettings(BaseModel):
+    memory_size: Optional[int]
+    architecture: Optional[Literal["x86_64", "arm64"]]
+    ephemeral_storage: Optional[int]
+    reserved_concurrency: Optional[int]
+    provisioned_concurrency: Optional[int]
+    alias: Optional[str]
+
+
+def _apply_function_settings(api_function: APIResourceFunction, settings: Dict[str, Any]) -> None:
+    overrides = {
+        **LambdaSettings(**settings.get("default", {})).dict(exclude_unset=True),
+        **LambdaSettings(**settings.get(api_function.name, {})).dict(exclude_unset=True),
     }
-)
-updateTodo = APIResourceFunction(
-    name="updateTodo",
-    allowed_path="*/PUT/item/*",
-    handler="app.updateToDoItem",
-    environment={
-        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1"
+    updated = APIResourceFunction(**{**api_function.dict(), **overrides})
+    for field, value in overrides.items():
+        setattr(api_function, field, getattr(updated, field))
+
+
+def _apply_lambda_settings(resources: Dict[str, APIResourceDescription], settings: Dict[str, Any]) -> None:
+    """Apply the `lambdaSettings` config: a "default" entry for every function and entries by function name"""
+    for resource in resources.values():
+        for api_function in resource.methods.values():
+            if not api_function.is_lambda:
+                continue
+            _apply_function_settings(api_function, settings)
+
+
+def _validate_cache_invalidation(resources: Dict[str, APIResourceDescription]) -> None:
+    for path, resource in resources.items():
+        for method, api_function in resource.methods.items():
+            for invalidated_path in api_function.invalidates:
+                target = resources.get(invalidated_path)
+                get_function = target.methods.get("GET") if target else None
+                if not (get_function and get_function.cache and get_function.cache.enabled):
+                    raise ValueError(f"{method} {path} invalidates {invalidated_path}, which has no cached GET method")
+
+
+def cached_methods(resources: Dict[str, APIResourceDescription]) -> Dict[str, APIResourceFunction]:
+    """Cached GET methods by resource path"""
+    return {
+        path: resource.methods["GET"]
+        for path, resource in resources.items()
+        if "GET" in resource.methods and resource.methods["GET"].cache and resource.methods["GET"].cache.enabled
     }
-)
-deleteTodo = APIResourceFunction(
-    name="deleteTodo",
-    allowed_path="*/DELETE/item/*",
-    handler="app.deleteToDoItem",
-    environment={
-        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
-        "ENDPOINT_OVERRIDE": ""
+
+
+def router_routes(resources: Dict[str, APIResourceDescription]) -> List[Dict[str, str]]:
+    """Route table of the router function: every Lambda method of the API"""
+    return [
+        {
+            "method": method,
+            "path": path,
+            "handler": api_function.handler,
+            "source_dir": api_function.filename,
+        }
+        for path, resource in resources.items()
+        for method, api_function in resource.methods.items()
+        if api_function.is_lambda
+    ]
+
+
+def build_router_function(resources: Dict[str, APIResourceDescription], filename: str) -> APIResourceFunction:
+    """The single function that serves every route in the "router" Lambda deployment.
+
+    Its environment is the union of the route environments and its timeout the
+    longest route timeout. `lambdaSettings` apply under the name "router".
+    """
+    functions = [
+        api_function
+        for resource in resources.values()
+        for api_function in resource.methods.values()
+        if api_function.is_lambda
+    ]
+    environment: Dict[str, str] = {}
+    for api_function in functions:
+        for variable, value in api_function.environment.items():
+            if environment.setdefault(variable, value) != value:
+                raise ValueError(f"{api_function.name}: {variable} conflicts with the environment of another route")
+    router = APIResourceFunction(
+        name="router",
+        filename=filename,
+        handler="app.handler",
+        allowed_path="*/*/*",
+        description="Serves every route of the API",
+        timeout=max(api_function.timeout for api_function in functions),
+        environment=environment,
+    )
+    _apply_function_settings(router, config.get_object("lambdaSettings") or {})
+    return router
+
+
+def build_background_function(
+    name: str,
+    handler: str,
+    description: str,
+    timeout: int,
+    environment: Dict[str, str],
+) -> APIResourceFunction:
+    """Lambda that is not behind an API route, eg a queue or stream consumer. `lambdaSettings` apply under its name."""
+    function = APIResourceFunction(
+        name=name,
+        handler=handler,
+        allowed_path="",
+        description=description,
+        timeout=timeout,
+        environment=environment,
+    )
+    _apply_function_settings(function, config.get_object("lambdaSettings") or {})
+    return function
+
+
+def build_queue_consumer(api_function: APIResourceFunction) -> APIResourceFunction:
+    """Consumer Lambda of a queue integration"""
+    queue = api_function.queue
+    return build_background_function(
+        name=queue.consumer,
+        handler=queue.handler,
+        description=f"Drains the {api_function.name} queue",
+        timeout=queue.timeout,
+        environment=api_function.environment,
+    )
+
+
+def invalidated_paths(resources: Dict[str, APIResourceDescription]) -> set[str]:
+    return {
+        path
+        for resource in resources.values()
+        for api_function in resource.methods.values()
+        for path in api_function.invalidates
     }
-)
-
-mockItem = APIResourceFunction(
-    name="mockItem",
-    allowed_path="*/OPTIONS/item",
-    authorization="NONE",
-    integration_type="MOCK",
-    integration_method="OPTIONS"
-)
-
-mockItemId = APIResourceFunction(
-    name="mockItemId",
-    allowed_path="*/OPTIONS/item/*",
-    authorization="NONE",
-    integration_type="MOCK",
-    integration_method="OPTIONS"
-)
-
-mockItemDoneId = APIResourceFunction(
-    name="mockItemDoneId",
-    allowed_path="*/OPTIONS/item/*/done",
-    authorization="NONE",
-    integration_type="MOCK",
-    integration_method="OPTIONS"
-)
-
-
-try:
-    api_resources = OrderedDict(
+
+
+def _build_api_resources() -> Dict[str, APIResourceDescription]:
+    if write_ingestion == "queue":
+        # Queued variant of addTodo: the id of the item is returned at once (202), the item is written by addTodoConsumer
+        addTodo = APIResourceFunction(
+            name="addTodoQueue",
+            allowed_path="*/POST/item",
+            integration_type="AWS",
+            integration_method="POST",
+            queue=APIResourceQueue(consumer="addTodoConsumer", handler="app.addToDoItems"),
+            invalidates=["/item"],
+            environment={
+                "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+                "ENDPOINT_OVERRIDE": ""
+            }
+        )
+    else:
+        addTodo = APIResourceFunction(
+            name="addTodo",
+            allowed_path="*/POST/item",
+            handler="app.addToDoItem",
+            invalidates=["/item"],
+            environment={
+                "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+                "ENDPOINT_OVERRIDE": ""
+            }
+        )
+    getAllTodo = APIResourceFunction(
+        name="getAllTodo",
+        allowed_path="*/GET/item",
+        handler="app.getAllToDoItem",
+        request_parameters={
+            "method.request.querystring.limit": False,
+            "method.request.querystring.next": False,
+            "method.request.querystring.fields": False,
+            "method.request.querystring.open": False,
+            "method.request.querystring.archived": False,
+            "method.request.header.If-None-Match": False,
+        },
+        cache=APIResourceCache(
+            ttl=300,
+            key_parameters=[
+                AUTHORIZATION_CACHE_KEY,
+                "method.request.querystring.limit",
+                "method.request.querystring.next",
+                "method.request.querystring.fields",
+                "method.request.querystring.open",
+                "method.request.querystring.archived",
+            ],
+        ),
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "ENDPOINT_OVERRIDE": "",
+            "OPEN_ITEMS_INDEX": "openItemsByLastUpdate"  # see dynamodb/attributes.json
+        }
+    )
+    completeTodo = APIResourceFunction(
+        name="completeTodo",
+        allowed_path="*/POST/item/*/done",
+        handler="app.completeToDoItem",
+        invalidates=["/item"],
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "ENDPOINT_OVERRIDE": ""
+        }
+    )
+    getTodo = APIResourceFunction(
+        name="getTodo",
+        allowed_path="*/GET/item/*",
+        handler="app.getToDoItem",
+        # Not flushed by the writes, the frontend never reads single items: an entry is stale for up to ttl seconds
+        cache=APIResourceCache(
+            ttl=300,
+            key_parameters=[AUTHORIZATION_CACHE_KEY, "method.request.path.id"],
+        ),
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "USE_DYNAMODB_LOCAL": "0",
+            "DYNAMODB_LOCAL_URI": ""
+        }
+    )
+    updateTodo = APIResourceFunction(
+        name="updateTodo",
+        allowed_path="*/PUT/item/*",
+        handler="app.updateToDoItem",
+        invalidates=["/item"],
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1"
+        }
+    )
+    deleteTodo = APIResourceFunction(
+        name="deleteTodo",
+        allowed_path="*/DELETE/item/*",
+        handler="app.deleteToDoItem",
+        invalidates=["/item"],
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "ENDPOINT_OVERRIDE": ""
+        }
+    )
+    batchWriteTodo = APIResourceFunction(
+        name="batchWriteTodo",
+        allowed_path="*/POST/item/batch",
+        handler="app.batchWriteToDoItems",
+        description="Creates and deletes items with BatchWriteItem, completes them with conditional updates",
+        invalidates=["/item"],
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "ENDPOINT_OVERRIDE": ""
+        }
+    )
+    batchGetTodo = APIResourceFunction(
+        name="batchGetTodo",
+        allowed_path="*/GET/item/batch",
+        handler="app.batchGetToDoItems",
+        description="Gets items by id with BatchGetItem",
+        request_parameters={
+            "method.request.querystring.ids": True,
+        },
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "ENDPOINT_OVERRIDE": ""
+        }
+    )
+
+    mockItem = APIResourceFunction(
+        name="mockItem",
+        allowed_path="*/OPTIONS/item",
+        authorization="NONE",
+        integration_type="MOCK",
+        integration_method="OPTIONS"
+    )
+
+    mockItemId = APIResourceFunction(
+        name="mockItemId",
+        allowed_path="*/OPTIONS/item/*",
+        authorization="NONE",
+        integration_type="MOCK",
+        integration_method="OPTIONS"
+    )
+
+    mockItemBatch = APIResourceFunction(
+        name="mockItemBatch",
+        allowed_path="*/OPTIONS/item/batch",
+        authorization="NONE",
+        integration_type="MOCK",
+        integration_method="OPTIONS"
+    )
+
+    mockItemDoneId = APIResourceFunction(
+        name="mockItemDoneId",
+        allowed_path="*/OPTIONS/item/*/done",
+        authorization="NONE",
+        integration_type="MOCK",
+        integration_method="OPTIONS"
+    )
+
+    return OrderedDict(
         {
             "/item": APIResourceDescription(
                 name="item",
@@ -136,6 +460,13 @@ try:
                          "POST": addTodo,
                          "OPTIONS": mockItem}
             ),
+            # Static paths take precedence over /item/{id}
+            "/item/batch": APIResourceDescription(
+                name="itemBatch",
+                methods={"GET": batchGetTodo,
+                         "POST": batchWriteTodo,
+                         "OPTIONS": mockItemBatch}
+            ),
             "/item/{id}": APIResourceDescription(
                 name="itemId",
                 methods={"GET": getTodo,
@@ -150,6 +481,18 @@ try:
             ),
         }
     )
-except ValidationError as err:
-    print(err)
-    sys.exit(1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_api_resources() -> Dict[str, APIResourceDescription]:
+    """The routes of the API by path, built and validated on first use"""
+    try:
+        api_resources = _build_api_resources()
+        if write_ingestion == "queue" and config.get("apiGatewayType") == "http":
+            raise ValueError("writeIngestion: queue requires the REST API (apiGatewayType: rest)")
+        _validate_cache_invalidation(api_resources)
+        _apply_lambda_settings(api_resources, config.get_object("lambdaSettings") or {})
+    except (ValidationError, ValueError) as err:
+        print(err)
+        sys.exit(1)
+    return api_resources
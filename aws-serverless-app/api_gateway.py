@@ -1,22 +1,42 @@
+from __future__ import annotations
 import hashlib
-import json
-from typing import Dict, Tuple, List, Any, Optional
+import os
+import sys
+from typing import Dict, Tuple, List, Any, Optional, Union
 import pulumi
 import pulumi_aws as aws
-from lambda_functions import create_lambda_function
+from pydantic import ValidationError
+from lambda_functions import create_lambda_function, create_lambda_alias, build_lambda_archives, assemble_router_package
 from cognito import create_cognito_authorizer
-from api import api_resources, APIResourceDescription, APIResourceFunction
+from api import (get_api_resources, APIResourceDescription, APIResourceFunction, cors_headers, backend_src_path,
+                 AUTHORIZATION_CACHE_KEY, cached_methods, invalidated_paths, router_routes, build_router_function,
+                 build_queue_consumer)
+from queues import (create_ingestion_queue, create_queue_consume_policy, create_queue_send_role,
+                    create_queue_event_source, queue_integration_uri, SQS_CONTENT_TYPE, SEND_MESSAGE_TEMPLATE,
+                    QUEUED_STATUS_CODE, QUEUED_RESPONSE_TEMPLATE, QUEUE_ERROR_STATUS_CODE, QUEUE_ERROR_PATTERN,
+                    QUEUE_ERROR_TEMPLATE)
+from openapi import build_openapi_spec
+from tracing import tracing_settings, create_sampling_rules
+from regions import regional_name, regional_opts
+from app_config import config
 
 
 _integrations: List[pulumi.CustomResource] = []
 _integration_responses: List[pulumi.CustomResource] = []
 _resources: Dict[str, aws.apigateway.Resource] = {}
+_functions: List[APIResourceFunction] = []
 project_name = pulumi.get_project()
+# "resources" declares every Resource/Method/Integration separately,
+# "openapi" compiles the API routes into a single RestApi body
+api_definition = config.get("apiDefinition") or "resources"
+api_cache_cluster_size = config.get("apiCacheClusterSize") or "0.5"
+# "per-route" deploys a Lambda per API method, "router" deploys every handler
+# behind one function (backend-src/router) that dispatches on method and path
+lambda_deployment = config.get("lambdaDeployment") or "per-route"
 
 
 def _create_lambda_resource(
     api_function: APIResourceFunction,
-    rest_api: aws.apigateway.RestApi,
     lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
     environment: Optional[Dict[str, str]] = None,
 ) -> aws.lambda_.Function:
@@ -35,20 +55,152 @@ def _create_lambda_resource(
         timeout=api_function.timeout,
         lambda_policies=lambda_policies,
         environment=_environment,
+        memory_size=api_function.memory_size,
+        architecture=api_function.architecture,
+        ephemeral_storage=api_function.ephemeral_storage,
+        reserved_concurrency=api_function.reserved_concurrency,
+        publish=bool(api_function.alias),
+        policy_filenames=api_function.policy_filenames,
+        dedicated_role=api_function.dedicated_role,
     )
+    if api_function.alias:
+        api_function.alias_ = create_lambda_alias(
+            lambda_,
+            name=api_function.name,
+            alias_name=api_function.alias,
+            provisioned_concurrency=api_function.provisioned_concurrency,
+        )
+    _functions.append(api_function)
+    return lambda_
 
+
+def _create_lambda_permission(
+    api_function: APIResourceFunction,
+    rest_api: Union[aws.apigateway.RestApi, aws.apigatewayv2.Api],
+) -> aws.lambda_.Permission:
     lambda_permission = aws.lambda_.Permission(
-        f"{api_function.name}LambdaPermission",
+        regional_name(f"{api_function.name}LambdaPermission"),
         action="lambda:InvokeFunction",
-        function=lambda_.name,
+        function=api_function.lambda_.name,
+        qualifier=api_function.alias_.name if api_function.alias_ else None,
         principal="apigateway.amazonaws.com",
         source_arn=rest_api.execution_arn.apply(
             lambda execution_arn: f"{execution_arn}/{api_function.allowed_path}"
         ),
         opts=pulumi.ResourceOptions(parent=rest_api),
     )
+    return lambda_permission
 
-    return lambda_
+
+def _create_router_resources(
+    router_function: APIResourceFunction,
+    lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
+    lambda_environment: Optional[Dict[str, str]] = None,
+) -> List[APIResourceFunction]:
+    router_function.lambda_ = _create_lambda_resource(
+        router_function,
+        lambda_policies=lambda_policies,
+        environment=lambda_environment,
+    )
+    # Every method integrates with the router, permissions stay per method
+    for api_resource_description in get_api_resources().values():
+        for api_function in api_resource_description.methods.values():
+            if api_function.is_lambda:
+                api_function.lambda_ = router_function.lambda_
+                api_function.alias_ = router_function.alias_
+    return [router_function]
+
+
+def _create_lambda_resources(
+    lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
+    lambda_environment: Optional[Dict[str, str]] = None,
+) -> List[APIResourceFunction]:
+    functions = []
+    for api_resource_description in get_api_resources().values():
+        for api_function in api_resource_description.methods.values():
+            if api_function.is_lambda:
+                api_function.lambda_ = _create_lambda_resource(
+                    api_function,
+                    lambda_policies=lambda_policies,
+                    environment=lambda_environment,
+                )
+                functions.append(api_function)
+    return functions
+
+
+def _create_queue_resources(
+    api_function: APIResourceFunction,
+    lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
+    lambda_environment: Optional[Dict[str, str]] = None,
+) -> None:
+    queue_settings = api_function.queue
+    queue, dead_letter_queue = create_ingestion_queue(api_function.name, queue_settings)
+
+    # Consumer Lambda, fed by the queue in batches
+    consumer = build_queue_consumer(api_function)
+    consumer.lambda_ = _create_lambda_resource(
+        consumer,
+        lambda_policies=[*lambda_policies, create_queue_consume_policy(consumer.name, queue)],
+        environment=lambda_environment,
+    )
+    create_queue_event_source(consumer.name, queue, (consumer.alias_ or consumer.lambda_).arn, queue_settings)
+
+    queue_settings.queue_ = queue
+    queue_settings.dead_letter_queue_ = dead_letter_queue
+    queue_settings.credentials_ = create_queue_send_role(api_function.name, queue).arn
+
+
+def create_api_lambdas(
+    lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
+    lambda_environment: Optional[Dict[str, str]] = None,
+) -> List[APIResourceFunction]:
+    """Package and declare the Lambdas of the API routes, per route or one router (`lambdaDeployment`).
+
+    Sets `lambda_`/`alias_` of every Lambda method and returns the deployed functions.
+    The queues of AWS (SQS) integrations are created with their consumer Lambdas.
+    """
+    # The functions of the API declared last, one API per region
+    _functions.clear()
+    api_resources = get_api_resources()
+    for api_resource_description in api_resources.values():
+        for api_function in api_resource_description.methods.values():
+            if api_function.queue:
+                _create_queue_resources(api_function, lambda_policies, lambda_environment)
+
+    if lambda_deployment == "router":
+        # AWS Lambda, one for the whole API
+        router_source = assemble_router_package(
+            router_routes(api_resources), router_dir=os.path.join(backend_src_path, "router")
+        )
+        try:
+            router_function = build_router_function(api_resources, filename=router_source)
+        except (ValidationError, ValueError) as err:
+            print(err)
+            sys.exit(1)
+        return _create_router_resources(router_function, lambda_policies=lambda_policies, lambda_environment=lambda_environment)
+
+    # Package every changed Lambda in parallel before the functions are declared
+    build_lambda_archives(sorted({
+        api_function.filename
+        for resource in api_resources.values()
+        for api_function in resource.methods.values()
+        if api_function.is_lambda and os.path.isdir(api_function.filename)
+    }))
+
+    # AWS Lambdas
+    return _create_lambda_resources(lambda_policies=lambda_policies, lambda_environment=lambda_environment)
+
+
+def deployed_functions() -> List[APIResourceFunction]:
+    """Every Lambda declared for the last API: one per route or the router, and the queue consumers"""
+    return list(_functions)
+
+
+def create_lambda_permissions(api: Union[aws.apigateway.RestApi, aws.apigatewayv2.Api]) -> None:
+    for api_resource_description in get_api_resources().values():
+        for api_function in api_resource_description.methods.values():
+            if api_function.is_lambda:
+                _create_lambda_permission(api_function, api)
 
 
 def _create_integration_response(
@@ -59,30 +211,22 @@ def _create_integration_response(
     http_method: str,
 ):
     response200 = aws.apigateway.MethodResponse(
-        f"{name}Response200",
+        regional_name(f"{name}Response200"),
         rest_api=rest_api.id,
         resource_id=api_resource.id,
         http_method=http_method,
         status_code="200",
-        response_parameters={
-            "method.response.header.Access-Control-Allow-Origin": True,
-            "method.response.header.Access-Control-Allow-Methods": True,
-            "method.response.header.Access-Control-Allow-Headers": True,
-        },
+        response_parameters={f"method.response.header.{header}": True for header in cors_headers},
         opts=pulumi.ResourceOptions(parent=api_integration, depends_on=api_integration)
     )
     integration_response = aws.apigateway.IntegrationResponse(
-        f"{name}IntegrationResponse",
+        regional_name(f"{name}IntegrationResponse"),
         rest_api=rest_api.id,
         resource_id=api_resource.id,
         http_method=http_method,
         status_code=response200.status_code,
         response_templates={"application/json": "{}\n"},
-        response_parameters={
-            "method.response.header.Access-Control-Allow-Origin": "'*'",
-            "method.response.header.Access-Control-Allow-Methods": "'OPTIONS,HEAD,GET,PUT,POST,DELETE'",
-            "method.response.header.Access-Control-Allow-Headers": "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
-        },
+        response_parameters={f"method.response.header.{header}": value for header, value in cors_headers.items()},
         opts=pulumi.ResourceOptions(
             parent=api_integration, depends_on=[api_integration, response200]
         ),
@@ -90,31 +234,56 @@ def _create_integration_response(
     return integration_response
 
 
+def _create_queue_integration_responses(
+    name: str,
+    rest_api: aws.apigateway.RestApi,
+    api_resource: aws.apigateway.Resource,
+    api_integration: aws.apigateway.Integration,
+    http_method: str,
+) -> None:
+    # 202 with the id of the queued item, 500 when SQS refused the message
+    cors_origin = "Access-Control-Allow-Origin"
+    for status_code, selection_pattern, template in (
+        (QUEUED_STATUS_CODE, None, QUEUED_RESPONSE_TEMPLATE),
+        (QUEUE_ERROR_STATUS_CODE, QUEUE_ERROR_PATTERN, QUEUE_ERROR_TEMPLATE),
+    ):
+        method_response = aws.apigateway.MethodResponse(
+            regional_name(f"{name}Response{status_code}"),
+            rest_api=rest_api.id,
+            resource_id=api_resource.id,
+            http_method=http_method,
+            status_code=status_code,
+            response_parameters={f"method.response.header.{cors_origin}": True},
+            opts=pulumi.ResourceOptions(parent=api_integration, depends_on=api_integration)
+        )
+        aws.apigateway.IntegrationResponse(
+            regional_name(f"{name}IntegrationResponse{status_code}"),
+            rest_api=rest_api.id,
+            resource_id=api_resource.id,
+            http_method=http_method,
+            status_code=method_response.status_code,
+            selection_pattern=selection_pattern,
+            response_templates={"application/json": template},
+            response_parameters={f"method.response.header.{cors_origin}": cors_headers[cors_origin]},
+            opts=pulumi.ResourceOptions(
+                parent=api_integration, depends_on=[api_integration, method_response]
+            ),
+        )
+
+
 def _create_api_resource(
     rest_api: aws.apigateway.RestApi,
     path: str,
     api_resource_description: APIResourceDescription,
     authorizer: aws.apigateway.Authorizer,
-    lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
-    lambda_environment: Optional[Dict[str, str]] = None,
+    request_validator: aws.apigateway.RequestValidator,
 ):
     path_part = path.split("/")[-1]
 
-    for method, api_function in api_resource_description.methods.items():
-        # Create Lambda
-        if api_function.integration_type != "MOCK":
-            lambda_ = _create_lambda_resource(
-                api_function,
-                rest_api,
-                lambda_policies=lambda_policies,
-                environment=lambda_environment,
-            )
-            api_resource_description.methods[method].lambda_ = lambda_
-
     # API GW Resource
     if api_resource_description.is_root:
         api_resource = aws.apigateway.Resource(
-            api_resource_description.name,
+            regional_name(api_resource_description.name),
             parent_id=rest_api.root_resource_id,
             path_part=path_part,
             rest_api=rest_api.id,
@@ -124,7 +293,7 @@ def _create_api_resource(
     else:
         parent_path = "/".join(path.split("/")[:-1])
         api_resource = aws.apigateway.Resource(
-            api_resource_description.name,
+            regional_name(api_resource_description.name),
             parent_id=_resources[parent_path].id,
             path_part=path_part,
             rest_api=rest_api.id,
@@ -141,33 +310,48 @@ def _create_api_resource(
 
         # API GW Method
         method = aws.apigateway.Method(
-            f"{api_resource_description.name}{api_resource_method}",
+            regional_name(f"{api_resource_description.name}{api_resource_method}"),
             http_method=api_resource_method,
             resource_id=api_resource.id,
             rest_api=rest_api.id,
             authorization=api_function.authorization,
             authorizer_id=authorizer.id,
+            request_parameters=api_function.request_parameters or None,
+            request_validator_id=request_validator.id if api_function.request_parameters else None,
             opts=pulumi.ResourceOptions(parent=api_resource, depends_on=[authorizer]),
         )
 
         # API GW Integration
+        credentials = None
+        integration_request_parameters = None
+        passthrough_behavior = None
         if api_function.integration_type == "MOCK":
             integration_uri = None
             request_templates = {"application/json": '{\n  "statusCode" : 200\n}\n'}
+        elif api_function.queue:
+            integration_uri = queue_integration_uri(api_function.queue.queue_)
+            credentials = api_function.queue.credentials_
+            request_templates = {"application/json": SEND_MESSAGE_TEMPLATE}
+            integration_request_parameters = {"integration.request.header.Content-Type": SQS_CONTENT_TYPE}
+            passthrough_behavior = "NEVER"
         else:
-            integration_uri = api_resource_description.methods[api_resource_method].lambda_.invoke_arn
+            integration_uri = api_function.invoke_arn
             request_templates = None
 
         integration = aws.apigateway.Integration(
-            f"{api_resource_description.name}{api_resource_method}Integration",
+            regional_name(f"{api_resource_description.name}{api_resource_method}Integration"),
             rest_api=rest_api.id,
             resource_id=api_resource.id,
             http_method=method.http_method,
             integration_http_method=api_function.integration_method,  # For Lambda it is always POST
             # passthrough_behavior="WHEN_NO_TEMPLATES",
+            passthrough_behavior=passthrough_behavior,
             request_templates=request_templates,
+            request_parameters=integration_request_parameters,
+            credentials=credentials,
             type=api_function.integration_type,
             uri=integration_uri,
+            cache_key_parameters=api_function.cache.key_parameters if api_function.cache and api_function.cache.enabled else None,
             opts=pulumi.ResourceOptions(parent=api_resource),
         )
 
@@ -179,57 +363,163 @@ def _create_api_resource(
                 api_integration=integration,
                 http_method=api_resource_method,
             )
+        elif api_function.queue:
+            _create_queue_integration_responses(
+                name=f"{api_resource_description.name}{api_resource_method}Queue",
+                rest_api=rest_api,
+                api_resource=api_resource,
+                api_integration=integration,
+                http_method=api_resource_method,
+            )
         _integrations.append(integration)
 
 
+def _create_cache_method_settings(
+    name: str,
+    rest_api: aws.apigateway.RestApi,
+    stage: aws.apigateway.Stage,
+    methods: Dict[str, APIResourceFunction],
+) -> None:
+    # Caching is opt-in per method, everything else goes to the backend
+    default_settings = aws.apigateway.MethodSettings(
+        regional_name(f"{name}CacheDefault"),
+        rest_api=rest_api.id,
+        stage_name=stage.stage_name,
+        method_path="*/*",
+        settings=aws.apigateway.MethodSettingsSettingsArgs(caching_enabled=False),
+        opts=pulumi.ResourceOptions(parent=stage),
+    )
+
+    _invalidated_paths = invalidated_paths(get_api_resources())
+    for path, api_function in methods.items():
+        # Clients may flush their own entries (Cache-Control: max-age=0) after a write
+        # as long as entries are keyed by the Authorization header
+        client_invalidation = path in _invalidated_paths and AUTHORIZATION_CACHE_KEY in api_function.cache.key_parameters
+        aws.apigateway.MethodSettings(
+            regional_name(f"{name}{api_function.name}Cache"),
+            rest_api=rest_api.id,
+            stage_name=stage.stage_name,
+            method_path=f"{path.lstrip('/')}/GET",
+            settings=aws.apigateway.MethodSettingsSettingsArgs(
+                caching_enabled=True,
+                cache_ttl_in_seconds=api_function.cache.ttl,
+                require_authorization_for_cache_control=not client_invalidation,
+                unauthorized_cache_control_header_strategy="SUCCEED_WITHOUT_RESPONSE_HEADER",
+            ),
+            # Stage updates conflict when they run concurrently
+            opts=pulumi.ResourceOptions(parent=stage, depends_on=[default_settings]),
+        )
+
+
 def create_api_gateway(
-    redirect_url: pulumi.Output[str],
+    user_pool: aws.cognito.UserPool,
+    user_pool_client: aws.cognito.UserPoolClient,
     lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
     lambda_environment: Optional[Dict[str, str]] = None,
     dynamodb_table: Optional[str] = None
 ) -> Tuple[pulumi.Output[str]]:
-    # API Gateway
     rest_api_name = "workshopServerlessJukeBox"
-    rest_api = aws.apigateway.RestApi(rest_api_name)
+    _resources.clear()
+    _integrations.clear()
 
-    # API GW Cognito authorizer
-    cognito_authorizer = create_cognito_authorizer(
-        rest_api=rest_api, redirect_url=redirect_url
+    lambda_environment = {"TABLE_NAME": dynamodb_table, **(lambda_environment or {})}
+
+    # AWS Lambdas
+    create_api_lambdas(lambda_policies=lambda_policies, lambda_environment=lambda_environment)
+
+    # The whole API as one OpenAPI document. It is the RestApi body in "openapi" mode
+    # and the redeployment trigger in both modes.
+    openapi_spec = build_openapi_spec(
+        title=rest_api_name, resources=get_api_resources(), user_pool_arn=user_pool.arn
     )
 
-    lambda_environment = {"TABLE_NAME": dynamodb_table}
-
-    # API Resources
-    for resource_path, resource in api_resources.items():
-        _create_api_resource(
-            rest_api=rest_api,
-            path=resource_path,
-            api_resource_description=resource,
-            authorizer=cognito_authorizer,
-            lambda_policies=lambda_policies,
-            lambda_environment=lambda_environment,
+    if api_definition == "openapi":
+        # API Gateway
+        rest_api = aws.apigateway.RestApi(regional_name(rest_api_name), body=openapi_spec, opts=regional_opts())
+        deployment_dependencies = [rest_api]
+    else:
+        # API Gateway
+        rest_api = aws.apigateway.RestApi(regional_name(rest_api_name), opts=regional_opts())
+
+        # API GW Cognito authorizer
+        cognito_authorizer = create_cognito_authorizer(rest_api=rest_api, user_pool=user_pool)
+
+        # Validates the declared request parameters of the methods
+        request_validator = aws.apigateway.RequestValidator(
+            regional_name(f"{rest_api_name}ParamsValidator"),
+            rest_api=rest_api.id,
+            name="params",
+            validate_request_parameters=True,
+            validate_request_body=False,
+            opts=pulumi.ResourceOptions(parent=rest_api),
         )
 
+        # API Resources
+        for resource_path, resource in get_api_resources().items():
+            _create_api_resource(
+                rest_api=rest_api,
+                path=resource_path,
+                api_resource_description=resource,
+                authorizer=cognito_authorizer,
+                request_validator=request_validator,
+            )
+        deployment_dependencies = [*_resources.values(), *_integrations]
+
+    create_lambda_permissions(rest_api)
+
     # API GW Deployment
     deployment = aws.apigateway.Deployment(
-        f"{rest_api_name}Deployment",
+        regional_name(f"{rest_api_name}Deployment"),
         rest_api=rest_api.id,
         triggers={
-            "redeployment": rest_api.body.apply(lambda body: json.dumps(body)).apply(
-                lambda to_json: hashlib.sha1(to_json.encode()).hexdigest()
+            "redeployment": openapi_spec.apply(
+                lambda spec: hashlib.sha1(spec.encode()).hexdigest()
             ),
         },
         opts=pulumi.ResourceOptions(
-            depends_on=[*_resources.values(), *_integrations], parent=rest_api
+            depends_on=deployment_dependencies, parent=rest_api
         ),
     )
     # API GW Stage
+    _cached_methods = cached_methods(get_api_resources())
     stage = aws.apigateway.Stage(
-        f"{rest_api_name}Stage",
+        regional_name(f"{rest_api_name}Stage"),
         deployment=deployment.id,
         rest_api=rest_api.id,
         stage_name=pulumi.Config().get("stageName"),
+        cache_cluster_enabled=bool(_cached_methods),
+        cache_cluster_size=api_cache_cluster_size if _cached_methods else None,
+        xray_tracing_enabled=tracing_settings.enabled,
         opts=pulumi.ResourceOptions(parent=rest_api),
     )
+    if _cached_methods:
+        _create_cache_method_settings(f"{rest_api_name}Stage", rest_api, stage, _cached_methods)
+    if tracing_settings.enabled:
+        create_sampling_rules(rest_api, stage, tracing_settings)
 
     return rest_api.id, stage.stage_name, stage.invoke_url
+
+
+def create_api_domain(
+    domain_name: str,
+    certificate_arn: str,
+    api_id: pulumi.Input[str],
+    stage_name: pulumi.Input[str],
+) -> Tuple[pulumi.Output[str], pulumi.Output[str]]:
+    """Regional custom domain of the API stage, returns the target name and hosted zone of its DNS records"""
+    domain = aws.apigateway.DomainName(
+        regional_name("workshopServerlessJukeBoxDomain"),
+        domain_name=domain_name,
+        regional_certificate_arn=certificate_arn,
+        endpoint_configuration=aws.apigateway.DomainNameEndpointConfigurationArgs(types="REGIONAL"),
+        security_policy="TLS_1_2",
+        opts=regional_opts(),
+    )
+    aws.apigateway.BasePathMapping(
+        regional_name("workshopServerlessJukeBoxBasePathMapping"),
+        rest_api=api_id,
+        stage_name=stage_name,
+        domain_name=domain.domain_name,
+        opts=pulumi.ResourceOptions(parent=domain),
+    )
+    return domain.regional_domain_name, domain.regional_zone_id
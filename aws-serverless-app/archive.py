@@ -0,0 +1,203 @@
+"""Expiry and archival of completed items.
+
+Completing an item sets its TTL attribute, and DynamoDB deletes it `ttl_days`
+later, so completed items do not pile up in the user partitions that every
+`GET /item` queries. With `archive`, the TTL deletions are read from the table
+stream by the archiveTodo Lambda and written to S3 as gzip JSON Lines, one
+object per user and stream batch:
+
+    archived/<username>/<yyyy>/<mm>/<dd>/<first sequence>-<last sequence>.jsonl.gz
+
+`GET /item?archived=true` reads them back.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from typing import Optional
+import pulumi
+import pulumi_aws as aws
+from pydantic import BaseModel, ValidationError, validator
+from app_config import config
+from api import build_background_function
+from lambda_functions import create_lambda_function
+
+
+project_name = pulumi.get_project()
+# Epoch seconds, see the completeTodo, updateTodo and batchWriteTodo handlers
+TTL_ATTRIBUTE = "expires_at"
+ARCHIVE_PREFIX = "archived/"
+
+
+class CompletedItemsSettings(BaseModel):
+    ttl_days: int  # days a completed item stays in the table
+    archive: bool = True  # archive the expired items to S3
+    archive_batch_size: int = 1000  # stream records per archiver invocation
+    archive_batching_window: int = 300  # seconds the event source waits to fill a batch
+    # days before archived objects move to S3 Glacier Instant Retrieval
+    archive_transition_days: Optional[int]
+
+    @validator("ttl_days")
+    def _ttl_days_validator(cls, ttl_days: int) -> int:
+        if ttl_days < 1:
+            raise ValueError("ttl_days must be at least 1")
+        return ttl_days
+
+    @validator("archive_batch_size")
+    def _batch_size_validator(cls, batch_size: int) -> int:
+        if not 1 <= batch_size <= 10000:
+            raise ValueError("stream batch size must be between 1 and 10000")
+        return batch_size
+
+    @validator("archive_batching_window")
+    def _batching_window_validator(cls, batching_window: int) -> int:
+        if not 0 <= batching_window <= 300:
+            raise ValueError("stream batching window must be between 0 and 300 seconds")
+        return batching_window
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self.ttl_days * 86400
+
+
+def get_completed_items_settings() -> Optional[CompletedItemsSettings]:
+    """`completedItems` stack config, None keeps completed items forever"""
+    settings = config.get_object("completedItems")
+    if not settings:
+        return None
+    try:
+        return CompletedItemsSettings(**settings)
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
+
+
+def create_archive_bucket(settings: CompletedItemsSettings) -> aws.s3.Bucket:
+    transitions = []
+    if settings.archive_transition_days:
+        transitions.append(aws.s3.BucketLifecycleRuleTransitionArgs(
+            days=settings.archive_transition_days,
+            storage_class="GLACIER_IR",
+        ))
+    bucket = aws.s3.Bucket(
+        f"{project_name}ArchiveBucket",
+        lifecycle_rules=[
+            aws.s3.BucketLifecycleRuleArgs(
+                enabled=True,
+                prefix=ARCHIVE_PREFIX,
+                transitions=transitions,
+                abort_incomplete_multipart_upload_days=1,
+            )
+        ],
+    )
+    # Archived items are only read through the API
+    aws.s3.BucketPublicAccessBlock(
+        f"{project_name}ArchivePublicAccessBlock",
+        bucket=bucket.bucket,
+        block_public_acls=True,
+        block_public_policy=True,
+        ignore_public_acls=True,
+        restrict_public_buckets=True,
+        opts=pulumi.ResourceOptions(parent=bucket),
+    )
+    return bucket
+
+
+def create_archive_read_policy(name: str, bucket: aws.s3.Bucket) -> aws.iam.RoleInlinePolicyArgs:
+    policy = pulumi.Output.json_dumps({
+        "Statement": [
+            {
+                "Action": ["s3:ListBucket"],
+                "Resource": [bucket.arn],
+                "Condition": {"StringLike": {"s3:prefix": [f"{ARCHIVE_PREFIX}*"]}},
+                "Effect": "Allow"
+            },
+            {
+                "Action": ["s3:GetObject"],
+                "Resource": [pulumi.Output.concat(bucket.arn, "/", ARCHIVE_PREFIX, "*")],
+                "Effect": "Allow"
+            }
+        ]})
+    return aws.iam.RoleInlinePolicyArgs(name=name, policy=policy)
+
+
+def _create_archiver_policy(name: str, table: aws.dynamodb.Table, bucket: aws.s3.Bucket) -> aws.iam.RoleInlinePolicyArgs:
+    policy = pulumi.Output.json_dumps({
+        "Statement": [
+            {
+                "Action": [
+                    "dynamodb:DescribeStream",
+                    "dynamodb:GetRecords",
+                    "dynamodb:GetShardIterator",
+                    "dynamodb:ListStreams",
+                ],
+                "Resource": [table.stream_arn],
+                "Effect": "Allow"
+            },
+            {
+                "Action": ["s3:PutObject"],
+                "Resource": [pulumi.Output.concat(bucket.arn, "/", ARCHIVE_PREFIX, "*")],
+                "Effect": "Allow"
+            }
+        ]})
+    return aws.iam.RoleInlinePolicyArgs(name=name, policy=policy)
+
+
+def create_archiver(
+    table: aws.dynamodb.Table,
+    bucket: aws.s3.Bucket,
+    settings: CompletedItemsSettings,
+) -> aws.lambda_.Function:
+    """archiveTodo Lambda, fed with the TTL deletions of the table stream"""
+    archiver = build_background_function(
+        name="archiveTodo",
+        handler="app.archiveToDoItems",
+        description="Archives the expired completed items to S3",
+        timeout=60,
+        environment={
+            "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+            "ARCHIVE_PREFIX": ARCHIVE_PREFIX,
+        },
+    )
+    func = create_lambda_function(
+        name=archiver.name,
+        filename=archiver.filename,
+        runtime=archiver.runtime,
+        handler=archiver.handler,
+        description=archiver.description,
+        timeout=archiver.timeout,
+        lambda_policies=[_create_archiver_policy(f"{archiver.name}Policy", table, bucket)],
+        environment={**archiver.environment, "ARCHIVE_BUCKET": bucket.bucket},
+        memory_size=archiver.memory_size,
+        architecture=archiver.architecture,
+        ephemeral_storage=archiver.ephemeral_storage,
+        reserved_concurrency=archiver.reserved_concurrency,
+    )
+
+    aws.lambda_.EventSourceMapping(
+        f"{archiver.name}EventSource",
+        event_source_arn=table.stream_arn,
+        function_name=func.arn,
+        starting_position="TRIM_HORIZON",
+        batch_size=settings.archive_batch_size,
+        maximum_batching_window_in_seconds=settings.archive_batching_window,
+        # Only the deletions made by TTL, not the ones of deleteTodo
+        filter_criteria=aws.lambda_.EventSourceMappingFilterCriteriaArgs(
+            filters=[aws.lambda_.EventSourceMappingFilterCriteriaFilterArgs(
+                pattern=json.dumps({
+                    "eventName": ["REMOVE"],
+                    "userIdentity": {
+                        "type": ["Service"],
+                        "principalId": ["dynamodb.amazonaws.com"],
+                    },
+                }),
+            )],
+        ),
+        # A failed batch is retried from the first record the archiver reports
+        function_response_types=["ReportBatchItemFailures"],
+        bisect_batch_on_function_error=True,
+        maximum_retry_attempts=10,
+        opts=pulumi.ResourceOptions(parent=func),
+    )
+    return func
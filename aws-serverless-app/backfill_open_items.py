@@ -0,0 +1,90 @@
+"""Backfill of the sparse open items index (openItemsByLastUpdate).
+
+The handlers write `open_lastupdate_date` on open items only, so the items
+written before the index existed are not in it and `GET /item?open=true`
+misses them. This scan sets it, from `lastupdate_date`, on every open item
+that lacks it; run it once after the deployment that creates the index:
+
+    python backfill_open_items.py --table todo-api --profile my-profile
+    python backfill_open_items.py --table todo-api --dry-run
+
+Every update is conditional, an item that was completed, deleted or already
+indexed since the scan read it is left as it is. Running it again is a no-op.
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+HASH_KEY = "cognito-username"
+RANGE_KEY = "id"
+SPARSE_ATTRIBUTE = "open_lastupdate_date"
+SOURCE_ATTRIBUTE = "lastupdate_date"
+
+# Open items that are not in the index yet
+_MISSING = (
+    f"attribute_not_exists({SPARSE_ATTRIBUTE}) AND attribute_exists({SOURCE_ATTRIBUTE})"
+    " AND (attribute_not_exists(#completed) OR #completed <> :completed)"
+)
+
+
+def missing_items(dynamodb, table_name: str, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Keys of the open items without the sparse attribute"""
+    paginator = dynamodb.get_paginator("scan")
+    for page in paginator.paginate(
+        TableName=table_name,
+        ProjectionExpression="#hash, #range",
+        FilterExpression=_MISSING,
+        ExpressionAttributeNames={"#hash": HASH_KEY, "#range": RANGE_KEY, "#completed": "completed"},
+        ExpressionAttributeValues={":completed": {"BOOL": True}},
+        PaginationConfig={"PageSize": page_size},
+    ):
+        yield from page["Items"]
+
+
+def backfill(dynamodb, table_name: str, dry_run: bool = False) -> Dict[str, int]:
+    report = {"found": 0, "updated": 0, "skipped": 0}
+    for key in missing_items(dynamodb, table_name):
+        report["found"] += 1
+        if dry_run:
+            continue
+        try:
+            dynamodb.update_item(
+                TableName=table_name,
+                Key=key,
+                UpdateExpression=f"SET {SPARSE_ATTRIBUTE} = {SOURCE_ATTRIBUTE}",
+                ConditionExpression=f"attribute_exists(#range) AND {_MISSING}",
+                ExpressionAttributeNames={"#range": RANGE_KEY, "#completed": "completed"},
+                ExpressionAttributeValues={":completed": {"BOOL": True}},
+            )
+            report["updated"] += 1
+        except ClientError as err:
+            # changed since the scan
+            if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            report["skipped"] += 1
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill the open items index of the todo table")
+    parser.add_argument("--table", required=True, help="todo table name (tableName of the stack config)")
+    parser.add_argument("--profile", help="AWS profile")
+    parser.add_argument("--region", help="AWS region")
+    parser.add_argument("--endpoint-url", help="DynamoDB endpoint, eg a local stand-in")
+    parser.add_argument("--dry-run", action="store_true", help="count the items without updating them")
+    args = parser.parse_args(argv)
+
+    session = boto3.Session(profile_name=args.profile, region_name=args.region)
+    dynamodb = session.client("dynamodb", endpoint_url=args.endpoint_url)
+    print(json.dumps(backfill(dynamodb, args.table, dry_run=args.dry_run), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,21 +2,8 @@
 
 set -eu
 
-BACKEND_DIR="backend-src"
-
-cd ..
-pushd $BACKEND_DIR
-
-MODULES=$( find . -type d -d 1 )
-for module in $MODULES; do
-  echo "=> $( pwd )"
-  echo "Building $module"
-  pushd "$module"
-  [ ! -r "package.json" ] && popd && continue
-  [ -r "${module}.zip" ] && rm "${module}.zip"
-  npm install && zip -q -r $module.zip .
-  echo "Done"
-  echo
-  popd
-done
+BACKEND_DIR="../backend-src"
 
+# Builds reproducible archives into the local build cache (see lambda_packaging.py).
+# Only functions whose sources or lockfile have changed are rebuilt, in parallel.
+python lambda_packaging.py --backend "$BACKEND_DIR" --cache "${LAMBDA_BUILD_CACHE:-.lambda-build}"
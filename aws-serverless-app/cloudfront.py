@@ -1,14 +1,47 @@
-from typing import List
+from __future__ import annotations
+import os
+import sys
+from typing import List, Dict, Any
 import pulumi
 import pulumi_aws as aws
-import pulumi_synced_folder as synced_folder
+from pydantic import BaseModel, ValidationError
 from app_config import config
+from frontend_assets import FrontendAssets, RUNTIME_CONFIG_KEY, UNHASHED_CACHE_CONTROL
 
 
 project_name = pulumi.get_project()
 frontend_src_path = config.require("frontendSRCPath")
 index_document = config.get("indexDocument") or "index.html"
 error_document = config.get("errorDocument") or "error.html"
+# CRA puts the content-hashed bundles under static/
+assets_path_pattern = config.get("assetsPathPattern") or "static/*"
+# Resources public-read objects of the frontend bucket depend on
+_bucket_access: List[pulumi.Resource] = []
+
+
+class CDNCachePolicy(BaseModel):
+    min_ttl: int
+    default_ttl: int
+    max_ttl: int
+
+
+# "assets" are the content-hashed bundles, "shell" is index.html and the other unhashed files
+_default_cache_policies = {
+    "assets": {"min_ttl": 86400, "default_ttl": 31536000, "max_ttl": 31536000},
+    "shell": {"min_ttl": 0, "default_ttl": 60, "max_ttl": 300},
+}
+
+
+def _get_cache_policy_settings() -> Dict[str, CDNCachePolicy]:
+    settings = config.get_object("cdnCachePolicies") or {}
+    try:
+        return {
+            name: CDNCachePolicy(**{**defaults, **settings.get(name, {})})
+            for name, defaults in _default_cache_policies.items()
+        }
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
 
 
 def _create_s3_bucket() -> aws.s3.Bucket:
@@ -39,23 +72,70 @@ def _create_s3_bucket() -> aws.s3.Bucket:
         block_public_acls=False,
         opts=pulumi.ResourceOptions(parent=bucket),
     )
+    _bucket_access.extend([ownership_controls, public_access_block])
 
-    # Use a synced folder to manage the files of the website.
-    bucket_folder = synced_folder.S3BucketFolder(
-        f"{project_name}BucketFolder",
-        acl="public-read",
-        bucket_name=bucket.bucket,
-        path=frontend_src_path,
-        opts=pulumi.ResourceOptions(depends_on=[ownership_controls,
-                                                public_access_block],
-                                    parent=bucket)
-    )
+    # Upload the changed files of the website, diffed against the manifest of the last deployment
+    if os.path.isdir(frontend_src_path):
+        aws_config = pulumi.Config("aws")
+        bucket_folder = FrontendAssets(
+            f"{project_name}BucketFolder",
+            acl="public-read",
+            bucket=bucket.bucket,
+            build_dir=frontend_src_path,
+            profile=aws_config.get("profile"),
+            region=aws_config.get("region"),
+            endpoint_url=config.get("frontendS3Endpoint"),
+            opts=pulumi.ResourceOptions(depends_on=_bucket_access, parent=bucket)
+        )
+    else:
+        pulumi.log.warn(f"{frontend_src_path} does not exist, the frontend is not uploaded. Run build-frontend.sh first")
 
     return bucket
 
 
+def _create_cache_policy(name: str, settings: CDNCachePolicy) -> aws.cloudfront.CachePolicy:
+    # Nothing but the path is part of the cache key, compressed variants are cached separately
+    return aws.cloudfront.CachePolicy(
+        f"{project_name}{name}CachePolicy",
+        comment=f"{project_name} {name}",
+        min_ttl=settings.min_ttl,
+        default_ttl=settings.default_ttl,
+        max_ttl=settings.max_ttl,
+        parameters_in_cache_key_and_forwarded_to_origin=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginArgs(
+            cookies_config=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginCookiesConfigArgs(
+                cookie_behavior="none",
+            ),
+            headers_config=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginHeadersConfigArgs(
+                header_behavior="none",
+            ),
+            query_strings_config=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginQueryStringsConfigArgs(
+                query_string_behavior="none",
+            ),
+            enable_accept_encoding_gzip=True,
+            enable_accept_encoding_brotli=True,
+        ),
+    )
+
+
+def _create_origin_request_policy() -> aws.cloudfront.OriginRequestPolicy:
+    # The S3 website origin needs no cookies, headers or query strings
+    return aws.cloudfront.OriginRequestPolicy(
+        f"{project_name}S3OriginRequestPolicy",
+        comment=f"{project_name} S3 website origin",
+        cookies_config=aws.cloudfront.OriginRequestPolicyCookiesConfigArgs(cookie_behavior="none"),
+        headers_config=aws.cloudfront.OriginRequestPolicyHeadersConfigArgs(header_behavior="none"),
+        query_strings_config=aws.cloudfront.OriginRequestPolicyQueryStringsConfigArgs(query_string_behavior="none"),
+    )
+
+
 def _create_cf_cdn(bucket: aws.s3.Bucket, allowed_methods: List[str]) -> aws.cloudfront.Distribution:
 
+    cache_policy_settings = _get_cache_policy_settings()
+    assets_cache_policy = _create_cache_policy("Assets", cache_policy_settings["assets"])
+    shell_cache_policy = _create_cache_policy("Shell", cache_policy_settings["shell"])
+    origin_request_policy = _create_origin_request_policy()
+    cached_methods = ["GET", "HEAD"]
+
     # Create a CloudFront CDN to distribute and cache the website.
     cdn = aws.cloudfront.Distribution(
         f"{project_name}CFDistribution",
@@ -72,25 +152,39 @@ def _create_cf_cdn(bucket: aws.s3.Bucket, allowed_methods: List[str]) -> aws.clo
                 ),
             )
         ],
+        # App shell and the other unhashed files
         default_cache_behavior=aws.cloudfront.DistributionDefaultCacheBehaviorArgs(
             target_origin_id=bucket.arn,
             viewer_protocol_policy="redirect-to-https",
             allowed_methods=allowed_methods,
-            cached_methods=[
-                "GET",
-                "HEAD",
-                "OPTIONS",
-            ],
-            default_ttl=600,
-            max_ttl=600,
-            min_ttl=600,
-            forwarded_values=aws.cloudfront.DistributionDefaultCacheBehaviorForwardedValuesArgs(
-                query_string=True,
-                cookies=aws.cloudfront.DistributionDefaultCacheBehaviorForwardedValuesCookiesArgs(
-                    forward="all",
-                ),
-            ),
+            cached_methods=cached_methods,
+            cache_policy_id=shell_cache_policy.id,
+            origin_request_policy_id=origin_request_policy.id,
+            compress=True,
         ),
+        ordered_cache_behaviors=[
+            # Content-hashed bundles never change under the same name
+            aws.cloudfront.DistributionOrderedCacheBehaviorArgs(
+                path_pattern=assets_path_pattern,
+                target_origin_id=bucket.arn,
+                viewer_protocol_policy="redirect-to-https",
+                allowed_methods=allowed_methods,
+                cached_methods=cached_methods,
+                cache_policy_id=assets_cache_policy.id,
+                origin_request_policy_id=origin_request_policy.id,
+                compress=True,
+            ),
+            aws.cloudfront.DistributionOrderedCacheBehaviorArgs(
+                path_pattern=index_document,
+                target_origin_id=bucket.arn,
+                viewer_protocol_policy="redirect-to-https",
+                allowed_methods=allowed_methods,
+                cached_methods=cached_methods,
+                cache_policy_id=shell_cache_policy.id,
+                origin_request_policy_id=origin_request_policy.id,
+                compress=True,
+            ),
+        ],
         price_class="PriceClass_100",
         custom_error_responses=[
             aws.cloudfront.DistributionCustomErrorResponseArgs(
@@ -113,7 +207,22 @@ def _create_cf_cdn(bucket: aws.s3.Bucket, allowed_methods: List[str]) -> aws.clo
 
 
 def upload_frontend() -> tuple[aws.cloudfront.Distribution, aws.s3.Bucket]:
-    allowed_methods = ["GET", "HEAD", "POST", "DELETE", "PUT", "PATCH", "OPTIONS"]
+    allowed_methods = ["GET", "HEAD", "OPTIONS"]
     s3_bucket = _create_s3_bucket()
     cdn = _create_cf_cdn(bucket=s3_bucket, allowed_methods=allowed_methods)
     return cdn, s3_bucket
+
+
+def publish_frontend_config(bucket: aws.s3.Bucket, settings: Dict[str, pulumi.Input[Any]]) -> aws.s3.BucketObject:
+    """The runtime config of the app, loaded at startup, so that one frontend build works for any stack"""
+    return aws.s3.BucketObject(
+        f"{project_name}FrontendConfig",
+        bucket=bucket.bucket,
+        key=RUNTIME_CONFIG_KEY,
+        content=pulumi.Output.json_dumps(settings),
+        content_type="application/json",
+        # Served by the shell cache behavior, revalidated on every load
+        cache_control=UNHASHED_CACHE_CONTROL,
+        acl="public-read",
+        opts=pulumi.ResourceOptions(depends_on=_bucket_access, parent=bucket),
+    )
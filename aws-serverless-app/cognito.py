@@ -1,13 +1,16 @@
+from __future__ import annotations
+from typing import Tuple
 import pulumi
 import pulumi_aws as aws
+from regions import regional_name
 
 project_name = pulumi.get_project()
 
 
-def create_cognito_authorizer(
-    rest_api: aws.apigateway.RestApi,
-    redirect_url: pulumi.Output[str]
-) -> aws.apigateway.Authorizer:
+def create_cognito_user_pool(
+    redirect_url: pulumi.Output[str],
+) -> Tuple[aws.cognito.UserPool, aws.cognito.UserPoolClient, pulumi.Output[str]]:
+    """User pool, its app client and the domain of its hosted UI"""
 
     aws_config = pulumi.Config("aws")
     config = pulumi.Config()
@@ -42,9 +45,24 @@ def create_cognito_authorizer(
         opts=pulumi.ResourceOptions(parent=user_pool),
     )
 
+    hosted_domain = pulumi.Output.format("{0}.auth.{1}.amazoncognito.com",
+                                         user_pool_domain.domain,
+                                         aws_config.require("region"))
+
+    pulumi.export("aws_user_pool_id", user_pool.id)
+    pulumi.export("aws_user_pools_web_client_id", user_pool_client.id)
+    pulumi.export("cognito_custom_domain", hosted_domain)
+    return user_pool, user_pool_client, hosted_domain
+
+
+def create_cognito_authorizer(
+    rest_api: aws.apigateway.RestApi,
+    user_pool: aws.cognito.UserPool,
+) -> aws.apigateway.Authorizer:
+
     # Create the Authorizer resource.
     authorizer = aws.apigateway.Authorizer(
-        resource_name=f"{project_name}CognitoAuthorizer",
+        resource_name=regional_name(f"{project_name}CognitoAuthorizer"),
         rest_api=rest_api.id,
         name=f"{project_name}Authorizer",
         type="COGNITO_USER_POOLS",
@@ -52,12 +70,31 @@ def create_cognito_authorizer(
         provider_arns=[user_pool.arn],
         opts=pulumi.ResourceOptions(depends_on=[rest_api], parent=rest_api),
     )
-    pulumi.export("aws_user_pool_id", user_pool.id)
-    pulumi.export("aws_user_pools_web_client_id", user_pool_client.id)
-    pulumi.export("cognito_custom_domain",
-                  pulumi.Output.format("{0}.auth.{1}.amazoncognito.com",
-                                       user_pool_domain.domain,
-                                        aws_config.require("region")
-                                       )
-                  )
+    return authorizer
+
+
+def create_cognito_jwt_authorizer(
+    http_api: aws.apigatewayv2.Api,
+    user_pool: aws.cognito.UserPool,
+    user_pool_client: aws.cognito.UserPoolClient,
+) -> aws.apigatewayv2.Authorizer:
+
+    aws_config = pulumi.Config("aws")
+
+    # HTTP API native JWT authorizer, validates the Cognito ID tokens of the app client
+    authorizer = aws.apigatewayv2.Authorizer(
+        resource_name=regional_name(f"{project_name}JwtAuthorizer"),
+        api_id=http_api.id,
+        name=f"{project_name}Authorizer",
+        authorizer_type="JWT",
+        identity_sources=["$request.header.Authorization"],
+        jwt_configuration=aws.apigatewayv2.AuthorizerJwtConfigurationArgs(
+            audiences=[user_pool_client.id],
+            # The user pool is in aws:region, whichever region the API is in
+            issuer=pulumi.Output.format(
+                "https://cognito-idp.{0}.amazonaws.com/{1}", aws_config.require("region"), user_pool.id
+            ),
+        ),
+        opts=pulumi.ResourceOptions(parent=http_api),
+    )
     return authorizer
@@ -0,0 +1,118 @@
+"""Deploys the stack with one `pulumi up`, through the Pulumi Automation API.
+
+The frontend reads its settings from the config.json the program publishes,
+so the frontend is built once, before the deployment, and only when its
+sources changed:
+
+    python deploy.py                    # up with the existing frontend build
+    python deploy.py --build-frontend   # rebuild the frontend first
+    python deploy.py --preview
+    python deploy.py --preview --profile startup-profile.json
+
+The stack is the one of the Pulumi.<stack>.yaml file in this directory, or
+--stack. The state is kept in the local backend (`pulumi login --local`)
+unless --backend says otherwise.
+"""
+
+import argparse
+import glob
+import os
+import re
+import subprocess
+import sys
+from typing import List, Optional
+
+import pulumi.automation as auto
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Stack config files that are not a stack
+TEMPLATE_STACKS = {"stack_template"}
+# Report path of the program's startup profile, see startup_profile.py (importing it starts the profiler)
+PROFILE_VARIABLE = "PULUMI_PROGRAM_PROFILE"
+
+
+def default_stack_name(work_dir: str = APP_DIR) -> Optional[str]:
+    """The first Pulumi.<stack>.yaml of the project, like stack-down.sh"""
+    for filename in sorted(glob.glob(os.path.join(work_dir, "Pulumi.*.yaml"))):
+        match = re.match(r"^Pulumi\.(.+)\.yaml$", os.path.basename(filename))
+        if match and match.group(1) not in TEMPLATE_STACKS:
+            return match.group(1)
+    return None
+
+
+def build_backend(work_dir: str = APP_DIR) -> None:
+    # Warms the Lambda build cache in parallel, the program only packages what is missing
+    subprocess.run(["./build-backend.sh"], cwd=work_dir, check=True)
+
+
+def build_frontend(work_dir: str = APP_DIR) -> None:
+    subprocess.run(["./build-frontend.sh"], cwd=work_dir, check=True)
+
+
+def select_stack(
+    stack_name: str,
+    backend: str,
+    work_dir: str = APP_DIR,
+    profile_path: Optional[str] = None,
+) -> auto.Stack:
+    env_vars = {
+        "PULUMI_BACKEND_URL": backend,
+        # Local backends encrypt the stack secrets with a passphrase, empty unless it is set
+        "PULUMI_CONFIG_PASSPHRASE": os.environ.get("PULUMI_CONFIG_PASSPHRASE", ""),
+    }
+    if profile_path:
+        # The program writes its startup profile there, see startup_profile.py
+        env_vars[PROFILE_VARIABLE] = os.path.abspath(profile_path)
+    return auto.create_or_select_stack(
+        stack_name=stack_name,
+        work_dir=work_dir,
+        opts=auto.LocalWorkspaceOptions(env_vars=env_vars),
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build and deploy the stack with one pulumi up")
+    parser.add_argument("--stack", default=default_stack_name(), help="stack name (default: from Pulumi.<stack>.yaml)")
+    parser.add_argument("--backend", default=os.environ.get("PULUMI_BACKEND_URL") or "file://~",
+                        help="state backend URL (default: the local backend)")
+    parser.add_argument("--build-frontend", action="store_true", help="rebuild the frontend before the deployment")
+    parser.add_argument("--skip-backend-build", action="store_true", help="do not warm the Lambda build cache")
+    parser.add_argument("--preview", action="store_true", help="preview the changes instead of deploying them")
+    parser.add_argument("--refresh", action="store_true", help="refresh the state before the deployment")
+    parser.add_argument("--profile", metavar="REPORT", help="write the startup profile of the program to REPORT (JSON)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # The pulumi binary of PULUMI_PATH, like the shell scripts
+    if os.environ.get("PULUMI_PATH"):
+        os.environ["PATH"] = os.path.dirname(os.environ["PULUMI_PATH"]) + os.pathsep + os.environ["PATH"]
+    if not args.stack:
+        print("No Pulumi.<stack>.yaml found, run `make stack-init` or pass --stack")
+        return 1
+
+    if not args.skip_backend_build:
+        build_backend()
+    frontend_build = os.path.join(APP_DIR, "..", "frontend-src", "build")
+    if args.build_frontend or not os.path.isdir(frontend_build):
+        build_frontend()
+
+    stack = select_stack(args.stack, args.backend, profile_path=args.profile)
+    print(f"Stack {args.stack} ({args.backend})")
+    if args.refresh:
+        stack.refresh(on_output=print)
+    if args.preview:
+        stack.preview(on_output=print)
+        return 0
+
+    result = stack.up(on_output=print)
+    print(f"Update {result.summary.result}: {result.summary.resource_changes}")
+    for name, output in sorted(result.outputs.items()):
+        print(f"{name}: {'[secret]' if output.secret else output.value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
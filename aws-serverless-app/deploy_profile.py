@@ -0,0 +1,299 @@
+"""Critical path of a deployment, from the Pulumi engine events.
+
+Runs `pulumi up` through the Automation API and records its engine events and
+the stack state, or reads recorded ones, offline:
+
+    python deploy_profile.py --run --event-log events.jsonl --state state.json
+    python deploy_profile.py --event-log events.jsonl --state state.json --output profile.json
+
+The event log is the one of `pulumi up --event-log <file>` (one JSON engine
+event per line), the state the one of `pulumi stack export`. Every resource
+step of the log gets a start (its resourcePreEvent) and an end (its
+resOutputsEvent or resOpFailedEvent); engine timestamps are in seconds.
+
+The dependencies come from the state: `propertyDependencies` are the data
+dependencies of the inputs, the other `dependencies` of a resource are its
+explicit `depends_on`. The critical path follows, from the last resource
+done, the dependency each resource waited for last. An explicit dependency
+is redundant when the resource depends on it through its other dependencies
+anyway, the other explicit dependencies only order the deployment and are
+reported with the time they held their resource back. The SDK records a
+`depends_on` that is a data dependency as well as a data dependency only, so
+such a `depends_on` cannot be told apart in the state. The stack and the
+component resources are not steps of the critical path.
+"""
+
+import argparse
+import json
+import os
+import sys
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+# Steps that tear resources down run in the reverse order of the dependencies
+DELETE_OPS = {"delete", "delete-replaced", "discard", "discard-replaced", "remove-pending-replace"}
+# The stack and the other component resources register their outputs once their
+# children are done, they are not steps of the critical path
+STACK_TYPE = "pulumi:pulumi:Stack"
+# Width of the timeline bars of the report
+TIMELINE_WIDTH = 40
+
+
+def _json_value(value: Any) -> Any:
+    """Engine event objects of the Automation API as the JSON of the CLI event log (camelCase keys)"""
+    # OpType and the other enums are str enums
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, "__dict__"):
+        return {
+            "".join(part.capitalize() if i else part for i, part in enumerate(key.split("_"))): _json_value(item)
+            for key, item in vars(value).items()
+            if item is not None
+        }
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    return value
+
+
+def record_deployment(stack, event_log: str, state_path: str, preview: bool = False) -> None:
+    """Deploy (or preview) the stack, writing its engine events and then its state"""
+    with open(event_log, "w", encoding="utf-8") as log:
+        def on_event(event) -> None:
+            log.write(json.dumps(_json_value(event), sort_keys=True) + "\n")
+            log.flush()
+
+        if preview:
+            stack.preview(on_output=print, on_event=on_event)
+        else:
+            stack.up(on_output=print, on_event=on_event)
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(stack.export_stack().deployment, f, indent=2)
+
+
+def read_events(event_log: str) -> Iterable[Dict[str, Any]]:
+    with open(event_log, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_timeline(events: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Start, end and steps of every resource of the log, by URN. Times are seconds from the first step."""
+    timeline: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        for kind in ("resourcePreEvent", "resOutputsEvent", "resOpFailedEvent"):
+            payload = event.get(kind)
+            # preview steps are planned, not performed
+            if not payload or payload.get("planning"):
+                continue
+            metadata = payload.get("metadata", {})
+            urn = metadata.get("urn")
+            if not urn:
+                continue
+            entry = timeline.setdefault(urn, {
+                "urn": urn,
+                "type": metadata.get("type", ""),
+                "ops": [],
+                "start": None,
+                "end": None,
+                "failed": False,
+            })
+            timestamp = event.get("timestamp", 0)
+            if kind == "resourcePreEvent":
+                entry["ops"].append(metadata.get("op", ""))
+                if entry["start"] is None:
+                    entry["start"] = timestamp
+            else:
+                entry["end"] = timestamp
+                entry["failed"] = entry["failed"] or kind == "resOpFailedEvent"
+
+    steps = [entry for entry in timeline.values() if entry["start"] is not None]
+    origin = min((entry["start"] for entry in steps), default=0)
+    for entry in steps:
+        entry["start"] -= origin
+        entry["end"] = entry["start"] if entry["end"] is None else entry["end"] - origin
+        entry["duration"] = entry["end"] - entry["start"]
+    return {entry["urn"]: entry for entry in steps}
+
+
+def dependency_graph(state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Data and explicit dependencies of every resource of a `pulumi stack export` deployment, by URN"""
+    graph = {}
+    for resource in state.get("resources", []):
+        data = {
+            urn
+            for dependencies in (resource.get("propertyDependencies") or {}).values()
+            for urn in dependencies
+        }
+        graph[resource["urn"]] = {
+            "data": data,
+            "explicit": set(resource.get("dependencies") or []) - data,
+            "component": not resource.get("custom", True),
+        }
+    return graph
+
+
+def _reachable(graph: Dict[str, Dict[str, Any]], start: Iterable[str]) -> Set[str]:
+    seen: Set[str] = set()
+    pending = list(start)
+    while pending:
+        urn = pending.pop()
+        if urn in seen:
+            continue
+        seen.add(urn)
+        node = graph.get(urn, {})
+        pending.extend(node.get("data", set()) | node.get("explicit", set()))
+    return seen
+
+
+def critical_path(
+    timeline: Dict[str, Dict[str, Any]],
+    graph: Dict[str, Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """From the last resource done back to the first, the dependency each resource waited for last"""
+    steps = {
+        urn: entry for urn, entry in timeline.items()
+        if not set(entry["ops"]) & DELETE_OPS
+        and entry["type"] != STACK_TYPE and not graph.get(urn, {}).get("component")
+    }
+    if not steps:
+        return []
+    path = []
+    urn: Optional[str] = max(steps, key=lambda candidate: (steps[candidate]["end"], -steps[candidate]["start"]))
+    while urn:
+        entry = steps[urn]
+        node = graph.get(urn, {"data": set(), "explicit": set()})
+        dependencies = [
+            dependency for dependency in node["data"] | node["explicit"]
+            if dependency in steps and steps[dependency]["end"] <= entry["start"]
+        ]
+        gate = max(dependencies, key=lambda dependency: steps[dependency]["end"], default=None)
+        path.append({
+            **entry,
+            "waited_for": gate,
+            "explicit": gate in node["explicit"] if gate else False,
+            # time between the dependency being done and the step starting
+            "wait": entry["start"] - steps[gate]["end"] if gate else entry["start"],
+        })
+        urn = gate
+    return list(reversed(path))
+
+
+def explicit_dependencies(
+    timeline: Dict[str, Dict[str, Any]],
+    graph: Dict[str, Dict[str, Any]],
+    path: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Every explicit dependency: redundant or not, and how long it held its resource back"""
+    on_path = {(entry["urn"], entry["waited_for"]) for entry in path}
+    edges = []
+    for urn, node in graph.items():
+        for dependency in sorted(node["explicit"]):
+            others = (node["data"] | node["explicit"]) - {dependency}
+            entry = timeline.get(urn)
+            held_back = 0
+            if entry and dependency in timeline:
+                # the step could have started when its other dependencies were done
+                others_done = max((timeline[other]["end"] for other in others if other in timeline), default=0)
+                held_back = max(0, min(entry["start"], timeline[dependency]["end"]) - others_done)
+            edges.append({
+                "resource": urn,
+                "depends_on": dependency,
+                "redundant": dependency in _reachable(graph, others),
+                "held_back": held_back,
+                "critical": (urn, dependency) in on_path,
+            })
+    return sorted(edges, key=lambda edge: (not edge["critical"], -edge["held_back"], edge["resource"]))
+
+
+def resource_name(urn: str) -> str:
+    """Logical name of a URN (urn:pulumi:<stack>::<project>::<type>::<name>)"""
+    return urn.rsplit("::", 1)[-1]
+
+
+def profile(event_log: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    timeline = build_timeline(read_events(event_log))
+    graph = dependency_graph(state)
+    path = critical_path(timeline, graph)
+    return {
+        "duration": max((entry["end"] for entry in timeline.values()), default=0),
+        "resources": len(timeline),
+        "timeline": sorted(timeline.values(), key=lambda entry: (entry["start"], entry["end"])),
+        "critical_path": path,
+        "explicit_dependencies": explicit_dependencies(timeline, graph, path),
+    }
+
+
+def _bar(entry: Dict[str, Any], duration: int) -> str:
+    scale = TIMELINE_WIDTH / max(duration, 1)
+    start = int(entry["start"] * scale)
+    length = max(1, int(round(entry["duration"] * scale)))
+    return " " * start + "#" * min(length, TIMELINE_WIDTH - start)
+
+
+def print_report(report: Dict[str, Any], timeline: bool = False) -> None:
+    duration = report["duration"]
+    print(f"{report['resources']} resource steps in {duration}s")
+    if timeline:
+        print("\nTimeline")
+        for entry in report["timeline"]:
+            print(f"{resource_name(entry['urn'])[:40]:<42}{','.join(entry['ops']):<20}"
+                  f"{entry['start']:>5}s{entry['duration']:>5}s  |{_bar(entry, duration):<{TIMELINE_WIDTH}}|")
+
+    print("\nCritical path")
+    for entry in report["critical_path"]:
+        gate = "depends_on" if entry["explicit"] else "data"
+        print(f"{resource_name(entry['urn'])[:40]:<42}{','.join(entry['ops']):<20}"
+              f"{entry['start']:>5}s{entry['duration']:>5}s  waited {entry['wait']}s"
+              + (f" ({gate})" if entry["waited_for"] else ""))
+
+    redundant = [edge for edge in report["explicit_dependencies"] if edge["redundant"]]
+    ordering = [edge for edge in report["explicit_dependencies"] if not edge["redundant"]]
+    print(f"\nRedundant depends_on ({len(redundant)}), already implied by the other dependencies")
+    for edge in redundant:
+        print(f"  {resource_name(edge['resource'])} -> {resource_name(edge['depends_on'])}")
+    print(f"\nOrdering-only depends_on ({len(ordering)}), by the time they held their resource back")
+    for edge in ordering:
+        critical = ", critical path" if edge["critical"] else ""
+        print(f"  {resource_name(edge['resource'])} -> {resource_name(edge['depends_on'])}: "
+              f"{edge['held_back']}s{critical}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Timeline and critical path of a deployment")
+    parser.add_argument("--event-log", required=True, help="engine event log (JSON lines), written with --run")
+    parser.add_argument("--state", required=True, help="stack state (`pulumi stack export`), written with --run")
+    parser.add_argument("--run", action="store_true", help="deploy the stack and record the event log and state first")
+    parser.add_argument("--preview", action="store_true", help="with --run, preview instead of deploying")
+    parser.add_argument("--stack", help="with --run, the stack (default: from Pulumi.<stack>.yaml)")
+    parser.add_argument("--backend", default=os.environ.get("PULUMI_BACKEND_URL") or "file://~",
+                        help="with --run, the state backend URL")
+    parser.add_argument("--timeline", action="store_true", help="print the timeline of every resource")
+    parser.add_argument("--output", help="JSON report file")
+    args = parser.parse_args(argv)
+
+    if args.run:
+        from deploy import default_stack_name, select_stack
+
+        stack_name = args.stack or default_stack_name()
+        if not stack_name:
+            print("No Pulumi.<stack>.yaml found, pass --stack")
+            return 1
+        record_deployment(select_stack(stack_name, args.backend), args.event_log, args.state, preview=args.preview)
+
+    with open(args.state, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    # `pulumi stack export` wraps the deployment in {"version", "deployment"}
+    report = profile(args.event_log, state.get("deployment", state))
+    print_report(report, timeline=args.timeline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
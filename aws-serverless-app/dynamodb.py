@@ -1,57 +1,308 @@
+from __future__ import annotations
 import json
-from typing import Sequence, Optional
+import sys
+from typing import Sequence, Optional, Literal, Dict, Any, List
+import pulumi
 import pulumi_aws as aws
+from pydantic import BaseModel, ValidationError, root_validator
+from app_config import config
 
 
-DYNAMODB_ATTRS = "./dynamodb/attributes.json"
+DYNAMODB_ATTRS = config.get("dynamodbSchemaPath") or "../dynamodb/attributes.json"
+
+
+class DynamoDBAttribute(BaseModel):
+    name: str
+    type: Literal["S", "N", "B"]
+    index: Optional[Literal["hash_key", "range_key"]]
+
+
+class DynamoDBSecondaryIndex(BaseModel):
+    name: str
+    hash_key: Optional[str]  # LSIs always share the table hash key
+    range_key: Optional[str]
+    projection_type: Literal["ALL", "KEYS_ONLY", "INCLUDE"] = "ALL"
+    non_key_attributes: List[str] = []
+
+    @root_validator(skip_on_failure=True)
+    def _projection_validator(cls, values):
+        if values["non_key_attributes"] and values["projection_type"] != "INCLUDE":
+            raise ValueError(f"{values['name']}: non_key_attributes require projection_type INCLUDE")
+        return values
+
+
+class DynamoDBSchema(BaseModel):
+    attributes: List[DynamoDBAttribute]
+    global_secondary_indexes: List[DynamoDBSecondaryIndex] = []
+    local_secondary_indexes: List[DynamoDBSecondaryIndex] = []
+
+    @root_validator(skip_on_failure=True)
+    def _keys_validator(cls, values):
+        names = {attr.name for attr in values["attributes"]}
+        table_keys = {attr.index: attr.name for attr in values["attributes"] if attr.index}
+        if "hash_key" not in table_keys:
+            raise ValueError("table hash_key attribute is not defined")
+
+        used = set(table_keys.values())
+        for index in values["global_secondary_indexes"]:
+            if index.hash_key is None:
+                raise ValueError(f"{index.name}: global secondary index requires a hash_key")
+            used.update(filter(None, (index.hash_key, index.range_key)))
+        for index in values["local_secondary_indexes"]:
+            if index.hash_key not in (None, table_keys["hash_key"]):
+                raise ValueError(f"{index.name}: local secondary index must use the table hash_key")
+            if index.range_key is None:
+                raise ValueError(f"{index.name}: local secondary index requires a range_key")
+            used.add(index.range_key)
+
+        # DynamoDB rejects attribute definitions that are not used by any key
+        if used - names:
+            raise ValueError(f"undefined key attributes: {sorted(used - names)}")
+        if names - used:
+            raise ValueError(f"attributes not used by any key: {sorted(names - used)}")
+        return values
+
+    @property
+    def hash_key(self) -> str:
+        return next(attr.name for attr in self.attributes if attr.index == "hash_key")
+
+    @property
+    def range_key(self) -> Optional[str]:
+        return next((attr.name for attr in self.attributes if attr.index == "range_key"), None)
+
+
+def load_schema(filename: str = DYNAMODB_ATTRS) -> DynamoDBSchema:
+    with open(filename, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    # A plain list is the attributes-only format
+    if isinstance(schema, list):
+        schema = {"attributes": schema}
+    try:
+        return DynamoDBSchema(**schema)
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
+
+
+class DynamoDBScaling(BaseModel):
+    min_capacity: int
+    max_capacity: int
+    target_utilization: float = 70.0
+
+
+class DynamoDBCapacity(BaseModel):
+    mode: Literal["PAY_PER_REQUEST", "PROVISIONED"] = "PAY_PER_REQUEST"
+    read_capacity: int = 5
+    write_capacity: int = 5
+    # Application Auto Scaling of PROVISIONED tables, applied to the table and each GSI
+    read_scaling: Optional[DynamoDBScaling]
+    write_scaling: Optional[DynamoDBScaling]
+
+
+# Per-stage defaults, overridden by the `dynamodbCapacity` stack config object
+_stage_capacity_defaults: Dict[str, Dict[str, Any]] = {
+    "demo": {"mode": "PAY_PER_REQUEST"},
+    "dev": {"mode": "PAY_PER_REQUEST"},
+    "prod": {
+        "mode": "PROVISIONED",
+        "read_capacity": 20,
+        "write_capacity": 20,
+        "read_scaling": {"min_capacity": 20, "max_capacity": 500, "target_utilization": 70},
+        "write_scaling": {"min_capacity": 20, "max_capacity": 200, "target_utilization": 70},
+    },
+}
+
+
+def get_capacity_settings() -> DynamoDBCapacity:
+    stage_name = config.get("stageName")
+    settings = dict(_stage_capacity_defaults.get(stage_name, {}))
+    settings.update(config.get_object("dynamodbCapacity") or {})
+    try:
+        return DynamoDBCapacity(**settings)
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
+
+
+def _create_scaling(
+    name: str,
+    resource_id: pulumi.Input[str],
+    dimension: Literal["table", "index"],
+    capacity: Literal["Read", "Write"],
+    scaling: DynamoDBScaling,
+    parent: pulumi.Resource,
+) -> aws.appautoscaling.Policy:
+    target = aws.appautoscaling.Target(
+        f"{name}{capacity}ScalingTarget",
+        service_namespace="dynamodb",
+        resource_id=resource_id,
+        scalable_dimension=f"dynamodb:{dimension}:{capacity}CapacityUnits",
+        min_capacity=scaling.min_capacity,
+        max_capacity=scaling.max_capacity,
+        opts=pulumi.ResourceOptions(parent=parent),
+    )
+    return aws.appautoscaling.Policy(
+        f"{name}{capacity}ScalingPolicy",
+        policy_type="TargetTrackingScaling",
+        service_namespace=target.service_namespace,
+        resource_id=target.resource_id,
+        scalable_dimension=target.scalable_dimension,
+        target_tracking_scaling_policy_configuration=aws.appautoscaling.PolicyTargetTrackingScalingPolicyConfigurationArgs(
+            predefined_metric_specification=aws.appautoscaling.PolicyTargetTrackingScalingPolicyConfigurationPredefinedMetricSpecificationArgs(
+                predefined_metric_type=f"DynamoDB{capacity}CapacityUtilization",
+            ),
+            target_value=scaling.target_utilization,
+        ),
+        opts=pulumi.ResourceOptions(parent=target),
+    )
+
+
+def _create_autoscaling(
+    table: aws.dynamodb.Table,
+    table_name: str,
+    index_names: Sequence[str],
+    capacity: DynamoDBCapacity,
+) -> None:
+    targets = [(table_name, pulumi.Output.concat("table/", table.name), "table")]
+    for index_name in index_names:
+        targets.append((
+            f"{table_name}-{index_name}",
+            pulumi.Output.concat("table/", table.name, "/index/", index_name),
+            "index",
+        ))
+
+    for name, resource_id, dimension in targets:
+        if capacity.read_scaling:
+            _create_scaling(name, resource_id, dimension, "Read", capacity.read_scaling, parent=table)
+        if capacity.write_scaling:
+            _create_scaling(name, resource_id, dimension, "Write", capacity.write_scaling, parent=table)
 
 
 def _create_dynamodb_table(
     table_name: str,
     attributes: Sequence[aws.dynamodb.TableAttributeArgs],
     hash_key: str,
-    range_key: str,
-    secondary_indexes: Optional[
-        Sequence[aws.dynamodb.TableGlobalSecondaryIndexArgs]
-    ] = None,
+    range_key: Optional[str],
+    secondary_indexes: Optional[Sequence[DynamoDBSecondaryIndex]] = None,
+    local_secondary_indexes: Optional[Sequence[DynamoDBSecondaryIndex]] = None,
+    capacity: Optional[DynamoDBCapacity] = None,
+    ttl_attribute: Optional[str] = None,
+    stream_view_type: Optional[Literal["KEYS_ONLY", "NEW_IMAGE", "OLD_IMAGE", "NEW_AND_OLD_IMAGES"]] = None,
+    replica_regions: Sequence[str] = (),
 ) -> aws.dynamodb.Table:
 
+    if capacity is None:
+        capacity = get_capacity_settings()
+    if replica_regions:
+        # Global tables replicate from a stream with both images, which includes the other views
+        stream_view_type = "NEW_AND_OLD_IMAGES"
+
     _attributes: Sequence[aws.dynamodb.TableAttributeArgs] = []
     for attr in attributes:
         _attributes.append(
             aws.dynamodb.TableAttributeArgs(name=attr["name"], type=attr["type"])
         )
 
-    if secondary_indexes is None:
-        secondary_indexes = []
-        dynamodb_table = aws.dynamodb.Table(
+    if capacity.mode == "PROVISIONED":
+        capacity_args = {
+            "read_capacity": capacity.read_capacity,
+            "write_capacity": capacity.write_capacity,
+        }
+    else:
+        capacity_args = {}
+
+    secondary_indexes = secondary_indexes or []
+    _global_indexes = [
+        aws.dynamodb.TableGlobalSecondaryIndexArgs(
+            name=index.name,
+            hash_key=index.hash_key,
+            range_key=index.range_key,
+            projection_type=index.projection_type,
+            non_key_attributes=index.non_key_attributes or None,
+            **capacity_args,
+        )
+        for index in secondary_indexes
+    ]
+    # LSIs can only be defined when the table is created
+    _local_indexes = [
+        aws.dynamodb.TableLocalSecondaryIndexArgs(
+            name=index.name,
+            range_key=index.range_key,
+            projection_type=index.projection_type,
+            non_key_attributes=index.non_key_attributes or None,
+        )
+        for index in local_secondary_indexes or []
+    ]
+
+    # Auto scaling owns the provisioned capacity of the table and its GSIs once the table exists
+    ignore_changes = []
+    if capacity.mode == "PROVISIONED" and capacity.read_scaling:
+        ignore_changes.extend(["readCapacity", "globalSecondaryIndexes[*].readCapacity"])
+    if capacity.mode == "PROVISIONED" and capacity.write_scaling:
+        ignore_changes.extend(["writeCapacity", "globalSecondaryIndexes[*].writeCapacity"])
+
+    dynamodb_table = aws.dynamodb.Table(
+        table_name,
+        name=table_name,
+        tags={
+            "Name": table_name,
+        },
+        # Items expire at the epoch seconds of ttl_attribute
+        ttl=aws.dynamodb.TableTtlArgs(
+            attribute_name=ttl_attribute,
+            enabled=True,
+        ) if ttl_attribute else None,
+        stream_enabled=bool(stream_view_type),
+        stream_view_type=stream_view_type,
+        billing_mode=capacity.mode,
+        **capacity_args,
+        attributes=_attributes,
+        global_secondary_indexes=_global_indexes,
+        local_secondary_indexes=_local_indexes,
+        hash_key=hash_key,
+        range_key=range_key,
+        # A global table, with a replica in each of these regions
+        replicas=[aws.dynamodb.TableReplicaArgs(region_name=region) for region in replica_regions] or None,
+        opts=pulumi.ResourceOptions(ignore_changes=ignore_changes),
+    )
+
+    if capacity.mode == "PROVISIONED":
+        _create_autoscaling(
+            dynamodb_table,
             table_name,
-            name=table_name,
-            tags={
-                "Name": table_name,
-            },
-            # ttl=aws.dynamodb.TableTtlArgs(
-            #     attribute_name="TimeToExist",
-            #     enabled=False,
-            # ),
-            read_capacity=20,
-            write_capacity=20,
-            attributes=attributes,
-            global_secondary_indexes=secondary_indexes,
-            hash_key=hash_key,
-            range_key=range_key,
+            index_names=[index.name for index in secondary_indexes],
+            capacity=capacity,
         )
     return dynamodb_table
 
 
-def create_todo_table(table_name: str) -> aws.dynamodb.Table:
+def create_todo_table(
+    table_name: str,
+    ttl_attribute: Optional[str] = None,
+    stream_view_type: Optional[str] = None,
+    replica_regions: Sequence[str] = (),
+) -> aws.dynamodb.Table:
+    schema = load_schema(DYNAMODB_ATTRS)
     todo_table = _create_dynamodb_table(
         table_name=table_name,
-        hash_key="cognito-username",
-        range_key="id",
-        attributes=[
-            {"name": "cognito-username", "type": "S"},
-            {"name": "id", "type": "S"},
-        ],
-    )  # TODO: load attributes from DYNAMODB_ATTRS
+        hash_key=schema.hash_key,
+        range_key=schema.range_key,
+        attributes=[{"name": attr.name, "type": attr.type} for attr in schema.attributes],
+        secondary_indexes=schema.global_secondary_indexes,
+        local_secondary_indexes=schema.local_secondary_indexes,
+        ttl_attribute=ttl_attribute,
+        stream_view_type=stream_view_type,
+        replica_regions=replica_regions,
+    )
     return todo_table
+
+
+def create_versions_table(table_name: str, replica_regions: Sequence[str] = ()) -> aws.dynamodb.Table:
+    """Write version of each user's items, one counter per user, see read_cache.py"""
+    return _create_dynamodb_table(
+        table_name=table_name,
+        hash_key="cognito-username",
+        range_key=None,
+        attributes=[{"name": "cognito-username", "type": "S"}],
+        replica_regions=replica_regions,
+    )
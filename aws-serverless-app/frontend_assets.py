@@ -0,0 +1,193 @@
+"""Incremental upload of the frontend build.
+
+Every file of the build is hashed into a manifest. The manifest of the last
+deployment is kept in the stack state (outputs of the FrontendAssets resource),
+so a deployment only uploads the objects whose hash changed and deletes the
+removed ones. Every object gets a Cache-Control header by file class.
+Objects are stored uncompressed: CloudFront compresses them at the edge,
+with brotli or gzip by the Accept-Encoding of the viewer (see cloudfront.py),
+which it does not do for objects that already have a Content-Encoding. The
+runtime config of the app is not part of the build, the stack publishes it.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Any, Optional
+import pulumi
+import pulumi.dynamic
+
+
+MANIFEST_VERSION = 2
+
+# Content-hashed CRA bundles, eg static/js/main.3f2a9c1e.chunk.js
+HASHED_FILE_PATTERN = re.compile(r"(^|/)static/|\.[0-9a-f]{8,}\.")
+HASHED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UNHASHED_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+# Loaded by the app at startup, eg public/config.json of a local development server
+RUNTIME_CONFIG_KEY = "config.json"
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+mimetypes.add_type("application/javascript", ".js")
+
+
+def _content_type(key: str) -> str:
+    content_type, _ = mimetypes.guess_type(key)
+    return content_type or "application/octet-stream"
+
+
+def _cache_control(key: str) -> str:
+    return HASHED_CACHE_CONTROL if HASHED_FILE_PATTERN.search(key) else UNHASHED_CACHE_CONTROL
+
+
+def build_manifest(build_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Object key -> sha256, size and the metadata the object is uploaded with."""
+    manifest = {}
+    for root, _, files in os.walk(build_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            key = os.path.relpath(path, build_dir).replace(os.sep, "/")
+            if key == RUNTIME_CONFIG_KEY:
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            # No None values: the stack state drops them, and the entries are compared with the ones read back from it
+            manifest[key] = {
+                "sha256": hashlib.sha256(body).hexdigest(),
+                "size": len(body),
+                # CloudFront only compresses the text types
+                "content_type": _content_type(key),
+                "cache_control": _cache_control(key),
+            }
+    return dict(sorted(manifest.items()))
+
+
+def manifest_digest(manifest: Dict[str, Dict[str, Any]]) -> str:
+    digest = hashlib.sha256(f"manifest:{MANIFEST_VERSION}\0".encode())
+    for key, entry in manifest.items():
+        digest.update(
+            f"{key}\0{entry['sha256']}\0{entry['content_type']}\0{entry['cache_control']}\0".encode()
+        )
+    return digest.hexdigest()
+
+
+def sync_assets(
+    s3_client,
+    bucket: str,
+    build_dir: str,
+    previous_manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+    acl: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Upload the changed objects of build_dir and delete the removed ones.
+
+    `s3_client` is a boto3 S3 client, any S3 compatible endpoint (eg moto) works.
+    Returns the new manifest and the keys that were uploaded and deleted.
+    """
+    previous_manifest = previous_manifest or {}
+    manifest = build_manifest(build_dir)
+
+    uploaded = []
+    for key, entry in manifest.items():
+        if previous_manifest.get(key) == entry:
+            continue
+        with open(os.path.join(build_dir, key), "rb") as f:
+            body = f.read()
+        extra_args = {
+            "ContentType": entry["content_type"],
+            "CacheControl": entry["cache_control"],
+        }
+        if acl:
+            extra_args["ACL"] = acl
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body, **extra_args)
+        uploaded.append(key)
+
+    deleted = sorted(set(previous_manifest) - set(manifest))
+    # DeleteObjects accepts up to 1000 keys per call
+    for i in range(0, len(deleted), 1000):
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in deleted[i:i + 1000]], "Quiet": True},
+        )
+    return {"manifest": manifest, "uploaded": uploaded, "deleted": deleted}
+
+
+def _s3_client(props: Dict[str, Any]):
+    import boto3
+
+    session = boto3.Session(profile_name=props.get("profile") or None, region_name=props.get("region") or None)
+    return session.client("s3", endpoint_url=props.get("endpoint_url") or None)
+
+
+class _FrontendAssetsProvider(pulumi.dynamic.ResourceProvider):
+
+    def _sync(self, props: Dict[str, Any], previous_manifest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        result = sync_assets(
+            _s3_client(props),
+            bucket=props["bucket"],
+            build_dir=props["build_dir"],
+            previous_manifest=previous_manifest,
+            acl=props.get("acl"),
+        )
+        return {
+            **props,
+            "manifest": result["manifest"],
+            "manifest_digest": manifest_digest(result["manifest"]),
+            "uploaded_count": len(result["uploaded"]),
+            "deleted_count": len(result["deleted"]),
+        }
+
+    def create(self, props):
+        return pulumi.dynamic.CreateResult(id_=props["bucket"], outs=self._sync(props, None))
+
+    def diff(self, _id, olds, news):
+        replaces = ["bucket"] if olds.get("bucket") != news.get("bucket") else []
+        changes = bool(replaces) or any(
+            olds.get(key) != news.get(key) for key in ("manifest_digest", "acl", "endpoint_url")
+        )
+        return pulumi.dynamic.DiffResult(changes=changes, replaces=replaces, delete_before_replace=False)
+
+    def update(self, _id, olds, news):
+        return pulumi.dynamic.UpdateResult(outs=self._sync(news, olds.get("manifest")))
+
+    def delete(self, _id, props):
+        keys = sorted(props.get("manifest") or {})
+        client = _s3_client(props)
+        for i in range(0, len(keys), 1000):
+            client.delete_objects(
+                Bucket=props["bucket"],
+                Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True},
+            )
+
+
+class FrontendAssets(pulumi.dynamic.Resource):
+    manifest_digest: pulumi.Output[str]
+    uploaded_count: pulumi.Output[int]
+    deleted_count: pulumi.Output[int]
+
+    def __init__(
+        self,
+        name: str,
+        bucket: pulumi.Input[str],
+        build_dir: str,
+        acl: Optional[str] = None,
+        profile: Optional[str] = None,
+        region: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        opts: Optional[pulumi.ResourceOptions] = None,
+    ):
+        build_dir = os.path.abspath(build_dir)
+        props = {
+            "bucket": bucket,
+            "build_dir": build_dir,
+            "acl": acl,
+            "profile": profile,
+            "region": region,
+            "endpoint_url": endpoint_url,
+            # The only input that changes with the build, so the diff is one hash comparison
+            "manifest_digest": manifest_digest(build_manifest(build_dir)),
+            "manifest": None,
+            "uploaded_count": None,
+            "deleted_count": None,
+        }
+        super().__init__(_FrontendAssetsProvider(), name, props, opts)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from typing import Dict, Tuple, List, Optional
+import pulumi
+import pulumi_aws as aws
+from api_gateway import create_api_lambdas, create_lambda_permissions, lambda_deployment
+from cognito import create_cognito_jwt_authorizer
+from api import get_api_resources, APIResourceFunction, cors_headers, cached_methods
+from tracing import tracing_settings
+from regions import regional_name, regional_opts
+from app_config import config
+
+
+# Browsers may reuse a preflight response for this long (seconds)
+cors_max_age = int(config.get("httpApiCorsMaxAge") or 600)
+
+
+def _cors_values(header: str) -> List[str]:
+    # cors_headers holds API Gateway mapping expressions, eg "'GET,POST'"
+    return cors_headers[header].strip("'").split(",")
+
+
+def _create_integrations(
+    http_api: aws.apigatewayv2.Api,
+    functions: List[APIResourceFunction],
+) -> Dict[str, aws.apigatewayv2.Integration]:
+    """One Lambda proxy integration per deployed function, by function name"""
+    integrations = {}
+    for api_function in functions:
+        integration = aws.apigatewayv2.Integration(
+            regional_name(f"{api_function.name}Integration"),
+            api_id=http_api.id,
+            integration_type="AWS_PROXY",
+            integration_uri=(api_function.alias_ or api_function.lambda_).arn,
+            integration_method="POST",
+            payload_format_version="2.0",
+            timeout_milliseconds=min(api_function.timeout * 1000, 30000),
+            opts=pulumi.ResourceOptions(parent=http_api),
+        )
+        integrations[api_function.name] = integration
+    return integrations
+
+
+def create_http_api_gateway(
+    user_pool: aws.cognito.UserPool,
+    user_pool_client: aws.cognito.UserPoolClient,
+    lambda_policies: list[aws.iam.RoleInlinePolicyArgs],
+    lambda_environment: Optional[Dict[str, str]] = None,
+    dynamodb_table: Optional[str] = None
+) -> Tuple[pulumi.Output[str]]:
+    """API Gateway HTTP API (v2) of the API routes.
+
+    Same Lambdas as the REST API, with a JWT authorizer on the Cognito user pool,
+    built-in CORS instead of the MOCK OPTIONS methods, payload format 2.0 and an
+    auto-deployed stage. HTTP APIs have no stage cache and no request validation,
+    the `cache` and `request_parameters` settings of api.py do not apply.
+    """
+    http_api_name = "workshopServerlessJukeBox"
+
+    lambda_environment = {"TABLE_NAME": dynamodb_table, **(lambda_environment or {})}
+
+    if cached_methods(get_api_resources()):
+        pulumi.log.warn("HTTP APIs have no stage cache, the cache settings of api.py are ignored")
+    if tracing_settings.enabled:
+        pulumi.log.warn("HTTP APIs do not trace requests, only the Lambdas are traced and no sampling rules are created")
+
+    # AWS Lambdas
+    functions = create_api_lambdas(lambda_policies=lambda_policies, lambda_environment=lambda_environment)
+
+    # API Gateway, preflight requests are answered by API Gateway itself
+    http_api = aws.apigatewayv2.Api(
+        regional_name(http_api_name),
+        protocol_type="HTTP",
+        cors_configuration=aws.apigatewayv2.ApiCorsConfigurationArgs(
+            allow_origins=_cors_values("Access-Control-Allow-Origin"),
+            allow_methods=_cors_values("Access-Control-Allow-Methods"),
+            allow_headers=_cors_values("Access-Control-Allow-Headers"),
+            expose_headers=["ETag"],
+            max_age=cors_max_age,
+        ),
+        opts=regional_opts(),
+    )
+
+    # API GW JWT authorizer
+    jwt_authorizer = create_cognito_jwt_authorizer(
+        http_api=http_api, user_pool=user_pool, user_pool_client=user_pool_client
+    )
+
+    integrations = _create_integrations(http_api, functions)
+
+    # API Routes
+    for path, resource in get_api_resources().items():
+        for method, api_function in resource.methods.items():
+            if not api_function.is_lambda:
+                continue
+            authorized = api_function.authorization == "COGNITO_USER_POOLS"
+            # every route is served by the router function in the "router" Lambda deployment
+            function_name = "router" if lambda_deployment == "router" else api_function.name
+            aws.apigatewayv2.Route(
+                regional_name(f"{resource.name}{method}Route"),
+                api_id=http_api.id,
+                route_key=f"{method} {path}",
+                target=pulumi.Output.concat("integrations/", integrations[function_name].id),
+                authorization_type="JWT" if authorized else "NONE",
+                authorizer_id=jwt_authorizer.id if authorized else None,
+                opts=pulumi.ResourceOptions(parent=http_api),
+            )
+
+    create_lambda_permissions(http_api)
+
+    # API GW Stage, every change of the routes is deployed
+    stage = aws.apigatewayv2.Stage(
+        regional_name(f"{http_api_name}Stage"),
+        api_id=http_api.id,
+        name=config.get("stageName"),
+        auto_deploy=True,
+        opts=pulumi.ResourceOptions(parent=http_api),
+    )
+
+    return http_api.id, stage.name, stage.invoke_url
+
+
+def create_http_api_domain(
+    domain_name: str,
+    certificate_arn: str,
+    api_id: pulumi.Input[str],
+    stage_name: pulumi.Input[str],
+) -> Tuple[pulumi.Output[str], pulumi.Output[str]]:
+    """Regional custom domain of the API stage, returns the target name and hosted zone of its DNS records"""
+    domain = aws.apigatewayv2.DomainName(
+        regional_name("workshopServerlessJukeBoxDomain"),
+        domain_name=domain_name,
+        domain_name_configuration=aws.apigatewayv2.DomainNameDomainNameConfigurationArgs(
+            certificate_arn=certificate_arn,
+            endpoint_type="REGIONAL",
+            security_policy="TLS_1_2",
+        ),
+        opts=regional_opts(),
+    )
+    aws.apigatewayv2.ApiMapping(
+        regional_name("workshopServerlessJukeBoxApiMapping"),
+        api_id=api_id,
+        stage=stage_name,
+        domain_name=domain.domain_name,
+        opts=pulumi.ResourceOptions(parent=domain),
+    )
+    configuration = domain.domain_name_configuration
+    return configuration.target_domain_name, configuration.hosted_zone_id
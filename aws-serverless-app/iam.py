@@ -1,45 +1,134 @@
-from typing import Sequence, Optional
+import hashlib
+import json
+import os.path
+from typing import Sequence, Optional, Dict, Any
 import pulumi
 from pulumi_aws.iam import Role, RoleInlinePolicyArgs
 from app_config import config
 
 
+project_name = pulumi.get_project()
+
+# Roles by the hash of their permissions, shared by every function with the same permissions
+_role_registry: Dict[str, Role] = {}
+# Permissions hash of every shared role name, a name must not be reused for other permissions
+_role_names: Dict[str, str] = {}
+# Computed documents of the inline policies by name, a name must always come with the same document
+_computed_policies: Dict[str, pulumi.Output[str]] = {}
+
+
 def _load_json_from_file(filename: str) -> str:
     with open(filename, "r", encoding="utf-8") as f:
         json_string = f.read()
     return json_string
 
 
-def _get_inline_policy_args(json_string: str) -> RoleInlinePolicyArgs:
-    policy = RoleInlinePolicyArgs(policy=json_string)
+def _get_inline_policy_args(json_string: str, name: str) -> RoleInlinePolicyArgs:
+    # The AWS provider ignores inline policies without a name
+    policy = RoleInlinePolicyArgs(name=name, policy=json_string)
     return policy
 
 
+def _canonical_json(json_string: str) -> Any:
+    return json.loads(json_string)
+
+
+def _policy_identity(policy: RoleInlinePolicyArgs) -> Dict[str, Any]:
+    # Policy documents that are Outputs (eg built from a table ARN) are not known
+    # while the program runs, such policies are identified by their name, which
+    # must not be used for another document
+    if isinstance(policy.policy, str):
+        return {"name": policy.name, "policy": _canonical_json(policy.policy)}
+    if not policy.name:
+        raise ValueError("Inline policies with a computed document need a name to be shared between roles")
+    if _computed_policies.setdefault(policy.name, policy.policy) is not policy.policy:
+        raise ValueError(f"Inline policy {policy.name} is used with different computed documents")
+    return {"name": policy.name, "policy": None}
+
+
+def role_key(
+    assume_role_policy_json: str,
+    policy_args: Sequence[RoleInlinePolicyArgs],
+    boundary_policy: Optional[str],
+) -> str:
+    """Canonical hash of a role: assume role document, inline policies and boundary policy"""
+    identities = sorted(
+        (_policy_identity(policy) for policy in policy_args),
+        key=lambda identity: json.dumps(identity, sort_keys=True),
+    )
+    canonical = json.dumps(
+        {
+            "assume_role_policy": _canonical_json(assume_role_policy_json),
+            "inline_policies": identities,
+            "boundary_policy": boundary_policy,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def shared_role_name(policy_args: Sequence[RoleInlinePolicyArgs]) -> str:
+    """Name of a shared role, from the names of its inline policies.
+
+    A change to the policy documents keeps the name, so the role is updated in
+    place instead of replaced.
+    """
+    names = sorted(policy.name or "" for policy in policy_args)
+    return f"{project_name}LambdaExecRole-{hashlib.sha256(json.dumps(names).encode()).hexdigest()[:12]}"
+
+
 def create_lambda_exec_role(
     name: str,
     assume_policy_filename: str,
     policy_filenames: Optional[list[str]] = None,
-    policy_args: Optional[Sequence[RoleInlinePolicyArgs]] = [],
+    policy_args: Optional[Sequence[RoleInlinePolicyArgs]] = None,
+    shared: bool = True,
 ) -> pulumi.Output[str]:
+    """Role ARN for a Lambda.
 
-    # policy_args: list[RoleInlinePolicyArgs] = []
+    Shared roles are deduplicated by their permissions: functions with the same
+    assume role document, inline policies and boundary policy get the same role.
+    They are named after their inline policy names and tagged with the hash of
+    their permissions. `name` is only used for dedicated (shared=False) roles.
+    """
+
+    policy_args = list(policy_args or [])
 
     if policy_filenames:
         for policy_file in policy_filenames:
             json_string = _load_json_from_file(policy_file)
-            policy_args.append(_get_inline_policy_args(json_string))
+            policy_name = os.path.splitext(os.path.basename(policy_file))[0]
+            policy_args.append(_get_inline_policy_args(json_string, policy_name))
 
-    return create_iam_role(
-        name,
-        assume_role_policy_json=_load_json_from_file(assume_policy_filename),
-        policy_args=policy_args
-    ).arn
+    assume_role_policy_json = _load_json_from_file(assume_policy_filename)
+    if not shared:
+        return create_iam_role(
+            name,
+            assume_role_policy_json=assume_role_policy_json,
+            policy_args=policy_args
+        ).arn
+
+    key = role_key(assume_role_policy_json, policy_args, config.get("boundaryPolicy"))
+    if key not in _role_registry:
+        role_name = shared_role_name(policy_args)
+        if _role_names.setdefault(role_name, key) != key:
+            raise ValueError(
+                f"Inline policies {sorted(policy.name for policy in policy_args)} are used with different documents"
+            )
+        _role_registry[key] = create_iam_role(
+            role_name,
+            assume_role_policy_json=assume_role_policy_json,
+            policy_args=policy_args,
+            tags={"PermissionsHash": key},
+        )
+    return _role_registry[key].arn
 
 
 def create_iam_role(
     name: str,
     assume_role_policy_json: str,
     policy_args: Optional[Sequence[RoleInlinePolicyArgs]] = None,
+    tags: Optional[Dict[str, str]] = None,
 ) -> Role:
 
     boundary_policy = config.get("boundaryPolicy")
@@ -49,6 +138,5 @@ def create_iam_role(
         assume_role_policy=assume_role_policy_json,
         inline_policies=policy_args,
         permissions_boundary=boundary_policy,
+        tags=tags,
     )
-
-
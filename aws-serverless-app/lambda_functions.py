@@ -1,12 +1,31 @@
-from typing import Optional, Mapping
+from __future__ import annotations
+import os
+from typing import Optional, Mapping, Sequence, Dict
 import pulumi
 import pulumi_aws as aws
 from app_config import config
 from iam import create_lambda_exec_role
+from lambda_packaging import build_archive, build_archives, archive_hash, assemble_router_source
+from tracing import tracing_settings, XRAY_POLICY_FILENAME, XRAY_TRACING_VARIABLE
+from regions import regional_name, regional_opts
 
 
 project_name = pulumi.get_project()
 lambda_roles_path = config.require("lambdasRolesPath")
+lambda_build_cache_path = config.get("lambdaBuildCachePath") or ".lambda-build"
+
+
+def build_lambda_archives(source_dirs: Sequence[str]) -> Dict[str, str]:
+    # Builds changed function directories in parallel, so that the following
+    # create_lambda_function calls are cache hits
+    return build_archives(source_dirs, cache_path=lambda_build_cache_path)
+
+
+def assemble_router_package(routes: Sequence[Dict[str, str]], router_dir: str) -> str:
+    # The router package is laid out in the build cache and packaged like any function directory
+    return assemble_router_source(
+        routes, router_dir=router_dir, target_dir=os.path.join(lambda_build_cache_path, "src", "router")
+    )
 
 
 def create_lambda_dynamodb_policy(name: str, dynamodb_table_arn: pulumi.Output[str]) -> aws.iam.RoleInlinePolicyArgs:
@@ -45,22 +64,73 @@ def create_lambda_function(
     role_arn: Optional[str] = None,
     environment: Mapping[str, str] = None,
     description: Optional[str] = None,
+    memory_size: Optional[int] = None,
+    architecture: Optional[str] = None,
+    ephemeral_storage: Optional[int] = None,
+    reserved_concurrency: Optional[int] = None,
+    publish: bool = False,
+    policy_filenames: Optional[list[str]] = None,
+    dedicated_role: bool = False,
 ) -> aws.lambda_.Function:
 
+    if tracing_settings.enabled:
+        # Active tracing, the handlers wrap the AWS SDK with the X-Ray SDK
+        environment = {**(environment or {}), XRAY_TRACING_VARIABLE: "1"}
+        policy_filenames = [*(policy_filenames or []), f"{lambda_roles_path}/{XRAY_POLICY_FILENAME}"]
+
     if role_arn is None:
-        role_arn = create_lambda_exec_role(f"{project_name}Lambda{name}ExecRole",
+        role_arn = create_lambda_exec_role(regional_name(f"{project_name}Lambda{name}ExecRole"),
                                            assume_policy_filename=f"{lambda_roles_path}/execution_role.json",
-                                           policy_args=lambda_policies)
+                                           policy_filenames=policy_filenames,
+                                           policy_args=lambda_policies,
+                                           shared=not dedicated_role)
+
+    # A function source directory is packaged into a reproducible archive
+    if os.path.isdir(filename):
+        filename = build_archive(filename, cache_path=lambda_build_cache_path)
 
     asset_archive = pulumi.FileArchive(filename)
     func = aws.lambda_.Function(
-        name,
+        regional_name(name),
         runtime=runtime,
         role=role_arn,
         handler=handler,
         code=asset_archive,
+        source_code_hash=archive_hash(filename),
         timeout=timeout,
         description=description,
         environment={"variables": environment},
+        memory_size=memory_size,
+        architectures=[architecture] if architecture else None,
+        ephemeral_storage=aws.lambda_.FunctionEphemeralStorageArgs(size=ephemeral_storage) if ephemeral_storage else None,
+        reserved_concurrent_executions=reserved_concurrency,
+        publish=publish,
+        tracing_config=aws.lambda_.FunctionTracingConfigArgs(mode="Active") if tracing_settings.enabled else None,
+        opts=regional_opts(),
     )
     return func
+
+
+def create_lambda_alias(
+    func: aws.lambda_.Function,
+    name: str,
+    alias_name: str,
+    provisioned_concurrency: Optional[int] = None,
+) -> aws.lambda_.Alias:
+    # The alias follows the last published version of the function
+    alias = aws.lambda_.Alias(
+        regional_name(f"{name}Alias"),
+        name=alias_name,
+        function_name=func.name,
+        function_version=func.version,
+        opts=pulumi.ResourceOptions(parent=func),
+    )
+    if provisioned_concurrency:
+        aws.lambda_.ProvisionedConcurrencyConfig(
+            regional_name(f"{name}ProvisionedConcurrency"),
+            function_name=func.name,
+            qualifier=alias.name,
+            provisioned_concurrent_executions=provisioned_concurrency,
+            opts=pulumi.ResourceOptions(parent=alias),
+        )
+    return alias
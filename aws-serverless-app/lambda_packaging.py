@@ -0,0 +1,298 @@
+"""Content-addressed, reproducible Lambda packaging.
+
+Every function source directory is hashed (sources + lockfile), the hash is used
+as a key in a local build cache and only directories whose hash is not cached yet
+are rebuilt. Archives are byte-reproducible: entries are sorted and every entry
+gets the same timestamp and permissions, so Pulumi only sees new code when the
+sources have actually changed. Archives built without npm install (`--no-install`,
+the benchmark's and the tests' builds) are cached apart from the deployable ones.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+
+# Bump to invalidate every cached archive when the archive layout changes
+BUILD_FORMAT_VERSION = "2"
+DEFAULT_CACHE_PATH = ".lambda-build"
+# Cache subdirectory of the archives built without their dependencies
+SOURCES_ONLY_DIR = "sources-only"
+
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_EXCLUDED_DIRS = {"node_modules", ".git", "__pycache__"}
+_EXCLUDED_SUFFIXES = (".zip",)
+_LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json")
+
+
+def _iter_source_files(source_dir: str) -> Iterator[Tuple[str, str]]:
+    """Yield (relative path, absolute path) of the sources, sorted by relative path."""
+    found = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = [d for d in dirs if d not in _EXCLUDED_DIRS]
+        for filename in files:
+            if filename.endswith(_EXCLUDED_SUFFIXES):
+                continue
+            abs_path = os.path.join(root, filename)
+            rel_path = os.path.relpath(abs_path, source_dir).replace(os.sep, "/")
+            found.append((rel_path, abs_path))
+    yield from sorted(found)
+
+
+def source_hash(source_dir: str) -> str:
+    """Hash the sources and the lockfile of a function directory."""
+    digest = hashlib.sha256()
+    digest.update(f"format:{BUILD_FORMAT_VERSION}\0".encode())
+    for rel_path, abs_path in _iter_source_files(source_dir):
+        digest.update(rel_path.encode() + b"\0")
+        with open(abs_path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    # The lockfile is part of the sources above; hash it again under its own key
+    # so that a missing lockfile and an empty one never collide.
+    for lockfile in _LOCKFILES:
+        lock_path = os.path.join(source_dir, lockfile)
+        if os.path.isfile(lock_path):
+            with open(lock_path, "rb") as f:
+                digest.update(f"lock:{lockfile}\0".encode() + f.read())
+    return digest.hexdigest()
+
+
+def archive_hash(archive_path: str) -> str:
+    """Base64-encoded SHA256 of an archive, as expected by Lambda's `source_code_hash`."""
+    with open(archive_path, "rb") as f:
+        return base64.b64encode(hashlib.sha256(f.read()).digest()).decode()
+
+
+def cached_archive_path(
+    source_dir: str,
+    cache_path: str = DEFAULT_CACHE_PATH,
+    install_dependencies: bool = True,
+) -> str:
+    name = os.path.basename(os.path.normpath(source_dir))
+    archive_dir = os.path.join(cache_path, name)
+    if not install_dependencies:
+        archive_dir = os.path.join(archive_dir, SOURCES_ONLY_DIR)
+    return os.path.join(archive_dir, f"{source_hash(source_dir)}.zip")
+
+
+def _install_dependencies(build_dir: str) -> None:
+    package_path = os.path.join(build_dir, "package.json")
+    if not os.path.isfile(package_path):
+        return
+    has_lockfile = any(os.path.isfile(os.path.join(build_dir, lock)) for lock in _LOCKFILES)
+    command = ["npm", "ci" if has_lockfile else "install", "--omit=dev", "--no-audit", "--no-fund"]
+    subprocess.run(command, cwd=build_dir, check=True, stdout=subprocess.DEVNULL)
+    with open(package_path, "r", encoding="utf-8") as f:
+        dependencies = json.load(f).get("dependencies")
+    # An archive without its dependencies must never be cached as a deployable one
+    if dependencies and not os.path.isdir(os.path.join(build_dir, "node_modules")):
+        raise RuntimeError(f"{' '.join(command)} installed no node_modules in {build_dir}")
+
+
+def _write_reproducible_zip(build_dir: str, archive_path: str) -> None:
+    entries = []
+    for root, dirs, files in os.walk(build_dir):
+        dirs[:] = [d for d in dirs if d not in (".git", "__pycache__")]
+        for filename in files:
+            abs_path = os.path.join(root, filename)
+            if os.path.islink(abs_path) and not os.path.exists(abs_path):
+                continue
+            rel_path = os.path.relpath(abs_path, build_dir).replace(os.sep, "/")
+            entries.append((rel_path, abs_path))
+
+    with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for rel_path, abs_path in sorted(entries):
+            info = zipfile.ZipInfo(rel_path, date_time=_ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 3  # Unix, so that external_attr is honoured
+            mode = 0o755 if os.access(abs_path, os.X_OK) else 0o644
+            info.external_attr = (0o100000 | mode) << 16
+            with open(abs_path, "rb") as f:
+                archive.writestr(info, f.read(), compress_type=zipfile.ZIP_DEFLATED, compresslevel=9)
+
+
+def _prune_stale_archives(archive_path: str) -> None:
+    cache_dir = os.path.dirname(archive_path)
+    for filename in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, filename)
+        if path != archive_path and filename.endswith(".zip"):
+            os.remove(path)
+
+
+def prepare_build_dir(source_dir: str, build_dir: str, install_dependencies: bool = True) -> str:
+    """Copy the sources of a function directory to build_dir and install its dependencies."""
+    os.makedirs(build_dir)
+    for rel_path, abs_path in _iter_source_files(source_dir):
+        dst = os.path.join(build_dir, rel_path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(abs_path, dst)
+        shutil.copymode(abs_path, dst)
+    if install_dependencies:
+        _install_dependencies(build_dir)
+    return build_dir
+
+
+def build_archive(
+    source_dir: str,
+    cache_path: str = DEFAULT_CACHE_PATH,
+    install_dependencies: bool = True,
+) -> str:
+    """Build (or reuse from the cache) the archive of a single function directory."""
+    archive_path = cached_archive_path(source_dir, cache_path, install_dependencies)
+    if os.path.isfile(archive_path):
+        return archive_path
+
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="lambda-build-") as tmp_dir:
+        build_dir = os.path.join(tmp_dir, "src")
+        prepare_build_dir(source_dir, build_dir, install_dependencies)
+
+        tmp_archive = os.path.join(tmp_dir, "archive.zip")
+        _write_reproducible_zip(build_dir, tmp_archive)
+        shutil.move(tmp_archive, archive_path)
+
+    _prune_stale_archives(archive_path)
+    return archive_path
+
+
+def build_archives(
+    source_dirs: Sequence[str],
+    cache_path: str = DEFAULT_CACHE_PATH,
+    install_dependencies: bool = True,
+    max_workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """Build the archives of several function directories.
+
+    Cache hits are resolved in-process, only the changed directories are sent
+    to a process pool. Returns a mapping of source directory to archive path.
+    """
+    archives: Dict[str, str] = {}
+    stale = []
+    for source_dir in source_dirs:
+        archive_path = cached_archive_path(source_dir, cache_path, install_dependencies)
+        if os.path.isfile(archive_path):
+            archives[source_dir] = archive_path
+        else:
+            stale.append(source_dir)
+
+    if len(stale) == 1:
+        archives[stale[0]] = build_archive(stale[0], cache_path, install_dependencies)
+    elif stale:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                source_dir: executor.submit(build_archive, source_dir, cache_path, install_dependencies)
+                for source_dir in stale
+            }
+            for source_dir, future in futures.items():
+                archives[source_dir] = future.result()
+    return archives
+
+
+def _merge_dependencies(package_files: Sequence[str]) -> Dict[str, str]:
+    dependencies: Dict[str, str] = {}
+    for package_file in package_files:
+        with open(package_file, "r", encoding="utf-8") as f:
+            package = json.load(f)
+        for name, version in (package.get("dependencies") or {}).items():
+            if dependencies.setdefault(name, version) != version:
+                raise ValueError(
+                    f"{package_file}: {name}@{version} conflicts with {name}@{dependencies[name]} of another function"
+                )
+    return dict(sorted(dependencies.items()))
+
+
+def assemble_router_source(
+    routes: Sequence[Dict[str, str]],
+    router_dir: str,
+    target_dir: str,
+) -> str:
+    """Lay out the single-function (router) package of several handlers.
+
+    `routes` are {"method", "path", "handler", "source_dir"} entries, `handler` is
+    "<module>.<export>" inside `source_dir`. The router sources are copied to
+    target_dir, every handler directory to target_dir/handlers/<name>/, and the
+    route table is written to routes.json. The handlers share one node_modules,
+    installed from the union of their dependencies.
+    """
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir)
+    os.makedirs(target_dir)
+    for rel_path, abs_path in _iter_source_files(router_dir):
+        dst = os.path.join(target_dir, rel_path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(abs_path, dst)
+
+    source_dirs = sorted({route["source_dir"] for route in routes})
+    for source_dir in source_dirs:
+        name = os.path.basename(os.path.normpath(source_dir))
+        for rel_path, abs_path in _iter_source_files(source_dir):
+            # Dependencies are installed once for the whole package
+            if rel_path in ("package.json", *_LOCKFILES):
+                continue
+            dst = os.path.join(target_dir, "handlers", name, rel_path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(abs_path, dst)
+
+    route_table = []
+    for route in routes:
+        module, export = route["handler"].rsplit(".", 1)
+        name = os.path.basename(os.path.normpath(route["source_dir"]))
+        route_table.append({
+            "method": route["method"],
+            "path": route["path"],
+            "module": f"./handlers/{name}/{module}",
+            "export": export,
+        })
+    with open(os.path.join(target_dir, "routes.json"), "w", encoding="utf-8") as f:
+        json.dump(route_table, f, indent=2)
+
+    package = {
+        "name": "todo-router",
+        "version": "1.0.0",
+        "private": True,
+        "main": "app.js",
+        "dependencies": _merge_dependencies(
+            [os.path.join(source_dir, "package.json") for source_dir in source_dirs
+             if os.path.isfile(os.path.join(source_dir, "package.json"))]
+        ),
+    }
+    with open(os.path.join(target_dir, "package.json"), "w", encoding="utf-8") as f:
+        json.dump(package, f, indent=2)
+    return target_dir
+
+
+def find_function_dirs(backend_src_path: str) -> list[str]:
+    """Function directories are the direct children of the backend sources with a package.json."""
+    return sorted(
+        os.path.join(backend_src_path, name)
+        for name in os.listdir(backend_src_path)
+        if os.path.isfile(os.path.join(backend_src_path, name, "package.json"))
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build reproducible Lambda archives")
+    parser.add_argument("source_dirs", nargs="*", help="function directories (default: all in --backend)")
+    parser.add_argument("--backend", default="../backend-src", help="backend sources root")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="build cache directory")
+    parser.add_argument("--no-install", action="store_true", help="do not run npm")
+    args = parser.parse_args(argv)
+
+    source_dirs = args.source_dirs or find_function_dirs(args.backend)
+    archives = build_archives(source_dirs, args.cache, install_dependencies=not args.no_install)
+    for source_dir in source_dirs:
+        print(f"{source_dir} -> {archives[source_dir]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
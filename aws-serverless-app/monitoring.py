@@ -0,0 +1,368 @@
+"""CloudWatch dashboard and alarms of the API Lambdas and the todo table.
+
+Every handler emits embedded metrics (namespace `TodoApp`) besides its own
+counts: `Duration`, `ColdStart`, `ConsumedCapacity` (DynamoDB
+ReturnConsumedCapacity of all its calls) and `ResponseSize`. They are
+published per route (`Service` dimension) and per function, the latter so
+that the router's alarms add up its routes.
+
+Alarms are per deployed function (p99 duration, throttles, error rate) and
+for the table (p99 latency, throttles, system errors). The thresholds are
+the `monitoring` stack config, function thresholds with a "default" entry
+and entries by function name like `lambdaSettings`:
+
+    monitoring:
+      alarm_actions: ["arn:aws:sns:eu-west-1:123456789012:todo-alarms"]
+      functions:
+        default: {error_rate: 5}
+        getAllTodo: {p99_duration_ms: 800}
+      table: {p99_latency_ms: 50}
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from typing import Any, Dict, List, Optional
+import pulumi
+import pulumi_aws as aws
+from pydantic import BaseModel, ValidationError, validator
+from app_config import config
+from api import APIResourceFunction, get_api_resources
+from regions import current_region, regional_name, regional_opts
+
+
+project_name = pulumi.get_project()
+METRICS_NAMESPACE = "TodoApp"  # see metrics.setNamespace in backend-src
+# Default dimensions of embedded metrics in Lambda, LogGroup and ServiceName are the function name
+EMF_SERVICE_TYPE = "AWS::Lambda::Function"
+# Item operations of the handlers, for the table latency and error alarms
+TABLE_OPERATIONS = ["GetItem", "Query", "PutItem", "UpdateItem", "DeleteItem", "BatchGetItem", "BatchWriteItem"]
+
+
+class FunctionAlarmThresholds(BaseModel):
+    p99_duration_ms: Optional[int]  # defaults to 80% of the function timeout
+    throttles: int = 1  # throttled invocations per period
+    error_rate: float = 5.0  # percent of invocations that failed or answered with an error
+
+
+class TableAlarmThresholds(BaseModel):
+    p99_latency_ms: int = 100  # slowest p99 SuccessfulRequestLatency of TABLE_OPERATIONS
+    throttles: int = 1  # read and write throttle events per period
+    system_errors: int = 1  # requests that failed with a DynamoDB 500 per period
+
+
+class MonitoringSettings(BaseModel):
+    enabled: bool = True
+    period: int = 60  # seconds
+    evaluation_periods: int = 5
+    datapoints_to_alarm: int = 3  # breaching periods out of evaluation_periods
+    alarm_actions: List[str] = []  # eg SNS topic ARNs, notified on ALARM and OK
+    functions: Dict[str, Dict[str, Any]] = {}
+    table: TableAlarmThresholds = TableAlarmThresholds()
+
+    @validator("period")
+    def _period_validator(cls, period: int) -> int:
+        if period < 60 or period % 60:
+            raise ValueError("period must be a multiple of 60 seconds")
+        return period
+
+    @validator("datapoints_to_alarm")
+    def _datapoints_validator(cls, datapoints: int, values) -> int:
+        if not 1 <= datapoints <= values.get("evaluation_periods", datapoints):
+            raise ValueError("datapoints_to_alarm must be between 1 and evaluation_periods")
+        return datapoints
+
+    @validator("functions")
+    def _functions_validator(cls, functions: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        for thresholds in functions.values():
+            FunctionAlarmThresholds(**thresholds)
+        return functions
+
+    def function_thresholds(self, api_function: APIResourceFunction) -> FunctionAlarmThresholds:
+        thresholds = FunctionAlarmThresholds(**{
+            **self.functions.get("default", {}),
+            **self.functions.get(api_function.name, {}),
+        })
+        if thresholds.p99_duration_ms is None:
+            thresholds.p99_duration_ms = int(api_function.timeout * 1000 * 0.8)
+        return thresholds
+
+
+def get_monitoring_settings() -> MonitoringSettings:
+    """`monitoring` stack config"""
+    try:
+        return MonitoringSettings(**(config.get_object("monitoring") or {}))
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
+
+
+def function_routes(api_function: APIResourceFunction) -> List[str]:
+    """`Service` dimensions of the handlers a deployed function runs: its routes, or itself for consumers"""
+    routes = [
+        route.name
+        for resource in get_api_resources().values()
+        for route in resource.methods.values()
+        if route.is_lambda and route.lambda_ is api_function.lambda_
+    ]
+    return routes or [api_function.name]
+
+
+def _emf_dimensions(function_name: str, service: Optional[str] = None) -> Dict[str, str]:
+    dimensions = {"LogGroup": function_name, "ServiceName": function_name, "ServiceType": EMF_SERVICE_TYPE}
+    if service:
+        dimensions["Service"] = service
+    return dimensions
+
+
+def _metric_query(
+    query_id: str,
+    namespace: str,
+    metric_name: str,
+    dimensions: Dict[str, Any],
+    stat: str,
+    period: int,
+    return_data: bool = False,
+) -> aws.cloudwatch.MetricAlarmMetricQueryArgs:
+    return aws.cloudwatch.MetricAlarmMetricQueryArgs(
+        id=query_id,
+        return_data=return_data,
+        metric=aws.cloudwatch.MetricAlarmMetricQueryMetricArgs(
+            namespace=namespace,
+            metric_name=metric_name,
+            dimensions=dimensions,
+            stat=stat,
+            period=period,
+        ),
+    )
+
+
+def _expression_query(query_id: str, expression: str, label: str) -> aws.cloudwatch.MetricAlarmMetricQueryArgs:
+    return aws.cloudwatch.MetricAlarmMetricQueryArgs(id=query_id, expression=expression, label=label, return_data=True)
+
+
+def _create_alarm(
+    name: str,
+    description: str,
+    threshold: float,
+    comparison_operator: str,
+    metric_queries: List[aws.cloudwatch.MetricAlarmMetricQueryArgs],
+    settings: MonitoringSettings,
+    parent: pulumi.Resource,
+) -> aws.cloudwatch.MetricAlarm:
+    return aws.cloudwatch.MetricAlarm(
+        regional_name(name),
+        alarm_description=description,
+        comparison_operator=comparison_operator,
+        threshold=threshold,
+        evaluation_periods=settings.evaluation_periods,
+        datapoints_to_alarm=settings.datapoints_to_alarm,
+        metric_queries=metric_queries,
+        # no traffic is no failure
+        treat_missing_data="notBreaching",
+        alarm_actions=settings.alarm_actions,
+        ok_actions=settings.alarm_actions,
+        # In the current region, the table they watch has a replica in every region
+        opts=regional_opts(parent=parent),
+    )
+
+
+def _create_function_alarms(api_function: APIResourceFunction, settings: MonitoringSettings) -> List[aws.cloudwatch.MetricAlarm]:
+    thresholds = settings.function_thresholds(api_function)
+    function_name = api_function.lambda_.name
+    lambda_dimensions = {"FunctionName": function_name}
+    period = settings.period
+    name = api_function.name
+
+    duration = _create_alarm(
+        f"{name}P99DurationAlarm",
+        f"{name}: p99 duration above {thresholds.p99_duration_ms} ms",
+        thresholds.p99_duration_ms,
+        "GreaterThanThreshold",
+        [_metric_query("duration", "AWS/Lambda", "Duration", lambda_dimensions, "p99", period, return_data=True)],
+        settings,
+        api_function.lambda_,
+    )
+    throttles = _create_alarm(
+        f"{name}ThrottlesAlarm",
+        f"{name}: {thresholds.throttles} or more throttled invocations",
+        thresholds.throttles,
+        "GreaterThanOrEqualToThreshold",
+        [_metric_query("throttles", "AWS/Lambda", "Throttles", lambda_dimensions, "Sum", period, return_data=True)],
+        settings,
+        api_function.lambda_,
+    )
+    # Handlers answer most failures with an error response, which Lambda counts as a success
+    error_rate = _create_alarm(
+        f"{name}ErrorRateAlarm",
+        f"{name}: more than {thresholds.error_rate}% of the invocations failed",
+        thresholds.error_rate,
+        "GreaterThanThreshold",
+        [
+            _metric_query("invocations", "AWS/Lambda", "Invocations", lambda_dimensions, "Sum", period),
+            _metric_query("errors", "AWS/Lambda", "Errors", lambda_dimensions, "Sum", period),
+            _metric_query("responses", METRICS_NAMESPACE, "Error", _emf_dimensions(function_name), "Sum", period),
+            _expression_query(
+                "error_rate",
+                "100 * (FILL(errors, 0) + FILL(responses, 0)) / invocations",
+                "Error rate (%)",
+            ),
+        ],
+        settings,
+        api_function.lambda_,
+    )
+    return [duration, throttles, error_rate]
+
+
+def _create_table_alarms(table: aws.dynamodb.Table, settings: MonitoringSettings) -> List[aws.cloudwatch.MetricAlarm]:
+    thresholds = settings.table
+    period = settings.period
+    table_dimensions = {"TableName": table.name}
+
+    def operation_queries(metric_name: str, stat: str) -> List[aws.cloudwatch.MetricAlarmMetricQueryArgs]:
+        return [
+            _metric_query(f"op{i}", "AWS/DynamoDB", metric_name, {**table_dimensions, "Operation": operation}, stat, period)
+            for i, operation in enumerate(TABLE_OPERATIONS)
+        ]
+
+    operations = ", ".join(f"op{i}" for i in range(len(TABLE_OPERATIONS)))
+    latency = _create_alarm(
+        "todoTableP99LatencyAlarm",
+        f"todo table: p99 request latency above {thresholds.p99_latency_ms} ms",
+        thresholds.p99_latency_ms,
+        "GreaterThanThreshold",
+        [*operation_queries("SuccessfulRequestLatency", "p99"),
+         _expression_query("latency", f"MAX([{operations}])", "Slowest p99 latency (ms)")],
+        settings,
+        table,
+    )
+    throttles = _create_alarm(
+        "todoTableThrottlesAlarm",
+        f"todo table: {thresholds.throttles} or more throttle events",
+        thresholds.throttles,
+        "GreaterThanOrEqualToThreshold",
+        [
+            _metric_query("reads", "AWS/DynamoDB", "ReadThrottleEvents", table_dimensions, "Sum", period),
+            _metric_query("writes", "AWS/DynamoDB", "WriteThrottleEvents", table_dimensions, "Sum", period),
+            _expression_query("throttles", "FILL(reads, 0) + FILL(writes, 0)", "Throttle events"),
+        ],
+        settings,
+        table,
+    )
+    system_errors = _create_alarm(
+        "todoTableSystemErrorsAlarm",
+        f"todo table: {thresholds.system_errors} or more system errors",
+        thresholds.system_errors,
+        "GreaterThanOrEqualToThreshold",
+        [*operation_queries("SystemErrors", "Sum"),
+         _expression_query("errors", f"SUM([{operations}])", "System errors")],
+        settings,
+        table,
+    )
+    return [latency, throttles, system_errors]
+
+
+def _dashboard_body(
+    region: str,
+    functions: List[Dict[str, Any]],
+    table_name: str,
+    alarm_arns: List[str],
+) -> str:
+    def widget(title: str, metrics: List[List[Any]], width: int = 8, **properties) -> Dict[str, Any]:
+        return {
+            "type": "metric",
+            "width": width,
+            "height": 6,
+            "properties": {"title": title, "region": region, "metrics": metrics, "view": "timeSeries", **properties},
+        }
+
+    def route_metrics(metric_name: str, stat: str) -> List[List[Any]]:
+        return [
+            [METRICS_NAMESPACE, metric_name, *[v for kv in _emf_dimensions(f["name"], route).items() for v in kv],
+             {"stat": stat, "label": route}]
+            for f in functions
+            for route in f["routes"]
+        ]
+
+    def table_metrics(metric_name: str, stat: str, operations: bool = False) -> List[List[Any]]:
+        if operations:
+            return [["AWS/DynamoDB", metric_name, "TableName", table_name, "Operation", operation,
+                     {"stat": stat, "label": operation}] for operation in TABLE_OPERATIONS]
+        return [["AWS/DynamoDB", metric_name, "TableName", table_name, {"stat": stat}]]
+
+    widgets = [
+        {"type": "alarm", "width": 24, "height": 4, "properties": {"title": "Alarms", "alarms": alarm_arns}},
+        # Routes, from the embedded metrics of the handlers
+        widget("Route duration p99 (ms)", route_metrics("Duration", "p99")),
+        widget("Route cold starts", route_metrics("ColdStart", "Sum")),
+        widget("Route errors", route_metrics("Error", "Sum")),
+        widget("Route consumed capacity", route_metrics("ConsumedCapacity", "Sum")),
+        widget("Route response size p99 (bytes)", route_metrics("ResponseSize", "p99")),
+        widget("Route response size avg (bytes)", route_metrics("ResponseSize", "Average")),
+    ]
+    # Functions, from the Lambda metrics
+    for f in functions:
+        dimensions = ["FunctionName", f["name"]]
+        widgets += [
+            widget(f"{f['label']} duration (ms)", [
+                ["AWS/Lambda", "Duration", *dimensions, {"stat": "p50"}],
+                ["AWS/Lambda", "Duration", *dimensions, {"stat": "p99"}],
+            ]),
+            widget(f"{f['label']} invocations", [
+                ["AWS/Lambda", "Invocations", *dimensions, {"stat": "Sum"}],
+                ["AWS/Lambda", "Errors", *dimensions, {"stat": "Sum"}],
+                ["AWS/Lambda", "Throttles", *dimensions, {"stat": "Sum"}],
+            ]),
+            widget(f"{f['label']} concurrency", [
+                ["AWS/Lambda", "ConcurrentExecutions", *dimensions, {"stat": "Maximum"}],
+            ]),
+        ]
+    # Table
+    widgets += [
+        widget("Table consumed capacity", [
+            *table_metrics("ConsumedReadCapacityUnits", "Sum"),
+            *table_metrics("ConsumedWriteCapacityUnits", "Sum"),
+        ]),
+        widget("Table throttle events", [
+            *table_metrics("ReadThrottleEvents", "Sum"),
+            *table_metrics("WriteThrottleEvents", "Sum"),
+        ]),
+        widget("Table latency p99 (ms)", table_metrics("SuccessfulRequestLatency", "p99", operations=True)),
+    ]
+    return json.dumps({"widgets": widgets})
+
+
+def create_monitoring(
+    functions: List[APIResourceFunction],
+    table: aws.dynamodb.Table,
+    settings: MonitoringSettings,
+) -> Optional[aws.cloudwatch.Dashboard]:
+    """Alarms of every deployed function of the API routes and of the table, and their dashboard"""
+    if not settings.enabled:
+        return None
+
+    alarms = [alarm for api_function in functions for alarm in _create_function_alarms(api_function, settings)]
+    alarms += _create_table_alarms(table, settings)
+
+    region = current_region().name
+    routes = [function_routes(api_function) for api_function in functions]
+    body = pulumi.Output.all(
+        [api_function.lambda_.name for api_function in functions],
+        table.name,
+        [alarm.arn for alarm in alarms],
+    ).apply(lambda args: _dashboard_body(
+        region,
+        [
+            {"label": api_function.name, "name": function_name, "routes": function_routes_}
+            for api_function, function_name, function_routes_ in zip(functions, args[0], routes)
+        ],
+        args[1],
+        args[2],
+    ))
+    return aws.cloudwatch.Dashboard(
+        regional_name(f"{project_name}Dashboard"),
+        # Dashboard names are global to the account
+        dashboard_name=regional_name(f"{project_name}-{pulumi.get_stack()}"),
+        dashboard_body=body,
+    )
@@ -0,0 +1,166 @@
+from typing import Dict, Any, Mapping
+import pulumi
+from api import APIResourceDescription, APIResourceFunction, cors_headers
+from queues import (queue_integration_uri, SQS_CONTENT_TYPE, SEND_MESSAGE_TEMPLATE, QUEUED_STATUS_CODE,
+                    QUEUED_RESPONSE_TEMPLATE, QUEUE_ERROR_STATUS_CODE, QUEUE_ERROR_PATTERN, QUEUE_ERROR_TEMPLATE)
+
+
+OPENAPI_VERSION = "3.0.1"
+COGNITO_SECURITY_SCHEME = "CognitoAuthorizer"
+REQUEST_VALIDATOR = "params"
+_parameter_locations = {"querystring": "query", "header": "header", "path": "path"}
+
+
+def _path_parameters(path: str) -> list[Dict[str, Any]]:
+    return [
+        {"name": part[1:-1], "in": "path", "required": True, "schema": {"type": "string"}}
+        for part in path.split("/")
+        if part.startswith("{") and part.endswith("}")
+    ]
+
+
+def _mock_operation() -> Dict[str, Any]:
+    return {
+        "responses": {
+            "200": {
+                "description": "200 response",
+                "headers": {header: {"schema": {"type": "string"}} for header in cors_headers},
+            }
+        },
+        "x-amazon-apigateway-integration": {
+            "type": "mock",
+            "requestTemplates": {"application/json": '{\n  "statusCode" : 200\n}\n'},
+            "passthroughBehavior": "when_no_match",
+            "responses": {
+                "default": {
+                    "statusCode": "200",
+                    "responseParameters": {
+                        f"method.response.header.{header}": value for header, value in cors_headers.items()
+                    },
+                    "responseTemplates": {"application/json": "{}\n"},
+                }
+            },
+        },
+    }
+
+
+def _lambda_operation(api_function: APIResourceFunction) -> Dict[str, Any]:
+    operation: Dict[str, Any] = {
+        "responses": {"200": {"description": "200 response"}},
+        "x-amazon-apigateway-integration": {
+            "type": api_function.integration_type.lower(),
+            "httpMethod": api_function.integration_method,  # For Lambdas it is always POST
+            "uri": api_function.invoke_arn,
+            "passthroughBehavior": "when_no_match",
+        },
+    }
+    if api_function.authorization == "COGNITO_USER_POOLS":
+        operation["security"] = [{COGNITO_SECURITY_SCHEME: []}]
+    if api_function.cache and api_function.cache.enabled:
+        operation["x-amazon-apigateway-integration"]["cacheKeyParameters"] = api_function.cache.key_parameters
+    if api_function.request_parameters:
+        operation["parameters"] = _request_parameters(api_function.request_parameters)
+        operation["x-amazon-apigateway-request-validator"] = REQUEST_VALIDATOR
+    return operation
+
+
+def _queue_operation(api_function: APIResourceFunction) -> Dict[str, Any]:
+    cors_origin = "Access-Control-Allow-Origin"
+    response_parameters = {f"method.response.header.{cors_origin}": cors_headers[cors_origin]}
+    operation: Dict[str, Any] = {
+        "responses": {
+            status_code: {
+                "description": f"{status_code} response",
+                "headers": {cors_origin: {"schema": {"type": "string"}}},
+            }
+            for status_code in (QUEUED_STATUS_CODE, QUEUE_ERROR_STATUS_CODE)
+        },
+        "x-amazon-apigateway-integration": {
+            "type": "aws",
+            "httpMethod": "POST",
+            "uri": queue_integration_uri(api_function.queue.queue_),
+            "credentials": api_function.queue.credentials_,
+            "requestParameters": {"integration.request.header.Content-Type": SQS_CONTENT_TYPE},
+            "requestTemplates": {"application/json": SEND_MESSAGE_TEMPLATE},
+            "passthroughBehavior": "never",
+            "responses": {
+                "default": {
+                    "statusCode": QUEUED_STATUS_CODE,
+                    "responseParameters": response_parameters,
+                    "responseTemplates": {"application/json": QUEUED_RESPONSE_TEMPLATE},
+                },
+                QUEUE_ERROR_PATTERN: {
+                    "statusCode": QUEUE_ERROR_STATUS_CODE,
+                    "responseParameters": response_parameters,
+                    "responseTemplates": {"application/json": QUEUE_ERROR_TEMPLATE},
+                },
+            },
+        },
+    }
+    if api_function.authorization == "COGNITO_USER_POOLS":
+        operation["security"] = [{COGNITO_SECURITY_SCHEME: []}]
+    return operation
+
+
+def _request_parameters(request_parameters: Mapping[str, bool]) -> list[Dict[str, Any]]:
+    parameters = []
+    for parameter, required in sorted(request_parameters.items()):
+        _, _, location, name = parameter.split(".", 3)
+        parameters.append({
+            "name": name,
+            "in": _parameter_locations[location],
+            "required": required,
+            "schema": {"type": "string"},
+        })
+    return parameters
+
+
+def build_openapi_spec(
+    title: str,
+    resources: Mapping[str, APIResourceDescription],
+    user_pool_arn: pulumi.Input[str],
+) -> pulumi.Output[str]:
+    """Compile the api resources into a single OpenAPI document with API Gateway extensions.
+
+    Lambda backed methods must already have their `lambda_` (and `alias_`) set, queue
+    backed methods their `queue_` and `credentials_`.
+    The document is serialized with sorted keys, so it can be hashed for redeployments.
+    """
+    paths: Dict[str, Any] = {}
+    for path, resource in resources.items():
+        operations: Dict[str, Any] = {}
+        for method, api_function in resource.methods.items():
+            if api_function.integration_type == "MOCK":
+                operations[method.lower()] = _mock_operation()
+            elif api_function.queue:
+                operations[method.lower()] = _queue_operation(api_function)
+            else:
+                operations[method.lower()] = _lambda_operation(api_function)
+        parameters = _path_parameters(path)
+        if parameters:
+            operations["parameters"] = parameters
+        paths[path] = operations
+
+    spec = {
+        "openapi": OPENAPI_VERSION,
+        "info": {"title": title, "version": "1.0"},
+        "paths": paths,
+        "x-amazon-apigateway-request-validators": {
+            REQUEST_VALIDATOR: {"validateRequestParameters": True, "validateRequestBody": False},
+        },
+        "components": {
+            "securitySchemes": {
+                COGNITO_SECURITY_SCHEME: {
+                    "type": "apiKey",
+                    "name": "Authorization",
+                    "in": "header",
+                    "x-amazon-apigateway-authtype": "cognito_user_pools",
+                    "x-amazon-apigateway-authorizer": {
+                        "type": "cognito_user_pools",
+                        "providerARNs": [user_pool_arn],
+                    },
+                }
+            }
+        },
+    }
+    return pulumi.Output.json_dumps(spec, sort_keys=True)
@@ -0,0 +1,122 @@
+"""SQS buffered writes: API Gateway -> SQS -> batching consumer Lambda -> DynamoDB.
+
+API Gateway sends the request body to the queue with a direct service (AWS)
+integration and answers 202 with the id of the new item. The consumer Lambda
+drains the queue in batches, reports partial batch failures and messages that
+keep failing move to a dead-letter queue.
+"""
+
+from __future__ import annotations
+
+from typing import Tuple
+import pulumi
+import pulumi_aws as aws
+from app_config import config
+from iam import create_iam_role
+from api import APIResourceQueue
+from regions import current_region, regional_name, regional_opts
+
+
+lambda_roles_path = config.require("lambdasRolesPath")
+
+# SendMessage through the SQS query API. The request id becomes the item id, so
+# the consumer writes the same item when a message is delivered twice.
+SQS_CONTENT_TYPE = "'application/x-www-form-urlencoded'"
+SEND_MESSAGE_TEMPLATE = (
+    "Action=SendMessage"
+    "&MessageBody=$util.urlEncode($input.body)"
+    "&MessageAttribute.1.Name=username"
+    "&MessageAttribute.1.Value.DataType=String"
+    "&MessageAttribute.1.Value.StringValue=$util.urlEncode($context.authorizer.claims['cognito:username'])"
+    "&MessageAttribute.2.Name=itemId"
+    "&MessageAttribute.2.Value.DataType=String"
+    "&MessageAttribute.2.Value.StringValue=$context.requestId"
+)
+QUEUED_STATUS_CODE = "202"
+QUEUED_RESPONSE_TEMPLATE = '{"id": "$context.requestId", "status": "queued"}'
+QUEUE_ERROR_STATUS_CODE = "500"
+QUEUE_ERROR_PATTERN = r"[45]\d{2}"
+QUEUE_ERROR_TEMPLATE = '{"message": "Error: the item could not be queued"}'
+
+
+def queue_integration_uri(queue: aws.sqs.Queue) -> pulumi.Output[str]:
+    region = current_region().name
+    account_id = aws.get_caller_identity().account_id
+    return pulumi.Output.concat("arn:aws:apigateway:", region, ":sqs:path/", account_id, "/", queue.name)
+
+
+def create_ingestion_queue(name: str, settings: APIResourceQueue) -> Tuple[aws.sqs.Queue, aws.sqs.Queue]:
+    dead_letter_queue = aws.sqs.Queue(
+        regional_name(f"{name}DeadLetterQueue"),
+        message_retention_seconds=settings.dlq_retention,
+        opts=regional_opts(),
+    )
+    queue = aws.sqs.Queue(
+        regional_name(f"{name}Queue"),
+        message_retention_seconds=settings.retention,
+        # AWS recommends six times the function timeout, plus the batching window
+        visibility_timeout_seconds=6 * settings.timeout + settings.batching_window,
+        redrive_policy=pulumi.Output.json_dumps({
+            "deadLetterTargetArn": dead_letter_queue.arn,
+            "maxReceiveCount": settings.max_receive_count,
+        }),
+        opts=regional_opts(),
+    )
+    return queue, dead_letter_queue
+
+
+def create_queue_consume_policy(name: str, queue: aws.sqs.Queue) -> aws.iam.RoleInlinePolicyArgs:
+    policy = pulumi.Output.json_dumps({
+        "Statement": [
+            {
+                "Action": [
+                    "sqs:ReceiveMessage",
+                    "sqs:DeleteMessage",
+                    "sqs:GetQueueAttributes",
+                ],
+                "Resource": [queue.arn],
+                "Effect": "Allow"
+            }
+        ]})
+    # Shared roles are identified by the names of their computed policies, one per regional queue
+    return aws.iam.RoleInlinePolicyArgs(name=regional_name(f"{name}SQSConsumePolicy"), policy=policy)
+
+
+def create_queue_send_role(name: str, queue: aws.sqs.Queue) -> aws.iam.Role:
+    """Role of the API Gateway integration, it may only send messages to the queue"""
+    with open(f"{lambda_roles_path}/apigateway_role.json", "r", encoding="utf-8") as f:
+        assume_role_policy_json = f.read()
+    policy = pulumi.Output.json_dumps({
+        "Statement": [
+            {
+                "Action": ["sqs:SendMessage"],
+                "Resource": [queue.arn],
+                "Effect": "Allow"
+            }
+        ]})
+    return create_iam_role(
+        regional_name(f"{name}QueueSendRole"),
+        assume_role_policy_json=assume_role_policy_json,
+        policy_args=[aws.iam.RoleInlinePolicyArgs(name=f"{name}SQSSendPolicy", policy=policy)],
+    )
+
+
+def create_queue_event_source(
+    name: str,
+    queue: aws.sqs.Queue,
+    function_arn: pulumi.Input[str],
+    settings: APIResourceQueue,
+) -> aws.lambda_.EventSourceMapping:
+    return aws.lambda_.EventSourceMapping(
+        regional_name(f"{name}EventSource"),
+        event_source_arn=queue.arn,
+        function_name=function_arn,
+        batch_size=settings.batch_size,
+        maximum_batching_window_in_seconds=settings.batching_window,
+        # Only the failed messages of a batch are delivered again
+        function_response_types=["ReportBatchItemFailures"],
+        scaling_config=aws.lambda_.EventSourceMappingScalingConfigArgs(
+            maximum_concurrency=settings.max_concurrency,
+        ) if settings.max_concurrency else None,
+        opts=pulumi.ResourceOptions(parent=queue),
+    )
@@ -0,0 +1,46 @@
+"""Per-container read cache of the getTodo and getAllTodo Lambdas.
+
+Each container keeps an LRU of its responses, bounded by `max_entries` and
+`ttl_seconds`. An entry is only served while the user's write version is the
+one it was cached with: the write handlers atomically increment the version
+(`ADD version 1`) in the versions table after every write, and the read
+handlers check it with a strongly consistent GetItem of one small item
+instead of querying the items. The Lambdas cache nothing without the
+`readCache` stack config.
+"""
+
+import sys
+from typing import Dict, Optional
+import pulumi
+from pydantic import BaseModel, ValidationError, validator
+from app_config import config
+
+
+class ReadCacheSettings(BaseModel):
+    max_entries: int = 500  # cached responses per container
+    ttl_seconds: int = 60  # upper bound of an entry's age, eg for items removed by TTL
+
+    @validator("max_entries", "ttl_seconds")
+    def _positive_validator(cls, value: int) -> int:
+        if value < 1:
+            raise ValueError("must be at least 1")
+        return value
+
+    def environment(self, versions_table: pulumi.Input[str]) -> Dict[str, pulumi.Input[str]]:
+        return {
+            "VERSIONS_TABLE_NAME": versions_table,
+            "READ_CACHE_MAX_ENTRIES": str(self.max_entries),
+            "READ_CACHE_TTL_SECONDS": str(self.ttl_seconds),
+        }
+
+
+def get_read_cache_settings() -> Optional[ReadCacheSettings]:
+    """`readCache` stack config, None disables the cache"""
+    settings = config.get_object("readCache")
+    if settings is None:
+        return None
+    try:
+        return ReadCacheSettings(**settings)
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
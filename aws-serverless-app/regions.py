@@ -0,0 +1,182 @@
+"""Active-active deployment of the API in several regions.
+
+With the `multiRegion` stack config, the todo table (and the read cache
+versions table) is a DynamoDB global table with a replica in every region,
+and the API, its authorizer, its Lambdas and their alarms are declared once
+per region, through an explicit AWS provider for the regions other than
+`aws:region`. The Lambdas of a region use the replica of their region
+(`TABLE_NAME`, `REGION`). Cognito, the frontend and the archiver stay in
+`aws:region`, IAM roles are shared by the regions.
+
+With a domain name, every regional API gets a regional custom domain and a
+latency record in the hosted zone, so that clients reach the closest region
+on one hostname:
+
+    multiRegion:
+      regions: [eu-west-1, us-east-1, ap-southeast-1]
+      domain_name: api.example.com
+      hosted_zone_id: Z0123456789ABCDEFGHIJ
+      certificate_arns:
+        eu-west-1: arn:aws:acm:eu-west-1:...
+        us-east-1: arn:aws:acm:us-east-1:...
+        ap-southeast-1: arn:aws:acm:ap-southeast-1:...
+
+Resources of the `aws:region` region keep their names, the ones of the other
+regions are named "<name>-<region>".
+"""
+
+from __future__ import annotations
+
+import contextlib
+import sys
+from typing import Dict, Iterator, List, Optional
+import pulumi
+import pulumi_aws as aws
+from pydantic import BaseModel, ValidationError, root_validator
+from app_config import config
+from api import get_api_resources
+
+
+class MultiRegionSettings(BaseModel):
+    primary_region: str  # aws:region, of the table, Cognito and the frontend
+    regions: List[str] = []  # regions of the API, with the primary region
+    domain_name: Optional[str]  # latency-routed hostname of the API
+    hosted_zone_id: Optional[str]
+    # Regional ACM certificates of domain_name, by region
+    certificate_arns: Dict[str, str] = {}
+
+    @root_validator(skip_on_failure=True)
+    def _regions_validator(cls, values):
+        regions = values["regions"]
+        if regions and values["primary_region"] not in regions:
+            raise ValueError(f"regions must include aws:region ({values['primary_region']})")
+        if len(set(regions)) != len(regions):
+            raise ValueError("regions must be unique")
+        if values["domain_name"]:
+            if not values["hosted_zone_id"]:
+                raise ValueError("domain_name requires hosted_zone_id")
+            missing = [region for region in regions or [values["primary_region"]]
+                       if region not in values["certificate_arns"]]
+            if missing:
+                raise ValueError(f"domain_name requires a certificate in every region, missing: {missing}")
+        return values
+
+    @property
+    def replica_regions(self) -> List[str]:
+        """Regions of the global table replicas"""
+        return [region for region in self.regions if region != self.primary_region]
+
+
+def get_multi_region_settings() -> MultiRegionSettings:
+    """`multiRegion` stack config"""
+    try:
+        return MultiRegionSettings(
+            primary_region=pulumi.Config("aws").require("region"),
+            **(config.get_object("multiRegion") or {}),
+        )
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
+
+
+multi_region_settings = get_multi_region_settings()
+
+
+class Region:
+    def __init__(self, name: str, provider: Optional[aws.Provider] = None) -> None:
+        self.name = name
+        # None for the primary region, whose resources use the default provider
+        self.provider = provider
+
+    @property
+    def primary(self) -> bool:
+        return self.provider is None
+
+    def resource_name(self, name: str) -> str:
+        return name if self.primary else f"{name}-{self.name}"
+
+
+_current_region = Region(multi_region_settings.primary_region)
+
+
+def current_region() -> Region:
+    """The region the resources are declared in, see in_region"""
+    return _current_region
+
+
+def regional_name(name: str) -> str:
+    """Resource name in the current region, unique across the regions"""
+    return _current_region.resource_name(name)
+
+
+def regional_opts(**kwargs) -> pulumi.ResourceOptions:
+    """Options of a resource of the current region, children inherit the provider"""
+    return pulumi.ResourceOptions(provider=_current_region.provider, **kwargs)
+
+
+@contextlib.contextmanager
+def in_region(region: Region) -> Iterator[Region]:
+    """Declares the regional resources in `region`.
+
+    The API route models carry the resources of the region they are deployed
+    in (lambda_, alias_, queue_), every region builds its own.
+    """
+    global _current_region
+    previous, _current_region = _current_region, region
+    get_api_resources.cache_clear()
+    try:
+        yield region
+    finally:
+        _current_region = previous
+
+
+def _create_provider(region: str) -> aws.Provider:
+    # Explicit providers do not read the aws: stack config, they get the settings of the default one
+    aws_config = pulumi.Config("aws")
+    default_tags = aws_config.get_object("defaultTags")
+    allowed_account_ids = aws_config.get_object("allowedAccountIds")
+    return aws.Provider(
+        f"aws-{region}",
+        region=region,
+        profile=aws_config.get("profile"),
+        allowed_account_ids=[str(account_id) for account_id in allowed_account_ids] if allowed_account_ids else None,
+        default_tags=aws.ProviderDefaultTagsArgs(**default_tags) if default_tags else None,
+    )
+
+
+def create_regions(settings: MultiRegionSettings) -> List[Region]:
+    """The regions of the API, the primary region first"""
+    regions = [Region(settings.primary_region)]
+    for region in settings.replica_regions:
+        regions.append(Region(region, provider=_create_provider(region)))
+    return regions
+
+
+def any_region_arn(arn: pulumi.Input[str]) -> pulumi.Output[str]:
+    """ARN of a resource in every region, eg of the replicas of a global table"""
+    return pulumi.Output.from_input(arn).apply(
+        lambda value: ":".join([*value.split(":")[:3], "*", *value.split(":")[4:]])
+    )
+
+
+def create_latency_record(
+    settings: MultiRegionSettings,
+    target_domain_name: pulumi.Input[str],
+    target_zone_id: pulumi.Input[str],
+) -> aws.route53.Record:
+    """Latency record of the current region's API custom domain"""
+    region = current_region()
+    return aws.route53.Record(
+        regional_name("apiLatencyRecord"),
+        zone_id=settings.hosted_zone_id,
+        name=settings.domain_name,
+        type="A",
+        set_identifier=region.name,
+        latency_routing_policies=[aws.route53.RecordLatencyRoutingPolicyArgs(region=region.name)],
+        aliases=[aws.route53.RecordAliasArgs(
+            name=target_domain_name,
+            zone_id=target_zone_id,
+            # A failing regional API is left out of the answers
+            evaluate_target_health=True,
+        )],
+    )
@@ -0,0 +1,223 @@
+"""Startup profile of the Pulumi program.
+
+With PULUMI_PROGRAM_PROFILE=<report.json> in the environment (`deploy.py
+--profile`), importing this module first in __main__.py starts the profiler
+and `finish()` writes the report once the program has declared its resources:
+
+- phases: the imports of __main__.py, the declaration of the resources and the total
+- imports: the self and cumulative time of every module imported by the
+  program and the self time by package, pulumi_aws services apart
+- registrations: count and registration time (pulumi.Resource.__init__) of
+  the resources by type and by the program module that declared them
+
+The Pulumi language host has imported pulumi before the program starts, so
+its import time is not part of the profile. pulumi_aws imports a service
+package (with every resource of the service) on the first access of
+`aws.<service>`, those imports are profiled wherever they happen.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+
+PROFILE_VARIABLE = "PULUMI_PROGRAM_PROFILE"
+PROGRAM_DIR = os.path.dirname(os.path.abspath(__file__))
+# Entries of the per-module lists of the report
+TOP_ENTRIES = 30
+
+
+class _ImportTimer:
+    """Meta path finder that times the execution of every module found by the other finders"""
+
+    def __init__(self) -> None:
+        self.modules: Dict[str, Dict[str, float]] = {}
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # File loaders are created per module, the builtin and frozen importers are
+        # classes and loaders shared by several modules (eg zipimport) keep their own
+        per_module = "exec_module" not in getattr(loader, "__dict__", {"exec_module": None})
+        if per_module and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+            loader.exec_module = self._timed(fullname, loader.exec_module)
+        return spec
+
+    def _timed(self, name: str, exec_module):
+        def timed_exec_module(module):
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.modules[name] = {"self_ms": (elapsed - children) * 1000, "cumulative_ms": elapsed * 1000}
+        return timed_exec_module
+
+
+class StartupProfile:
+    def __init__(self, report_path: str) -> None:
+        self.report_path = report_path
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.imports = _ImportTimer()
+        self.registrations: List[Dict[str, Any]] = []
+        self._original_init = None
+
+    def start(self) -> None:
+        import pulumi
+
+        sys.meta_path.insert(0, self.imports)
+        self._original_init = original_init = pulumi.Resource.__init__
+        registrations = self.registrations
+
+        def timed_init(resource, t, name, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                original_init(resource, t, name, *args, **kwargs)
+            finally:
+                registrations.append({
+                    "type": t,
+                    "module": _declaring_module(),
+                    "ms": (time.perf_counter() - start) * 1000,
+                })
+        pulumi.Resource.__init__ = timed_init
+
+    def mark(self, phase: str) -> None:
+        """End of a phase, phases are measured from the end of the previous one"""
+        self.phases[phase] = time.perf_counter()
+
+    def stop(self) -> None:
+        import pulumi
+
+        if self.imports in sys.meta_path:
+            sys.meta_path.remove(self.imports)
+        if self._original_init:
+            pulumi.Resource.__init__ = self._original_init
+
+    def report(self) -> Dict[str, Any]:
+        phases = {}
+        previous = self.started
+        for phase, end in self.phases.items():
+            phases[phase] = _ms((end - previous) * 1000)
+            previous = end
+        phases["total"] = _ms((previous - self.started) * 1000)
+
+        packages: Dict[str, float] = defaultdict(float)
+        for name, timing in self.imports.modules.items():
+            packages[_package(name)] += timing["self_ms"]
+
+        by_type: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "ms": 0.0})
+        by_module: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "ms": 0.0})
+        for registration in self.registrations:
+            for totals in (by_type[registration["type"]], by_module[registration["module"]]):
+                totals["count"] += 1
+                totals["ms"] += registration["ms"]
+
+        return {
+            "phases_ms": phases,
+            "imports": {
+                "modules": len(self.imports.modules),
+                "total_ms": _ms(sum(timing["self_ms"] for timing in self.imports.modules.values())),
+                "packages_ms": _top({name: _ms(ms) for name, ms in packages.items()}),
+                "slowest_modules": _top({
+                    name: {"self_ms": _ms(timing["self_ms"]), "cumulative_ms": _ms(timing["cumulative_ms"])}
+                    for name, timing in self.imports.modules.items()
+                }, key=lambda timing: timing["self_ms"]),
+            },
+            "registrations": {
+                "resources": len(self.registrations),
+                "total_ms": _ms(sum(registration["ms"] for registration in self.registrations)),
+                "by_type": _top({name: {**totals, "ms": _ms(totals["ms"])} for name, totals in by_type.items()},
+                                key=lambda totals: totals["ms"]),
+                "by_module": _top({name: {**totals, "ms": _ms(totals["ms"])} for name, totals in by_module.items()},
+                                  key=lambda totals: totals["ms"]),
+            },
+        }
+
+    def write(self) -> Dict[str, Any]:
+        report = self.report()
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+def _ms(ms: float) -> float:
+    return round(ms, 1)
+
+
+def _top(entries: Dict[str, Any], key=lambda ms: ms) -> Dict[str, Any]:
+    return dict(sorted(entries.items(), key=lambda entry: key(entry[1]), reverse=True)[:TOP_ENTRIES])
+
+
+def _package(module: str) -> str:
+    """Top-level package of a module, "pulumi_aws.<service>" for pulumi_aws"""
+    parts = module.split(".")
+    return ".".join(parts[:2]) if parts[0] == "pulumi_aws" and len(parts) > 1 else parts[0]
+
+
+def _declaring_module() -> str:
+    """The innermost program module on the stack, which declared the resource"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if os.path.dirname(os.path.abspath(filename)) == PROGRAM_DIR and filename != __file__:
+            return os.path.splitext(os.path.basename(filename))[0]
+        frame = frame.f_back
+    return "<pulumi>"
+
+
+_profile: Optional[StartupProfile] = None
+
+
+def start(report_path: Optional[str] = None) -> Optional[StartupProfile]:
+    """Start the profiler if a report path is given or set in PULUMI_PROGRAM_PROFILE"""
+    global _profile
+    report_path = report_path or os.environ.get(PROFILE_VARIABLE)
+    if report_path and _profile is None:
+        _profile = StartupProfile(report_path)
+        _profile.start()
+    return _profile
+
+
+def mark(phase: str) -> None:
+    if _profile:
+        _profile.mark(phase)
+
+
+def finish() -> Optional[Dict[str, Any]]:
+    """Stop the profiler and write its report"""
+    global _profile
+    if _profile is None:
+        return None
+    import pulumi
+
+    profile, _profile = _profile, None
+    profile.mark("resources")
+    profile.stop()
+    report = profile.write()
+    pulumi.log.info(
+        f"Startup profile: {report['phases_ms']['total']} ms, {report['imports']['modules']} modules imported in "
+        f"{report['imports']['total_ms']} ms, {report['registrations']['resources']} resources registered in "
+        f"{report['registrations']['total_ms']} ms, see {profile.report_path}"
+    )
+    return report
+
+
+start()
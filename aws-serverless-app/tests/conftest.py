@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# The program modules, eg frontend_assets, next to the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
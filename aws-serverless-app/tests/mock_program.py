@@ -0,0 +1,217 @@
+"""Runs the Pulumi program under mocks and reports what it registers.
+
+The program reads its stack config into module globals, so every config runs
+in a fresh interpreter:
+
+    python tests/mock_program.py default            # report of one config (JSON)
+    python tests/mock_program.py --write-budgets    # measure every config into program_budgets.json
+
+The config is Pulumi.stack_template.yaml with the overrides of CONFIGS. No
+cloud call is made: resources and invokes are answered by the mocks, the
+Lambda archives are built without npm into a temporary cache and the frontend
+is not uploaded. The report has the resource counts by type, the depth of the
+dependency graph (longest chain of dependencies and parents, in resources),
+the wall time of the program and every registered resource with its inputs,
+provider and ignore_changes.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import math
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "program_budgets.json")
+STACK_TEMPLATE = os.path.join(APP_DIR, "Pulumi.stack_template.yaml")
+STACK_NAME = "aws-serverless-app"
+# Wall time budgets are this many times the measured time, rounded up to the second
+WALL_TIME_HEADROOM = 3
+
+_MULTI_REGION = {
+    "regions": ["eu-west-1", "us-east-1", "ap-southeast-1"],
+    "domain_name": "api.example.com",
+    "hosted_zone_id": "Z0123456789ABCDEFGHIJ",
+    "certificate_arns": {
+        region: f"arn:aws:acm:{region}:123456789012:certificate/test"
+        for region in ("eu-west-1", "us-east-1", "ap-southeast-1")
+    },
+}
+
+# Representative stack configs, overrides of Pulumi.stack_template.yaml
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "resources": {"apiDefinition": "resources"},
+    "http": {"apiGatewayType": "http"},
+    "router": {"lambdaDeployment": "router"},
+    "queue": {"writeIngestion": "queue", "apiDefinition": "resources", "completedItems": {"ttl_days": 30, "archive": False}},
+    "tracing": {"tracing": {"enabled": True}},
+    "archive_read_cache": {"completedItems": {"ttl_days": 30, "archive": True}, "readCache": {"max_entries": 500}},
+    # prod defaults: auto-scaled PROVISIONED tables
+    "provisioned": {"stageName": "prod", "readCache": {"max_entries": 500}},
+    "multi_region": {"multiRegion": _MULTI_REGION, "readCache": {"max_entries": 500}},
+    "multi_region_http": {"multiRegion": _MULTI_REGION, "apiGatewayType": "http"},
+}
+
+
+def _project_name() -> str:
+    with open(os.path.join(APP_DIR, "Pulumi.yaml"), "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)["name"]
+
+
+def _stack_config(overrides: Dict[str, Any], cache_path: str) -> Dict[str, str]:
+    """PULUMI_CONFIG of the stack template with the overrides, objects as JSON"""
+    project = _project_name()
+    with open(STACK_TEMPLATE, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)["config"]
+    config.update(overrides)
+    config["lambdaBuildCachePath"] = cache_path
+    return {
+        (key if ":" in key else f"{project}:{key}"): (value if isinstance(value, str) else json.dumps(value))
+        for key, value in config.items()
+    }
+
+
+def _graph_depth(registrations: List[Dict[str, Any]]) -> int:
+    """Resources on the longest chain of dependencies and parents"""
+    edges = {
+        registration["urn"]: {*registration["dependencies"], registration["parent"]} - {""}
+        for registration in registrations
+    }
+    depths: Dict[str, int] = {}
+
+    def depth(urn: str) -> int:
+        if urn not in depths:
+            depths[urn] = 1 + max((depth(dependency) for dependency in edges.get(urn, ()) if dependency in edges),
+                                  default=0)
+        return depths[urn]
+
+    return max((depth(urn) for urn in edges), default=0)
+
+
+def run_program(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Run __main__.py under mocks in this interpreter, which must not have run it before"""
+    import pulumi
+    from pulumi.runtime import rpc
+    from pulumi.runtime.mocks import MockMonitor
+    from pulumi.runtime.stack import wait_for_rpcs
+
+    class Mocks(pulumi.runtime.Mocks):
+        def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+            outputs = dict(args.inputs)
+            for output, value in (
+                ("arn", f"arn:aws:mock:eu-west-1:123456789012:{args.name}"),
+                ("name", args.name),
+                ("invokeArn", f"arn:aws:apigateway:eu-west-1:lambda:path/functions/{args.name}/invocations"),
+                ("executionArn", f"arn:aws:execute-api:eu-west-1:123456789012:{args.name}"),
+                ("rootResourceId", f"{args.name}-root"),
+                ("domainName", f"{args.name}.example.com"),
+                ("websiteEndpoint", f"{args.name}.s3-website.example.com"),
+                ("bucket", args.name),
+            ):
+                outputs.setdefault(output, value)
+            return f"{args.name}-id", outputs
+
+        def call(self, args: pulumi.runtime.MockCallArgs):
+            return {"accountId": "123456789012", "json": "{}", "name": "eu-west-1", "id": "mock"}
+
+    class RecordingMonitor(MockMonitor):
+        def __init__(self, mocks: pulumi.runtime.Mocks) -> None:
+            super().__init__(mocks)
+            self.registrations: List[Dict[str, Any]] = []
+
+        def RegisterResource(self, request):
+            response = super().RegisterResource(request)
+            if request.type != "pulumi:pulumi:Stack":
+                self.registrations.append({
+                    "urn": response.urn,
+                    "type": request.type,
+                    "name": request.name,
+                    "parent": request.parent,
+                    "dependencies": list(request.dependencies),
+                    # "<provider urn>::<provider id>", empty for the default provider
+                    "provider": request.provider,
+                    "ignore_changes": list(request.ignoreChanges),
+                    "inputs": rpc.deserialize_properties(request.object),
+                })
+            return response
+
+    with tempfile.TemporaryDirectory(prefix="mock-program-") as cache_path:
+        os.environ["PULUMI_CONFIG"] = json.dumps(_stack_config(overrides, cache_path))
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        # The function directories are archived as they are, without npm install
+        import lambda_packaging
+        lambda_packaging._install_dependencies = lambda source_dir: None
+
+        monitor = RecordingMonitor(Mocks())
+        pulumi.runtime.set_mocks(monitor.mocks, project=_project_name(), stack=STACK_NAME, preview=False, monitor=monitor)
+        start = time.perf_counter()
+        runpy.run_path(os.path.join(APP_DIR, "__main__.py"), run_name="__main__")
+        asyncio.get_event_loop().run_until_complete(wait_for_rpcs())
+        wall_time = time.perf_counter() - start
+
+    counts = Counter(registration["type"] for registration in monitor.registrations)
+    return {
+        "resources": sum(counts.values()),
+        "by_type": dict(sorted(counts.items())),
+        "depth": _graph_depth(monitor.registrations),
+        "wall_time_s": round(wall_time, 2),
+        "registrations": monitor.registrations,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def measure(name: str) -> Dict[str, Any]:
+    """Report of a config of CONFIGS, run in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), name],
+        cwd=APP_DIR, check=True, capture_output=True, text=True,
+    )
+    # The program prints its warnings before the report, which is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def budget(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Budgets of a measured config: its counts and depth, and its wall time with headroom"""
+    return {
+        "resources": report["resources"],
+        "by_type": report["by_type"],
+        "depth": report["depth"],
+        "wall_time_s": math.ceil(report["wall_time_s"] * WALL_TIME_HEADROOM),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Pulumi program under mocks")
+    parser.add_argument("config", nargs="?", choices=sorted(CONFIGS), help="config to run")
+    parser.add_argument("--write-budgets", action="store_true", help=f"measure every config into {BUDGETS_PATH}")
+    args = parser.parse_args(argv)
+
+    if args.write_budgets:
+        budgets = {name: budget(measure(name)) for name in CONFIGS}
+        with open(BUDGETS_PATH, "w", encoding="utf-8") as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+        return 0
+    if not args.config:
+        parser.error("a config or --write-budgets is required")
+    report = run_program(CONFIGS[args.config])
+    # Archives and the other asset objects of the inputs are reported by their repr
+    print(json.dumps(report, default=repr))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""backfill_open_items.py against moto's DynamoDB"""
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from backfill_open_items import backfill
+
+
+TABLE = "todo-api"
+
+
+@pytest.fixture
+def dynamodb():
+    with mock_dynamodb():
+        client = boto3.client("dynamodb", region_name="eu-west-1")
+        client.create_table(
+            TableName=TABLE,
+            KeySchema=[
+                {"AttributeName": "cognito-username", "KeyType": "HASH"},
+                {"AttributeName": "id", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "cognito-username", "AttributeType": "S"},
+                {"AttributeName": "id", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield client
+
+
+def put(client, item_id: str, **attributes):
+    item = {"cognito-username": {"S": "user"}, "id": {"S": item_id}, "lastupdate_date": {"S": f"2024-01-0{item_id}"}}
+    item.update(attributes)
+    client.put_item(TableName=TABLE, Item=item)
+
+
+def get(client, item_id: str):
+    return client.get_item(TableName=TABLE, Key={"cognito-username": {"S": "user"}, "id": {"S": item_id}})["Item"]
+
+
+def test_backfill_open_items(dynamodb):
+    put(dynamodb, "1", completed={"BOOL": False})
+    put(dynamodb, "2")
+    put(dynamodb, "3", completed={"BOOL": True})
+    put(dynamodb, "4", completed={"BOOL": False}, open_lastupdate_date={"S": "2024-02-01"})
+
+    assert backfill(dynamodb, TABLE, dry_run=True) == {"found": 2, "updated": 0, "skipped": 0}
+    assert "open_lastupdate_date" not in get(dynamodb, "1")
+
+    assert backfill(dynamodb, TABLE) == {"found": 2, "updated": 2, "skipped": 0}
+    assert get(dynamodb, "1")["open_lastupdate_date"] == {"S": "2024-01-01"}
+    assert get(dynamodb, "2")["open_lastupdate_date"] == {"S": "2024-01-02"}
+    assert "open_lastupdate_date" not in get(dynamodb, "3")
+    assert get(dynamodb, "4")["open_lastupdate_date"] == {"S": "2024-02-01"}
+
+    assert backfill(dynamodb, TABLE) == {"found": 0, "updated": 0, "skipped": 0}
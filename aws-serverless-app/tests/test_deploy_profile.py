@@ -0,0 +1,100 @@
+"""deploy_profile.py on a recorded event log and its stack export.
+
+fixtures/deploy_profile_events.jsonl is the `pulumi up --event-log` of a REST
+API slice of the program (`apiDefinition: resources`), one getAllTodo and one
+getTodo route, and fixtures/deploy_profile_state.json its `pulumi stack export`.
+Engine timestamps are in whole seconds.
+"""
+
+import json
+import os
+
+import pytest
+
+from deploy_profile import build_timeline, critical_path, dependency_graph, main, profile, read_events, resource_name
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EVENT_LOG = os.path.join(FIXTURES, "deploy_profile_events.jsonl")
+STATE = os.path.join(FIXTURES, "deploy_profile_state.json")
+
+
+@pytest.fixture(scope="module")
+def state():
+    with open(STATE, "r", encoding="utf-8") as f:
+        return json.load(f)["deployment"]
+
+
+@pytest.fixture(scope="module")
+def report(state):
+    return profile(EVENT_LOG, state)
+
+
+def by_name(entries, key="urn"):
+    return {resource_name(entry[key]): entry for entry in entries}
+
+
+def test_timeline_is_relative_to_the_first_step():
+    timeline = by_name(build_timeline(read_events(EVENT_LOG)).values())
+    assert (timeline["workshopServerlessJukeBox"]["start"], timeline["workshopServerlessJukeBox"]["end"]) == (0, 1)
+    assert timeline["getAllTodo"]["duration"] == 12
+    # the provider and the stack are steps too
+    assert timeline["default_6_83_0"]["duration"] == 0
+    assert timeline["demo-aws-serverless-app"]["end"] == 29
+
+
+def test_critical_path(report):
+    path = [(resource_name(entry["urn"]), entry["explicit"]) for entry in report["critical_path"]]
+    # the stack, which registers its outputs last, is not a step of the path
+    assert path == [
+        ("todo-api", False),
+        ("demoLambdaExecRole-4b1d0c9e7f21", False),
+        ("getAllTodo", False),
+        ("getAllTodoAlias", False),
+        ("itemGETIntegration", False),
+        ("workshopServerlessJukeBoxDeployment", True),
+        ("workshopServerlessJukeBoxStage", False),
+        ("workshopServerlessJukeBoxStageCacheDefault", False),
+        ("workshopServerlessJukeBoxStagegetAllTodoCache", True),
+    ]
+    assert report["duration"] == 29
+
+
+def test_a_dependency_done_in_the_second_a_step_starts_gates_it(state):
+    timeline = build_timeline(read_events(EVENT_LOG))
+    graph = dependency_graph(state)
+    method = next(urn for urn in timeline if resource_name(urn) == "itemIdGET")
+    # itemId and the authorizer are done at 3s, the method starts at 3s
+    done_before = {urn: entry for urn, entry in timeline.items() if entry["end"] <= timeline[method]["start"]}
+    path = critical_path({**done_before, method: timeline[method]}, graph)
+    gates = by_name(path)
+    assert gates["itemIdGET"]["wait"] == 0
+    assert resource_name(gates["itemIdGET"]["waited_for"]) in ("itemId", "demoCognitoAuthorizer")
+
+
+def test_redundant_and_ordering_only_depends_on(report):
+    edges = {
+        (resource_name(edge["resource"]), resource_name(edge["depends_on"])): edge
+        for edge in report["explicit_dependencies"]
+    }
+    # the API resources of _create_api_resource are dependencies of their integrations already
+    assert {edge for edge, value in edges.items() if value["redundant"]} == {
+        ("workshopServerlessJukeBoxDeployment", "item"),
+        ("workshopServerlessJukeBoxDeployment", "itemId"),
+    }
+    ordering = {edge: (value["held_back"], value["critical"]) for edge, value in edges.items() if not value["redundant"]}
+    assert ordering == {
+        ("workshopServerlessJukeBoxDeployment", "itemGETIntegration"): (1, True),
+        ("workshopServerlessJukeBoxDeployment", "itemIdGETIntegration"): (0, False),
+        ("workshopServerlessJukeBoxStagegetAllTodoCache", "workshopServerlessJukeBoxStageCacheDefault"): (1, True),
+    }
+    # critical edges first, then by the time they held their resource back
+    assert [edge["critical"] for edge in report["explicit_dependencies"]][:2] == [True, True]
+
+
+def test_main_writes_the_report(tmp_path, capsys):
+    output = tmp_path / "profile.json"
+    assert main(["--event-log", EVENT_LOG, "--state", STATE, "--output", str(output)]) == 0
+    assert "Redundant depends_on (2)" in capsys.readouterr().out
+    with open(output, "r", encoding="utf-8") as f:
+        assert json.load(f)["resources"] == 21
@@ -0,0 +1,94 @@
+"""frontend_assets.py against moto's S3"""
+
+import os
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from frontend_assets import HASHED_CACHE_CONTROL, UNHASHED_CACHE_CONTROL, _FrontendAssetsProvider
+
+
+BUCKET = "frontend"
+
+
+@pytest.fixture
+def s3():
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def write(build_dir: str, key: str, body: bytes) -> None:
+    path = os.path.join(build_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+def content_encodings(obj) -> list:
+    # moto keeps the aws-chunked transfer encoding of the upload, S3 removes it
+    return [encoding for encoding in obj.get("ContentEncoding", "").split(",") if encoding not in ("", "aws-chunked")]
+
+
+def from_state(value):
+    """The outputs of the dynamic provider as Pulumi passes them back as olds: without None values"""
+    if isinstance(value, dict):
+        return {key: from_state(item) for key, item in value.items() if item is not None}
+    return value
+
+
+def sync(provider: _FrontendAssetsProvider, build_dir: str, olds=None):
+    props = {"bucket": BUCKET, "build_dir": build_dir, "region": "us-east-1"}
+    if olds is None:
+        return provider.create(props).outs
+    return provider.update(BUCKET, olds, props).outs
+
+
+def test_sync_uploads_changes_and_deletes_removed(s3, tmp_path):
+    build_dir = str(tmp_path)
+    write(build_dir, "index.html", b"<html>" + b" " * 2048 + b"</html>")
+    write(build_dir, "favicon.png", b"\x89PNG")
+    write(build_dir, "static/js/main.3f2a9c1e.chunk.js", b"console.log(1);")
+    write(build_dir, "static/js/old.0b1c2d3e.chunk.js", b"console.log(0);")
+    provider = _FrontendAssetsProvider()
+
+    outs = sync(provider, build_dir)
+    assert (outs["uploaded_count"], outs["deleted_count"]) == (4, 0)
+    index = s3.get_object(Bucket=BUCKET, Key="index.html")
+    assert index["CacheControl"] == UNHASHED_CACHE_CONTROL
+    assert index["ContentType"] == "text/html"
+    # compressed by CloudFront
+    assert content_encodings(index) == []
+    assert index["Body"].read().startswith(b"<html>")
+    bundle = s3.get_object(Bucket=BUCKET, Key="static/js/main.3f2a9c1e.chunk.js")
+    assert bundle["CacheControl"] == HASHED_CACHE_CONTROL
+    assert bundle["ContentType"] == "application/javascript"
+
+    # Nothing changed: nothing is uploaded, compressed or not
+    outs = sync(provider, build_dir, from_state(outs))
+    assert (outs["uploaded_count"], outs["deleted_count"]) == (0, 0)
+
+    write(build_dir, "static/js/main.3f2a9c1e.chunk.js", b"console.log(2);")
+    os.remove(os.path.join(build_dir, "static/js/old.0b1c2d3e.chunk.js"))
+    outs = sync(provider, build_dir, from_state(outs))
+    assert (outs["uploaded_count"], outs["deleted_count"]) == (1, 1)
+    keys = {obj["Key"] for obj in s3.list_objects_v2(Bucket=BUCKET)["Contents"]}
+    assert keys == {"index.html", "favicon.png", "static/js/main.3f2a9c1e.chunk.js"}
+    body = s3.get_object(Bucket=BUCKET, Key="static/js/main.3f2a9c1e.chunk.js")["Body"].read()
+    assert body == b"console.log(2);"
+
+
+def test_precompressed_objects_are_uploaded_again(s3, tmp_path):
+    build_dir = str(tmp_path)
+    write(build_dir, "index.html", b"<html>" + b" " * 2048 + b"</html>")
+    write(build_dir, "favicon.png", b"\x89PNG")
+    provider = _FrontendAssetsProvider()
+    outs = sync(provider, build_dir)
+
+    # state of a deployment that stored index.html gzip encoded
+    olds = from_state(outs)
+    olds["manifest"]["index.html"]["content_encoding"] = "gzip"
+    outs = sync(provider, build_dir, olds)
+    assert (outs["uploaded_count"], outs["deleted_count"]) == (1, 0)
@@ -0,0 +1,42 @@
+"""Identity and names of the shared Lambda execution roles of iam.py"""
+
+import pulumi
+import pytest
+from pulumi_aws.iam import RoleInlinePolicyArgs
+
+import iam
+
+
+ASSUME_ROLE = '{"Version": "2012-10-17", "Statement": []}'
+
+
+@pytest.fixture(autouse=True)
+def registries(monkeypatch):
+    monkeypatch.setattr(iam, "_role_registry", {})
+    monkeypatch.setattr(iam, "_role_names", {})
+    monkeypatch.setattr(iam, "_computed_policies", {})
+
+
+def computed(document: str) -> pulumi.Output[str]:
+    return pulumi.Output.from_input(document).apply(lambda value: value)
+
+
+def test_a_computed_document_is_identified_by_its_name():
+    policy = RoleInlinePolicyArgs(name="tablePolicy", policy=computed("{}"))
+    assert iam.role_key(ASSUME_ROLE, [policy], None) == iam.role_key(ASSUME_ROLE, [policy], None)
+
+
+def test_one_name_for_different_computed_documents_fails():
+    iam.role_key(ASSUME_ROLE, [RoleInlinePolicyArgs(name="tablePolicy", policy=computed("table-a"))], None)
+    with pytest.raises(ValueError, match="tablePolicy"):
+        iam.role_key(ASSUME_ROLE, [RoleInlinePolicyArgs(name="tablePolicy", policy=computed("table-b"))], None)
+
+
+def test_role_names_do_not_depend_on_the_documents():
+    before = [RoleInlinePolicyArgs(name="xray_policy", policy='{"Statement": []}')]
+    after = [RoleInlinePolicyArgs(name="xray_policy", policy='{"Statement": [{"Effect": "Allow"}]}')]
+    assert iam.role_key(ASSUME_ROLE, before, None) != iam.role_key(ASSUME_ROLE, after, None)
+    assert iam.shared_role_name(before) == iam.shared_role_name(after)
+    assert iam.shared_role_name(before) != iam.shared_role_name(
+        [*before, RoleInlinePolicyArgs(name="queuePolicy", policy="{}")]
+    )
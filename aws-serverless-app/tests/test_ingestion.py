@@ -0,0 +1,58 @@
+"""The queued write path (`writeIngestion: queue`) end to end, against moto in server mode.
+
+benchmark/ingestion.py enqueues requests like the API Gateway integration and
+hands the batches to the addTodoConsumer handler, run by node from its
+deployment archive (its npm dependencies are installed like for a deployment).
+"""
+
+import os
+import shutil
+import socket
+import sys
+
+import pytest
+from moto.server import ThreadedMotoServer
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmark"))
+
+import ingestion  # noqa: E402
+
+
+pytestmark = pytest.mark.skipif(
+    not (shutil.which("node") and shutil.which("npm")), reason="the handler runs in node"
+)
+
+
+@pytest.fixture(scope="module")
+def endpoint():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+def test_queued_writes(endpoint):
+    invalid = 2
+    report = ingestion.run(ingestion.parse_args([
+        "--endpoint", endpoint,
+        "--users", "3",
+        "--items", "8",
+        "--invalid", str(invalid),
+        "--batch-size", "10",
+        "--max-receive-count", "2",
+        "--timeout", "60",
+        "--completed-ttl-seconds", "86400",
+    ]))
+
+    assert report["drained"]
+    assert report["written_items"] == report["expected_items"] == 24
+    # malformed messages are reported as batch item failures, redelivered and dead-lettered
+    assert report["failed"] >= invalid
+    assert report["dead_letters"] == invalid
+    assert report["completed_items"] == 6
+    assert report["expiring_completed_items"] == report["completed_items"]
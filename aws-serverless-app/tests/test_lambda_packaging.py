@@ -0,0 +1,70 @@
+"""Reproducibility and caching of lambda_packaging.py, without npm"""
+
+import json
+import os
+import time
+
+import pytest
+
+import lambda_packaging
+from lambda_packaging import build_archive, cached_archive_path, source_hash
+
+
+FILES = {
+    "app.js": b"exports.handler = async () => ({ statusCode: 200 });\n",
+    "lib/util.js": b"module.exports = {};\n",
+    "package.json": json.dumps({"name": "fn", "dependencies": {"uuid": "8.3.2"}}).encode(),
+}
+
+
+def write_sources(source_dir, files=FILES, order=None) -> str:
+    for rel_path in order or files:
+        path = os.path.join(source_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(files[rel_path])
+    return str(source_dir)
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_same_sources_build_byte_identical_archives(tmp_path):
+    first = write_sources(tmp_path / "a" / "fn")
+    # same files written in another order, with other mtimes
+    second = write_sources(tmp_path / "b" / "fn", order=list(reversed(FILES)))
+    past = time.time() - 3600
+    for rel_path in FILES:
+        os.utime(os.path.join(second, rel_path), (past, past))
+
+    assert source_hash(first) == source_hash(second)
+    first_archive = build_archive(first, cache_path=str(tmp_path / "cache-a"), install_dependencies=False)
+    second_archive = build_archive(second, cache_path=str(tmp_path / "cache-b"), install_dependencies=False)
+    assert read(first_archive) == read(second_archive)
+
+
+def test_changed_sources_change_the_hash(tmp_path):
+    source_dir = write_sources(tmp_path / "fn")
+    before = source_hash(source_dir)
+    write_sources(source_dir, {"lib/util.js": b"module.exports = { changed: true };\n"})
+    assert source_hash(source_dir) != before
+
+
+def test_archives_without_dependencies_are_cached_apart(tmp_path):
+    source_dir = write_sources(tmp_path / "fn")
+    cache_path = str(tmp_path / "cache")
+    sources_only = build_archive(source_dir, cache_path=cache_path, install_dependencies=False)
+    assert sources_only != cached_archive_path(source_dir, cache_path)
+    assert not os.path.exists(cached_archive_path(source_dir, cache_path))
+
+
+def test_an_install_without_node_modules_is_not_cached(tmp_path, monkeypatch):
+    source_dir = write_sources(tmp_path / "fn")
+    cache_path = str(tmp_path / "cache")
+    # npm exits 0 without installing anything
+    monkeypatch.setattr(lambda_packaging.subprocess, "run", lambda *args, **kwargs: None)
+    with pytest.raises(RuntimeError, match="node_modules"):
+        build_archive(source_dir, cache_path=cache_path)
+    assert not os.path.exists(cached_archive_path(source_dir, cache_path))
@@ -0,0 +1,63 @@
+"""Resource, dependency depth and wall time budgets of the Pulumi program.
+
+Every resource the program registers adds deploy time, and so does every
+level of the dependency graph. Each config of mock_program.CONFIGS runs under
+Pulumi mocks, offline, and its report is compared to program_budgets.json.
+After a deliberate change, measure the budgets again and review their diff:
+
+    python tests/mock_program.py --write-budgets
+"""
+
+import json
+import os
+
+import pytest
+
+from mock_program import BUDGETS_PATH, CONFIGS, measure
+
+
+with open(BUDGETS_PATH, "r", encoding="utf-8") as f:
+    BUDGETS = json.load(f)
+
+
+@pytest.fixture(scope="module", params=sorted(CONFIGS))
+def config(request):
+    name = request.param
+    return name, measure(name), BUDGETS[name]
+
+
+def test_every_config_has_a_budget():
+    assert sorted(BUDGETS) == sorted(CONFIGS)
+
+
+def test_resource_count(config):
+    name, report, budget = config
+    assert report["resources"] <= budget["resources"], (
+        f"{name}: {report['resources']} resources, budget {budget['resources']}"
+    )
+
+
+def test_resource_count_by_type(config):
+    name, report, budget = config
+    over = {
+        resource_type: f"{count} > {budget['by_type'].get(resource_type, 0)}"
+        for resource_type, count in report["by_type"].items()
+        if count > budget["by_type"].get(resource_type, 0)
+    }
+    assert not over, f"{name}: resources over their budget by type: {over}"
+
+
+def test_dependency_depth(config):
+    name, report, budget = config
+    assert report["depth"] <= budget["depth"], (
+        f"{name}: dependency chain of {report['depth']} resources, budget {budget['depth']}"
+    )
+
+
+def test_wall_time(config):
+    name, report, budget = config
+    # Slower machines may scale the budgets, eg PROGRAM_TIME_BUDGET_FACTOR=2
+    factor = float(os.environ.get("PROGRAM_TIME_BUDGET_FACTOR", "1"))
+    assert report["wall_time_s"] <= budget["wall_time_s"] * factor, (
+        f"{name}: program ran {report['wall_time_s']} s, budget {budget['wall_time_s']} s"
+    )
@@ -0,0 +1,180 @@
+"""Inputs of the resources the Pulumi program registers, under Pulumi mocks.
+
+The configs are the ones of mock_program.CONFIGS, see test_program_budgets.py.
+"""
+
+import json
+from typing import Any, Dict, List
+
+from mock_program import CONFIGS, measure
+
+
+def resources(name: str, resource_type: str) -> List[Dict[str, Any]]:
+    """Registrations of a type in the report of a config"""
+    return [registration for registration in measure(name)["registrations"] if registration["type"] == resource_type]
+
+
+def by_name(registrations: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {registration["name"]: registration for registration in registrations}
+
+
+# dynamodb._stage_capacity_defaults["prod"]
+PROD_CAPACITY = 20
+PROD_SCALING = {"Read": (20, 500), "Write": (20, 200)}
+
+
+def test_on_demand_tables_are_not_scaled():
+    for table in resources("default", "aws:dynamodb/table:Table"):
+        assert table["inputs"]["billingMode"] == "PAY_PER_REQUEST"
+        assert "readCapacity" not in table["inputs"]
+    assert not resources("default", "aws:appautoscaling/target:Target")
+    assert not resources("default", "aws:appautoscaling/policy:Policy")
+
+
+def test_provisioned_tables():
+    tables = resources("provisioned", "aws:dynamodb/table:Table")
+    assert len(tables) == 2  # the todo table and the read cache versions table
+    for table in tables:
+        inputs = table["inputs"]
+        assert inputs["billingMode"] == "PROVISIONED"
+        assert (inputs["readCapacity"], inputs["writeCapacity"]) == (PROD_CAPACITY, PROD_CAPACITY)
+        for index in inputs["globalSecondaryIndexes"]:
+            assert (index["readCapacity"], index["writeCapacity"]) == (PROD_CAPACITY, PROD_CAPACITY), index["name"]
+
+
+def _scaled_resource_ids(tables: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Application Auto Scaling resource id -> dimension of every table and GSI"""
+    resource_ids = {}
+    for table in tables:
+        resource_ids[f"table/{table['inputs']['name']}"] = "table"
+        for index in table["inputs"]["globalSecondaryIndexes"]:
+            resource_ids[f"table/{table['inputs']['name']}/index/{index['name']}"] = "index"
+    return resource_ids
+
+
+def test_provisioned_scaling_targets():
+    resource_ids = _scaled_resource_ids(resources("provisioned", "aws:dynamodb/table:Table"))
+    assert any(dimension == "index" for dimension in resource_ids.values())
+
+    targets = {
+        (target["inputs"]["resourceId"], target["inputs"]["scalableDimension"]): target["inputs"]
+        for target in resources("provisioned", "aws:appautoscaling/target:Target")
+    }
+    expected = {
+        (resource_id, f"dynamodb:{dimension}:{capacity}CapacityUnits")
+        for resource_id, dimension in resource_ids.items()
+        for capacity in PROD_SCALING
+    }
+    assert set(targets) == expected
+    for (_, scalable_dimension), inputs in targets.items():
+        capacity = "Read" if scalable_dimension.endswith("ReadCapacityUnits") else "Write"
+        assert inputs["serviceNamespace"] == "dynamodb"
+        assert (inputs["minCapacity"], inputs["maxCapacity"]) == PROD_SCALING[capacity]
+
+
+def test_provisioned_scaling_policies():
+    targets = by_name(resources("provisioned", "aws:appautoscaling/target:Target"))
+    policies = resources("provisioned", "aws:appautoscaling/policy:Policy")
+    assert len(policies) == len(targets)
+    for policy in policies:
+        inputs = policy["inputs"]
+        target = targets[policy["name"].replace("ScalingPolicy", "ScalingTarget")]
+        assert policy["parent"] == target["urn"]
+        assert inputs["policyType"] == "TargetTrackingScaling"
+        assert (inputs["resourceId"], inputs["scalableDimension"]) == (
+            target["inputs"]["resourceId"], target["inputs"]["scalableDimension"],
+        )
+        capacity = "Read" if inputs["scalableDimension"].endswith("ReadCapacityUnits") else "Write"
+        configuration = inputs["targetTrackingScalingPolicyConfiguration"]
+        assert configuration["targetValue"] == 70
+        assert configuration["predefinedMetricSpecification"]["predefinedMetricType"] == (
+            f"DynamoDB{capacity}CapacityUtilization"
+        )
+
+
+def test_provisioned_capacity_is_left_to_auto_scaling():
+    for table in resources("provisioned", "aws:dynamodb/table:Table"):
+        assert set(table["ignore_changes"]) == {
+            "readCapacity",
+            "writeCapacity",
+            "globalSecondaryIndexes[*].readCapacity",
+            "globalSecondaryIndexes[*].writeCapacity",
+        }
+
+
+def test_only_the_refetched_list_can_be_flushed_by_clients():
+    settings = {
+        method_settings["inputs"]["methodPath"]: method_settings["inputs"]["settings"]
+        for method_settings in resources("default", "aws:apigateway/methodSettings:MethodSettings")
+    }
+    # the frontend refetches the list with Cache-Control: max-age=0 after its writes
+    assert settings["item/GET"]["requireAuthorizationForCacheControl"] is False
+    # single items expire after their TTL
+    assert settings["item/{id}/GET"]["requireAuthorizationForCacheControl"] is True
+
+
+def test_queue_consumer_expires_completed_items():
+    functions = by_name(resources("queue", "aws:lambda/function:Function"))
+    consumer = next(function for name, function in functions.items() if name.startswith("addTodoConsumer"))
+    assert consumer["inputs"]["environment"]["variables"]["COMPLETED_TTL_SECONDS"] == str(30 * 24 * 3600)
+
+
+MULTI_REGION = CONFIGS["multi_region"]["multiRegion"]["regions"]
+PRIMARY_REGION, REPLICA_REGIONS = MULTI_REGION[0], MULTI_REGION[1:]
+
+
+def _function_region(name: str) -> str:
+    """Functions of the other regions are named with their region as suffix"""
+    return next((region for region in REPLICA_REGIONS if name.endswith(f"-{region}")), PRIMARY_REGION)
+
+
+def test_multi_region_functions_are_deployed_in_their_region():
+    providers = {
+        provider["inputs"]["region"]: provider["urn"]
+        for provider in resources("multi_region", "pulumi:providers:aws")
+    }
+    assert set(providers) == set(REPLICA_REGIONS)
+
+    functions = resources("multi_region", "aws:lambda/function:Function")
+    assert {_function_region(function["name"]) for function in functions} == set(MULTI_REGION)
+    for function in functions:
+        region = _function_region(function["name"])
+        if region == PRIMARY_REGION:
+            # the default provider, of the stack's region
+            assert function["provider"] == "", function["name"]
+        else:
+            assert function["provider"].startswith(providers[region] + "::"), function["name"]
+
+
+def test_multi_region_functions_use_their_regional_replica():
+    table_names = {table["inputs"]["name"] for table in resources("multi_region", "aws:dynamodb/table:Table")}
+    for function in resources("multi_region", "aws:lambda/function:Function"):
+        variables = function["inputs"]["environment"]["variables"]
+        assert variables["REGION"] == _function_region(function["name"]), function["name"]
+        # a global table has the same name in every region
+        assert variables["TABLE_NAME"] == "todo-api", function["name"]
+        assert variables["VERSIONS_TABLE_NAME"] in table_names, function["name"]
+
+
+def test_multi_region_tables_are_replicated_to_every_region():
+    tables = resources("multi_region", "aws:dynamodb/table:Table")
+    assert len(tables) == 2  # the todo table and the read cache versions table
+    for table in tables:
+        assert table["provider"] == ""
+        assert sorted(replica["regionName"] for replica in table["inputs"]["replicas"]) == sorted(REPLICA_REGIONS)
+
+
+def test_traced_functions_may_send_segments():
+    roles = resources("tracing", "aws:iam/role:Role")
+    assert len(roles) == 1  # shared by every function
+    policies = {policy.get("name"): policy for policy in roles[0]["inputs"]["inlinePolicies"]}
+    assert None not in policies  # unnamed inline policies are ignored by the provider
+    statements = json.loads(policies["xray_policy"]["policy"])["Statement"]
+    actions = {action for statement in statements for action in statement["Action"]}
+    assert {"xray:PutTraceSegments", "xray:PutTelemetryRecords"} <= actions
+
+
+def test_shared_roles_are_tagged_with_their_permissions():
+    for role in resources("queue", "aws:iam/role:Role"):
+        if role["name"].startswith("demoLambdaExecRole-"):
+            assert len(role["inputs"]["tags"]["PermissionsHash"]) == 64, role["name"]
@@ -0,0 +1,148 @@
+"""X-Ray tracing of the API Gateway stage and the Lambdas.
+
+With the `tracing` stack config enabled, the REST API stage traces requests
+and every Lambda gets active tracing and `XRAY_TRACING=1`, which makes the
+handlers wrap the AWS SDK with aws-xray-sdk-core. Otherwise the handlers do
+not load the X-Ray SDK at all.
+
+API Gateway samples the requests with one X-Ray sampling rule per route of
+the API (api.get_api_resources). A "default" entry and entries by route name set the
+reservoir (traced requests per second) and the fixed rate of the requests
+beyond it, so that hot routes can be sampled lightly:
+
+    tracing:
+      enabled: true
+      sampling:
+        default: {reservoir_size: 1, fixed_rate: 0.05}
+        getAllTodo: {reservoir_size: 1, fixed_rate: 0.01}
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import sys
+from typing import Any, Dict, List, Tuple
+import pulumi
+import pulumi_aws as aws
+from pydantic import BaseModel, ValidationError, validator
+from app_config import config
+from api import APIResourceFunction, get_api_resources
+from regions import regional_name
+
+
+project_name = pulumi.get_project()
+XRAY_POLICY_FILENAME = "xray_policy.json"  # in lambdasRolesPath
+# Environment variable of the handlers, see backend-src
+XRAY_TRACING_VARIABLE = "XRAY_TRACING"
+
+
+class SamplingRate(BaseModel):
+    reservoir_size: int = 1  # traced requests per second, before fixed_rate applies
+    fixed_rate: float = 0.05  # share of the requests beyond the reservoir
+
+    @validator("reservoir_size")
+    def _reservoir_size_validator(cls, reservoir_size: int) -> int:
+        if reservoir_size < 0:
+            raise ValueError("reservoir_size must be positive")
+        return reservoir_size
+
+    @validator("fixed_rate")
+    def _fixed_rate_validator(cls, fixed_rate: float) -> float:
+        if not 0 <= fixed_rate <= 1:
+            raise ValueError("fixed_rate must be between 0 and 1")
+        return fixed_rate
+
+
+class TracingSettings(BaseModel):
+    enabled: bool = False
+    priority: int = 1000  # priority of the first route rule, rules with a lower number are applied first
+    sampling: Dict[str, Dict[str, Any]] = {}
+
+    @validator("priority")
+    def _priority_validator(cls, priority: int) -> int:
+        if not 1 <= priority <= 9000:
+            raise ValueError("priority must be between 1 and 9000")
+        return priority
+
+    @validator("sampling")
+    def _sampling_validator(cls, sampling: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        for rate in sampling.values():
+            SamplingRate(**rate)
+        return sampling
+
+    def route_sampling(self, api_function: APIResourceFunction) -> SamplingRate:
+        return SamplingRate(**{
+            **self.sampling.get("default", {}),
+            **self.sampling.get(api_function.name, {}),
+        })
+
+
+def get_tracing_settings() -> TracingSettings:
+    """`tracing` stack config"""
+    try:
+        return TracingSettings(**(config.get_object("tracing") or {}))
+    except ValidationError as err:
+        print(err)
+        sys.exit(1)
+
+
+tracing_settings = get_tracing_settings()
+
+
+def url_path_pattern(path: str) -> str:
+    """Sampling rule pattern of an API path, eg "/item/{id}/done" -> "*/item/*/done".
+
+    The leading wildcard matches the stage prefix of REST API URLs.
+    """
+    return "*" + re.sub(r"\{[\w-]+\+?\}", "*", path)
+
+
+def traced_routes() -> List[Tuple[str, str, APIResourceFunction]]:
+    """Path, method and function of the routes with a backend, most specific paths first.
+
+    A wildcard of a path parameter also matches static segments and deeper
+    paths ("*/item/*" matches "/item/batch" and "/item/1/done"), so paths with
+    fewer parameters and more segments get their rules applied first.
+    """
+    routes = [
+        (path, method, api_function)
+        for path, resource in get_api_resources().items()
+        for method, api_function in resource.methods.items()
+        if api_function.integration_type != "MOCK"
+    ]
+    return sorted(routes, key=lambda route: (route[0].count("{"), -route[0].count("/")))
+
+
+def _rule_name(api_function: APIResourceFunction) -> str:
+    # Rule names are unique per account and region and at most 32 characters
+    stack_hash = hashlib.sha1(f"{project_name}/{pulumi.get_stack()}".encode()).hexdigest()[:7]
+    return f"{api_function.name[:24]}-{stack_hash}"
+
+
+def create_sampling_rules(
+    rest_api: aws.apigateway.RestApi,
+    stage: aws.apigateway.Stage,
+    settings: TracingSettings,
+) -> List[aws.xray.SamplingRule]:
+    """Sampling rules of the routes of a REST API stage, whose traces are named "<api name>/<stage>" """
+    service_name = pulumi.Output.concat(rest_api.name, "/", stage.stage_name)
+    rules = []
+    for priority, (path, method, api_function) in enumerate(traced_routes(), start=settings.priority):
+        rate = settings.route_sampling(api_function)
+        rules.append(aws.xray.SamplingRule(
+            regional_name(f"{api_function.name}SamplingRule"),
+            rule_name=_rule_name(api_function),
+            priority=priority,
+            reservoir_size=rate.reservoir_size,
+            fixed_rate=rate.fixed_rate,
+            service_name=service_name,
+            service_type="AWS::ApiGateway::Stage",
+            http_method=method,
+            url_path=url_path_pattern(path),
+            host="*",
+            resource_arn="*",
+            version=1,
+            opts=pulumi.ResourceOptions(parent=stage),
+        ))
+    return rules
@@ -2,14 +2,16 @@
 // SPDX-License-Identifier: MIT-0
 
 // default imports
-const AWSXRay = require("aws-xray-sdk-core");
-const AWS = AWSXRay.captureAWS(require("aws-sdk"));
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
 const { metricScope, Unit } = require("aws-embedded-metrics");
-const DDB = new AWS.DynamoDB({ apiVersion: "2012-10-08" });
 const { v1: uuidv1 } = require("uuid");
 
 // environment variables
-const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION } = process.env;
+const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION, COMPLETED_TTL_SECONDS, VERSIONS_TABLE_NAME } = process.env;
 const options = { region: REGION };
 AWS.config.update({ region: REGION });
 
@@ -29,14 +31,22 @@ const response = (statusCode, body, additionalHeaders) => ({
   },
 });
 
+// The consumed capacity is requested for the invocation metrics only, it is not part of the API
+const withoutCapacity = (data) => {
+  delete data.ConsumedCapacity;
+  return data;
+};
+
 function isValidRequest(event) {
   return event.body !== null;
 }
 
 function getCognitoUsername(event) {
   let authHeader = event.requestContext.authorizer;
-  if (authHeader !== null) {
-    return authHeader.claims["cognito:username"];
+  if (authHeader) {
+    // REST API Cognito authorizer (claims) or HTTP API JWT authorizer (jwt.claims)
+    let claims = authHeader.jwt ? authHeader.jwt.claims : authHeader.claims;
+    return claims["cognito:username"];
   }
   return null;
 }
@@ -61,6 +71,15 @@ function addRecord(event) {
     ...JSON.parse(event.body),
   };
 
+  delete item_body.expires_at;
+  // sparse attribute of the open items index, only present on open items
+  if (item_body.completed !== true) {
+    item_body.open_lastupdate_date = item_body.lastupdate_date;
+  } else if (COMPLETED_TTL_SECONDS) {
+    // completed items expire (table TTL), then they are archived
+    item_body.expires_at = Math.floor(Date.now() / 1000) + Number(COMPLETED_TTL_SECONDS);
+  }
+
   console.log(item_body);
 
   //final params to DynamoDB
@@ -72,23 +91,84 @@ function addRecord(event) {
   return docClient.put(params);
 }
 
+// Invalidates the read caches of the user's items, see aws-serverless-app/read_cache.py.
+// The write is already done when this fails, cached reads then expire after READ_CACHE_TTL_SECONDS.
+async function bumpVersion(metrics, username) {
+  if (!VERSIONS_TABLE_NAME) {
+    return;
+  }
+  try {
+    await docClient
+      .update({
+        TableName: VERSIONS_TABLE_NAME,
+        Key: { "cognito-username": username },
+        UpdateExpression: "ADD #version :one",
+        ExpressionAttributeNames: { "#version": "version" },
+        ExpressionAttributeValues: { ":one": 1 },
+      })
+      .promise();
+  } catch (err) {
+    console.error(err.message);
+    metrics.putMetric("VersionBumpError", 1, Unit.Count);
+  }
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
 // Lambda Handler
-exports.addToDoItem = metricScope((metrics) => async (event, context) => {
+exports.addToDoItem = metricScope(invocationMetrics((metrics) => async (event, context) => {
   metrics.setNamespace("TodoApp");
   metrics.putDimensions({ Service: "addTodo" });
   metrics.setProperty("RequestId", context.requestId);
 
-  if (!isValidRequest(context, event)) {
+  if (!isValidRequest(event)) {
     metrics.putMetric("Error", 1, Unit.Count);
     return response(400, { message: "Error: Invalid request" });
   }
 
   try {
     let data = await addRecord(event).promise();
+    await bumpVersion(metrics, getCognitoUsername(event));
     metrics.putMetric("Success", 1, Unit.Count);
-    return response(200, data);
+    return response(200, withoutCapacity(data));
   } catch (err) {
     metrics.putMetric("Error", 1, Unit.Count);
     return response(400, { message: err.message });
   }
-});
+}));
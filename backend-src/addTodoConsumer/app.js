@@ -0,0 +1,207 @@
+// Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+// default imports
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
+const { metricScope, Unit } = require("aws-embedded-metrics");
+
+// environment variables
+const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION, COMPLETED_TTL_SECONDS, VERSIONS_TABLE_NAME } = process.env;
+const options = { region: REGION };
+AWS.config.update({ region: REGION });
+
+if (ENDPOINT_OVERRIDE !== "") {
+  options.endpoint = ENDPOINT_OVERRIDE;
+}
+
+const docClient = new AWS.DynamoDB.DocumentClient(options);
+
+// DynamoDB limit of write requests per BatchWriteItem
+const WRITE_CHUNK_SIZE = 25;
+// Retries of unprocessed items inside one invocation, SQS redelivers the rest
+const MAX_ATTEMPTS = 4;
+const BASE_DELAY_MS = 50;
+const MAX_DELAY_MS = 1000;
+
+// Message attributes set by the API Gateway integration
+function messageAttribute(record, name) {
+  let attribute = record.messageAttributes && record.messageAttributes[name];
+  return attribute ? attribute.stringValue : undefined;
+}
+
+// The item of one queued request, or null when the message can never be written
+function recordItem(record) {
+  let username = messageAttribute(record, "username");
+  let id = messageAttribute(record, "itemId");
+  let fields;
+  try {
+    fields = JSON.parse(record.body);
+  } catch (err) {
+    return null;
+  }
+  if (!username || !id || fields === null || typeof fields !== "object" || Array.isArray(fields)) {
+    return null;
+  }
+
+  // the request time, so that a redelivered message writes the same item
+  let sent = Number(record.attributes.SentTimestamp);
+  let dISO = new Date(sent).toISOString();
+  // keys and dates are not taken from the request
+  let item = {
+    ...fields,
+    "cognito-username": username,
+    id,
+    creation_date: dISO,
+    lastupdate_date: dISO,
+  };
+  delete item.expires_at;
+  // sparse attribute of the open items index, only present on open items
+  if (item.completed !== true) {
+    item.open_lastupdate_date = item.lastupdate_date;
+  } else if (COMPLETED_TTL_SECONDS) {
+    // completed items expire (table TTL), then they are archived
+    item.expires_at = Math.floor(sent / 1000) + Number(COMPLETED_TTL_SECONDS);
+  }
+  return item;
+}
+
+function chunk(list, size) {
+  let chunks = [];
+  for (let i = 0; i < list.length; i += size) {
+    chunks.push(list.slice(i, i + size));
+  }
+  return chunks;
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function backoff(attempt) {
+  return Math.random() * Math.min(MAX_DELAY_MS, BASE_DELAY_MS * 2 ** attempt);
+}
+
+// Writes every item, retrying the unprocessed ones. Returns the ids of the
+// items that are still unprocessed after MAX_ATTEMPTS, or whose chunk failed.
+async function batchWrite(items) {
+  let unprocessed = [];
+  for (let chunkItems of chunk(items, WRITE_CHUNK_SIZE)) {
+    let requests = chunkItems.map((item) => ({ PutRequest: { Item: item } }));
+    try {
+      for (let attempt = 0; requests.length > 0; attempt++) {
+        if (attempt === MAX_ATTEMPTS) {
+          break;
+        }
+        if (attempt > 0) {
+          await sleep(backoff(attempt));
+        }
+        let data = await docClient
+          .batchWrite({ RequestItems: { [TABLE_NAME]: requests } })
+          .promise();
+        requests = (data.UnprocessedItems && data.UnprocessedItems[TABLE_NAME]) || [];
+      }
+    } catch (err) {
+      console.error(err.message);
+    }
+    unprocessed.push(...requests.map((r) => r.PutRequest.Item.id));
+  }
+  return unprocessed;
+}
+
+// Invalidates the read caches of the user's items, see aws-serverless-app/read_cache.py.
+// The write is already done when this fails, cached reads then expire after READ_CACHE_TTL_SECONDS.
+async function bumpVersion(metrics, username) {
+  if (!VERSIONS_TABLE_NAME) {
+    return;
+  }
+  try {
+    await docClient
+      .update({
+        TableName: VERSIONS_TABLE_NAME,
+        Key: { "cognito-username": username },
+        UpdateExpression: "ADD #version :one",
+        ExpressionAttributeNames: { "#version": "version" },
+        ExpressionAttributeValues: { ":one": 1 },
+      })
+      .promise();
+  } catch (err) {
+    console.error(err.message);
+    metrics.putMetric("VersionBumpError", 1, Unit.Count);
+  }
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
+// Lambda Handler, SQS event source with ReportBatchItemFailures
+exports.addToDoItems = metricScope(invocationMetrics((metrics) => async (event, context) => {
+  metrics.setNamespace("TodoApp");
+  metrics.putDimensions({ Service: "addTodoConsumer" });
+  metrics.setProperty("RequestId", context.requestId);
+
+  let failures = [];
+  // one write per item: BatchWriteItem rejects two requests for the same key
+  let items = new Map();
+  let messages = new Map();
+  for (let record of event.Records) {
+    let item = recordItem(record);
+    if (item === null) {
+      // retried until it moves to the dead-letter queue
+      console.error(`Invalid message ${record.messageId}`);
+      failures.push(record.messageId);
+      continue;
+    }
+    items.set(item.id, item);
+    messages.set(item.id, [...(messages.get(item.id) || []), record.messageId]);
+  }
+
+  let unprocessed = await batchWrite([...items.values()]);
+  let users = new Set([...items.values()].map((item) => item["cognito-username"]));
+  await Promise.all([...users].map((username) => bumpVersion(metrics, username)));
+  for (let id of unprocessed) {
+    failures.push(...messages.get(id));
+  }
+
+  metrics.putMetric("Messages", event.Records.length, Unit.Count);
+  metrics.putMetric("Written", items.size - unprocessed.length, Unit.Count);
+  metrics.putMetric("Failed", failures.length, Unit.Count);
+  // only the failed messages become visible again
+  return { batchItemFailures: failures.map((messageId) => ({ itemIdentifier: messageId })) };
+}));
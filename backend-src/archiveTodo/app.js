@@ -0,0 +1,128 @@
+// Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+// default imports
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
+const { metricScope, Unit } = require("aws-embedded-metrics");
+const zlib = require("zlib");
+
+// environment variables
+const { ARCHIVE_BUCKET, ARCHIVE_PREFIX, REGION } = process.env;
+AWS.config.update({ region: REGION });
+
+const s3 = new AWS.S3({ region: REGION });
+
+// Deletions made by the table TTL, the event source filter already drops the others
+function isExpiredItem(record) {
+  return (
+    record.eventName === "REMOVE" &&
+    record.userIdentity !== undefined &&
+    record.userIdentity.type === "Service" &&
+    record.userIdentity.principalId === "dynamodb.amazonaws.com"
+  );
+}
+
+// archived/<username>/<yyyy>/<mm>/<dd>/<first sequence>-<last sequence>.jsonl.gz
+// The key only depends on the records, so a retried batch overwrites its objects
+function archiveKey(username, records) {
+  let date = new Date(records[0].dynamodb.ApproximateCreationDateTime * 1000).toISOString();
+  let [yyyy, mm, dd] = date.slice(0, 10).split("-");
+  let first = records[0].dynamodb.SequenceNumber;
+  let last = records[records.length - 1].dynamodb.SequenceNumber;
+  return `${ARCHIVE_PREFIX}${encodeURIComponent(username)}/${yyyy}/${mm}/${dd}/${first}-${last}.jsonl.gz`;
+}
+
+function archivedItem(record) {
+  let { expires_at, ...item } = AWS.DynamoDB.Converter.unmarshall(record.dynamodb.OldImage);
+  item.archived_date = new Date(record.dynamodb.ApproximateCreationDateTime * 1000).toISOString();
+  return item;
+}
+
+// One gzip JSON Lines object per user
+function putArchive(username, records) {
+  let lines = records.map((record) => JSON.stringify(archivedItem(record))).join("\n") + "\n";
+  return s3
+    .putObject({
+      Bucket: ARCHIVE_BUCKET,
+      Key: archiveKey(username, records),
+      Body: zlib.gzipSync(lines),
+      ContentType: "application/gzip",
+    })
+    .promise();
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py
+let coldStart = true;
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
+// Lambda Handler, DynamoDB stream event source with ReportBatchItemFailures
+exports.archiveToDoItems = metricScope(invocationMetrics((metrics) => async (event, context) => {
+  metrics.setNamespace("TodoApp");
+  metrics.putDimensions({ Service: "archiveTodo" });
+  metrics.setProperty("RequestId", context.requestId);
+
+  let byUser = new Map();
+  event.Records.forEach((record, position) => {
+    if (!isExpiredItem(record) || !record.dynamodb.OldImage) {
+      return;
+    }
+    let username = record.dynamodb.Keys["cognito-username"].S;
+    if (!byUser.has(username)) {
+      byUser.set(username, []);
+    }
+    byUser.get(username).push({ record, position });
+  });
+
+  let users = [...byUser.entries()];
+  let results = await Promise.allSettled(
+    users.map(([username, entries]) => putArchive(username, entries.map((e) => e.record)))
+  );
+
+  // The batch is retried from the earliest record of a failed user
+  let failedPosition = null;
+  let archived = 0;
+  results.forEach((result, i) => {
+    let entries = users[i][1];
+    if (result.status === "fulfilled") {
+      archived += entries.length;
+      return;
+    }
+    console.error(result.reason.message);
+    if (failedPosition === null || entries[0].position < failedPosition) {
+      failedPosition = entries[0].position;
+    }
+  });
+
+  metrics.putMetric("Archived", archived, Unit.Count);
+  metrics.putMetric("ArchiveObjects", results.filter((r) => r.status === "fulfilled").length, Unit.Count);
+  metrics.putMetric("Failed", results.filter((r) => r.status === "rejected").length, Unit.Count);
+  if (failedPosition === null) {
+    return { batchItemFailures: [] };
+  }
+  return {
+    batchItemFailures: [{ itemIdentifier: event.Records[failedPosition].dynamodb.SequenceNumber }],
+  };
+}));
@@ -0,0 +1,166 @@
+// Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+// default imports
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
+const { metricScope, Unit } = require("aws-embedded-metrics");
+
+// environment variables
+const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION } = process.env;
+const options = { region: REGION };
+AWS.config.update({ region: REGION });
+
+if (ENDPOINT_OVERRIDE !== "") {
+  options.endpoint = ENDPOINT_OVERRIDE;
+}
+
+const docClient = new AWS.DynamoDB.DocumentClient(options);
+// response helper
+const response = (statusCode, body, additionalHeaders) => ({
+  statusCode,
+  body: JSON.stringify(body),
+  headers: {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    ...additionalHeaders,
+  },
+});
+
+// DynamoDB limit of keys per BatchGetItem, also the limit of ids per request
+const GET_CHUNK_SIZE = 100;
+const MAX_IDS = 100;
+// Retries of unprocessed keys, with exponential backoff and full jitter
+const MAX_ATTEMPTS = 8;
+const BASE_DELAY_MS = 50;
+const MAX_DELAY_MS = 2000;
+
+class RequestError extends Error {}
+
+function getCognitoUsername(event) {
+  let authHeader = event.requestContext.authorizer;
+  if (authHeader) {
+    // REST API Cognito authorizer (claims) or HTTP API JWT authorizer (jwt.claims)
+    let claims = authHeader.jwt ? authHeader.jwt.claims : authHeader.claims;
+    return claims["cognito:username"];
+  }
+  return null;
+}
+
+// ?ids=<id>,<id>,...
+function parseIds(event) {
+  let query = event.queryStringParameters || {};
+  if (!query.ids) {
+    throw new RequestError("ids is required");
+  }
+  let ids = [...new Set(query.ids.split(",").filter((id) => id !== ""))];
+  if (ids.length === 0 || ids.length > MAX_IDS || !ids.every((id) => /^[\w-]+$/.test(id))) {
+    throw new RequestError(`ids must be a comma separated list of 1 to ${MAX_IDS} item ids`);
+  }
+  return ids;
+}
+
+function chunk(list, size) {
+  let chunks = [];
+  for (let i = 0; i < list.length; i += size) {
+    chunks.push(list.slice(i, i + size));
+  }
+  return chunks;
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function backoff(attempt) {
+  return Math.random() * Math.min(MAX_DELAY_MS, BASE_DELAY_MS * 2 ** attempt);
+}
+
+// Reads every key, retrying the unprocessed ones
+async function batchGet(keys) {
+  let items = [];
+  for (let chunkKeys of chunk(keys, GET_CHUNK_SIZE)) {
+    for (let attempt = 0; chunkKeys.length > 0; attempt++) {
+      if (attempt === MAX_ATTEMPTS) {
+        throw new Error("Error: items could not be read, retry the request");
+      }
+      if (attempt > 0) {
+        await sleep(backoff(attempt));
+      }
+      let data = await docClient
+        .batchGet({ RequestItems: { [TABLE_NAME]: { Keys: chunkKeys } } })
+        .promise();
+      items.push(...(data.Responses[TABLE_NAME] || []));
+      let next = data.UnprocessedKeys && data.UnprocessedKeys[TABLE_NAME];
+      chunkKeys = next ? next.Keys : [];
+    }
+  }
+  return items;
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
+// Lambda Handler
+exports.batchGetToDoItems = metricScope(invocationMetrics((metrics) => async (event, context) => {
+  metrics.setNamespace("TodoApp");
+  metrics.putDimensions({ Service: "batchGetTodo" });
+  metrics.setProperty("RequestId", context.requestId);
+
+  try {
+    let username = getCognitoUsername(event);
+    let ids = parseIds(event);
+    // Keys are scoped to the caller, other users' items are never read
+    let items = await batchGet(ids.map((id) => ({ "cognito-username": username, id })));
+
+    // BatchGetItem returns items in any order, answer in the requested order
+    let byId = new Map(items.map((item) => [item.id, item]));
+    let data = {
+      Items: ids.filter((id) => byId.has(id)).map((id) => byId.get(id)),
+      notFound: ids.filter((id) => !byId.has(id)),
+    };
+    data.Count = data.Items.length;
+    metrics.putMetric("Success", 1, Unit.Count);
+    return response(200, data);
+  } catch (err) {
+    metrics.putMetric("Error", 1, Unit.Count);
+    console.error(err.message);
+    return response(err instanceof RequestError ? 400 : 500, { message: err.message });
+  }
+}));
@@ -0,0 +1,317 @@
+// Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+// default imports
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
+const { metricScope, Unit } = require("aws-embedded-metrics");
+const { v1: uuidv1 } = require("uuid");
+
+// environment variables
+const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION, COMPLETED_TTL_SECONDS, VERSIONS_TABLE_NAME } = process.env;
+const options = { region: REGION };
+AWS.config.update({ region: REGION });
+
+if (ENDPOINT_OVERRIDE !== "") {
+  options.endpoint = ENDPOINT_OVERRIDE;
+}
+
+const docClient = new AWS.DynamoDB.DocumentClient(options);
+// response helper
+const response = (statusCode, body, additionalHeaders) => ({
+  statusCode,
+  body: JSON.stringify(body),
+  headers: {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    ...additionalHeaders,
+  },
+});
+
+// DynamoDB limit: 25 write requests per BatchWriteItem, also the number of concurrent completions
+const WRITE_CHUNK_SIZE = 25;
+// Operations of one request (create + complete + delete)
+const MAX_OPERATIONS = 100;
+// Retries of unprocessed items, with exponential backoff and full jitter
+const MAX_ATTEMPTS = 8;
+const BASE_DELAY_MS = 50;
+const MAX_DELAY_MS = 2000;
+
+class RequestError extends Error {}
+
+function getCognitoUsername(event) {
+  let authHeader = event.requestContext.authorizer;
+  if (authHeader) {
+    // REST API Cognito authorizer (claims) or HTTP API JWT authorizer (jwt.claims)
+    let claims = authHeader.jwt ? authHeader.jwt.claims : authHeader.claims;
+    return claims["cognito:username"];
+  }
+  return null;
+}
+
+function isValidId(id) {
+  return typeof id === "string" && /^[\w-]+$/.test(id);
+}
+
+// {"create": [{item, completed}], "complete": [id], "delete": [id]}
+function parseBatchRequest(event) {
+  if (event.body === null || event.body === undefined) {
+    throw new RequestError("Error: Invalid request");
+  }
+  let body;
+  try {
+    body = typeof event.body === "string" ? JSON.parse(event.body) : event.body;
+  } catch (err) {
+    throw new RequestError("Error: body is not valid JSON");
+  }
+
+  let request = { create: [], complete: [], delete: [] };
+  for (let operation of Object.keys(request)) {
+    let values = body[operation] === undefined ? [] : body[operation];
+    if (!Array.isArray(values)) {
+      throw new RequestError(`${operation} must be a list`);
+    }
+    request[operation] = values;
+  }
+
+  for (let item of request.create) {
+    if (item === null || typeof item !== "object" || Array.isArray(item)) {
+      throw new RequestError("create must be a list of items");
+    }
+  }
+  let ids = [...request.complete, ...request.delete];
+  if (!ids.every(isValidId)) {
+    throw new RequestError("complete and delete must be lists of item ids");
+  }
+  // BatchWriteItem rejects two requests for the same key
+  if (new Set(ids).size !== ids.length) {
+    throw new RequestError("an item id appears more than once");
+  }
+  let operations = request.create.length + ids.length;
+  if (operations === 0 || operations > MAX_OPERATIONS) {
+    throw new RequestError(`a batch has from 1 to ${MAX_OPERATIONS} operations`);
+  }
+  return request;
+}
+
+function chunk(list, size) {
+  let chunks = [];
+  for (let i = 0; i < list.length; i += size) {
+    chunks.push(list.slice(i, i + size));
+  }
+  return chunks;
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function backoff(attempt) {
+  return Math.random() * Math.min(MAX_DELAY_MS, BASE_DELAY_MS * 2 ** attempt);
+}
+
+// Writes every request, retrying the unprocessed ones. Returns the requests
+// that are still unprocessed after MAX_ATTEMPTS.
+async function batchWrite(writeRequests) {
+  let unprocessed = [];
+  for (let requests of chunk(writeRequests, WRITE_CHUNK_SIZE)) {
+    for (let attempt = 0; requests.length > 0; attempt++) {
+      if (attempt === MAX_ATTEMPTS) {
+        unprocessed.push(...requests);
+        break;
+      }
+      if (attempt > 0) {
+        await sleep(backoff(attempt));
+      }
+      let data = await docClient
+        .batchWrite({ RequestItems: { [TABLE_NAME]: requests } })
+        .promise();
+      requests = (data.UnprocessedItems && data.UnprocessedItems[TABLE_NAME]) || [];
+    }
+  }
+  return unprocessed;
+}
+
+// TTL attribute of completed items, they are archived when they expire
+function expiresAt() {
+  return Math.floor(Date.now() / 1000) + Number(COMPLETED_TTL_SECONDS);
+}
+
+function newItem(username, fields) {
+  // auto generated date fields
+  let dISO = new Date().toISOString();
+  // keys and dates are not taken from the request
+  let item = {
+    ...fields,
+    "cognito-username": username,
+    id: uuidv1(),
+    creation_date: dISO,
+    lastupdate_date: dISO,
+  };
+  delete item.expires_at;
+  // sparse attribute of the open items index, only present on open items
+  if (item.completed !== true) {
+    item.open_lastupdate_date = item.lastupdate_date;
+  } else if (COMPLETED_TTL_SECONDS) {
+    item.expires_at = expiresAt();
+  }
+  return item;
+}
+
+// BatchWriteItem has no updates: every item is completed by a conditional UpdateItem,
+// so a concurrent update is kept and a deleted item is not written back
+async function completeItems(username, ids) {
+  let outcomes = new Map();
+  let expression = "set completed = :completed remove open_lastupdate_date";
+  let values = { ":completed": true };
+  // completed items expire (table TTL), then they are archived
+  if (COMPLETED_TTL_SECONDS) {
+    expression = "set completed = :completed, expires_at = :expires remove open_lastupdate_date";
+    values[":expires"] = expiresAt();
+  }
+  for (let chunkIds of chunk(ids, WRITE_CHUNK_SIZE)) {
+    await Promise.all(
+      chunkIds.map(async (id) => {
+        try {
+          await docClient
+            .update({
+              TableName: TABLE_NAME,
+              Key: { "cognito-username": username, id },
+              UpdateExpression: expression,
+              ConditionExpression: "attribute_exists(id)",
+              ExpressionAttributeValues: values,
+            })
+            .promise();
+          outcomes.set(id, "completed");
+        } catch (err) {
+          if (err.code === "ConditionalCheckFailedException") {
+            outcomes.set(id, "missing");
+          } else if (err.retryable) {
+            // throttled after the SDK retries, the client may resend it
+            outcomes.set(id, "unprocessed");
+          } else {
+            throw err;
+          }
+        }
+      })
+    );
+  }
+  // in the order of the request
+  let withOutcome = (outcome) => ids.filter((id) => outcomes.get(id) === outcome);
+  return { completed: withOutcome("completed"), missing: withOutcome("missing"), unprocessed: withOutcome("unprocessed") };
+}
+
+async function processBatch(username, request) {
+  let created = request.create.map((fields) => newItem(username, fields));
+  let completed = await completeItems(username, request.complete);
+
+  let writeRequests = [
+    ...created.map((item) => ({ PutRequest: { Item: item } })),
+    ...request.delete.map((id) => ({
+      DeleteRequest: { Key: { "cognito-username": username, id } },
+    })),
+  ];
+  let unprocessed = await batchWrite(writeRequests);
+
+  let unprocessedIds = new Set(
+    unprocessed.map((r) => (r.PutRequest ? r.PutRequest.Item.id : r.DeleteRequest.Key.id))
+  );
+  let isProcessed = (id) => !unprocessedIds.has(id);
+  // unprocessed operations are returned in the request format, so they can be resent as is
+  return {
+    created: created.filter((item) => isProcessed(item.id)),
+    completed: completed.completed,
+    deleted: request.delete.filter(isProcessed),
+    notFound: completed.missing,
+    unprocessed: {
+      create: request.create.filter((fields, i) => !isProcessed(created[i].id)),
+      complete: completed.unprocessed,
+      delete: request.delete.filter((id) => !isProcessed(id)),
+    },
+    unprocessedCount: unprocessed.length + completed.unprocessed.length,
+  };
+}
+
+// Invalidates the read caches of the user's items, see aws-serverless-app/read_cache.py.
+// The write is already done when this fails, cached reads then expire after READ_CACHE_TTL_SECONDS.
+async function bumpVersion(metrics, username) {
+  if (!VERSIONS_TABLE_NAME) {
+    return;
+  }
+  try {
+    await docClient
+      .update({
+        TableName: VERSIONS_TABLE_NAME,
+        Key: { "cognito-username": username },
+        UpdateExpression: "ADD #version :one",
+        ExpressionAttributeNames: { "#version": "version" },
+        ExpressionAttributeValues: { ":one": 1 },
+      })
+      .promise();
+  } catch (err) {
+    console.error(err.message);
+    metrics.putMetric("VersionBumpError", 1, Unit.Count);
+  }
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
+// Lambda Handler
+exports.batchWriteToDoItems = metricScope(invocationMetrics((metrics) => async (event, context) => {
+  metrics.setNamespace("TodoApp");
+  metrics.putDimensions({ Service: "batchWriteTodo" });
+  metrics.setProperty("RequestId", context.requestId);
+
+  try {
+    let username = getCognitoUsername(event);
+    let request = parseBatchRequest(event);
+    let data = await processBatch(username, request);
+    await bumpVersion(metrics, username);
+    metrics.putMetric("BatchOperations", request.create.length + request.complete.length + request.delete.length, Unit.Count);
+    metrics.putMetric("Unprocessed", data.unprocessedCount, Unit.Count);
+    metrics.putMetric("Success", 1, Unit.Count);
+    // Multi-Status: some operations were throttled, the client may resend them
+    return response(data.unprocessedCount > 0 ? 207 : 200, data);
+  } catch (err) {
+    metrics.putMetric("Error", 1, Unit.Count);
+    console.error(err.message);
+    return response(err instanceof RequestError ? 400 : 500, { message: err.message });
+  }
+}));
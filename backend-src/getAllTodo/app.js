@@ -2,13 +2,27 @@
 // SPDX-License-Identifier: MIT-0
 
 // default imports
-const AWSXRay = require("aws-xray-sdk-core");
-const AWS = AWSXRay.captureAWS(require("aws-sdk"));
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
 const { metricScope, Unit } = require("aws-embedded-metrics");
-const DDB = new AWS.DynamoDB({ apiVersion: "2012-10-08" });
+const crypto = require("crypto");
+const zlib = require("zlib");
 
 // environment variables
-const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION } = process.env;
+const {
+  TABLE_NAME,
+  ENDPOINT_OVERRIDE,
+  REGION,
+  OPEN_ITEMS_INDEX,
+  ARCHIVE_BUCKET,
+  ARCHIVE_PREFIX,
+  VERSIONS_TABLE_NAME,
+  READ_CACHE_MAX_ENTRIES,
+  READ_CACHE_TTL_SECONDS,
+} = process.env;
 const options = { region: REGION };
 AWS.config.update({ region: REGION });
 
@@ -17,6 +31,8 @@ if (ENDPOINT_OVERRIDE !== "") {
 }
 
 const docClient = new AWS.DynamoDB.DocumentClient(options);
+// ENDPOINT_OVERRIDE is the DynamoDB endpoint, the archive is always read from S3
+const s3 = new AWS.S3({ region: REGION });
 // response helper
 const response = (statusCode, body, additionalHeaders) => ({
   statusCode,
@@ -31,14 +47,64 @@ const response = (statusCode, body, additionalHeaders) => ({
 // Get cognito username from claims
 function getCognitoUsername(event) {
   let authHeader = event.requestContext.authorizer;
-  if (authHeader !== null) {
-    return authHeader.claims["cognito:username"];
+  if (authHeader) {
+    // REST API Cognito authorizer (claims) or HTTP API JWT authorizer (jwt.claims)
+    let claims = authHeader.jwt ? authHeader.jwt.claims : authHeader.claims;
+    return claims["cognito:username"];
   }
   return null;
 }
 
-// Retrieve all the items by cognito-username
-function getRecords(username) {
+const MAX_LIMIT = 100;
+// Archive objects read by one request, each holds the items a user had expire in one archiver batch
+const MAX_ARCHIVE_OBJECTS = 20;
+
+class RequestError extends Error {}
+
+// Parse and validate limit, next and fields query parameters
+function parseListRequest(event) {
+  let query = event.queryStringParameters || {};
+  let request = { openOnly: query.open === "true", archived: query.archived === "true" };
+  if (request.archived && !ARCHIVE_BUCKET) {
+    throw new RequestError("the archive of completed items is not enabled");
+  }
+
+  if (query.limit !== undefined) {
+    let limit = Number(query.limit);
+    if (!Number.isInteger(limit) || limit < 1 || limit > MAX_LIMIT) {
+      throw new RequestError(`limit must be an integer from 1 to ${MAX_LIMIT}`);
+    }
+    request.limit = limit;
+  }
+
+  if (query.next !== undefined) {
+    try {
+      request.startKey = JSON.parse(
+        Buffer.from(query.next, "base64url").toString("utf8")
+      );
+    } catch (err) {
+      throw new RequestError("next is not a valid pagination token");
+    }
+  }
+
+  if (query.fields !== undefined) {
+    let fields = query.fields.split(",").filter((field) => field !== "");
+    if (fields.length === 0 || !fields.every((f) => /^[\w-]+$/.test(f))) {
+      throw new RequestError("fields must be a comma separated list of attributes");
+    }
+    // the keys are always returned, clients need the id to update items
+    request.fields = [...new Set(["id", ...fields])];
+  }
+  return request;
+}
+
+// Opaque pagination token from DynamoDB LastEvaluatedKey
+function encodeNextToken(lastEvaluatedKey) {
+  return Buffer.from(JSON.stringify(lastEvaluatedKey)).toString("base64url");
+}
+
+// Retrieve a page of items by cognito-username
+function getRecords(username, request, exclusiveStartKey) {
   let params = {
     TableName: TABLE_NAME,
     KeyConditionExpression: "#username = :username",
@@ -50,23 +116,223 @@ function getRecords(username) {
     },
   };
 
+  // open items by lastupdate_date, read from the sparse index
+  if (request.openOnly && OPEN_ITEMS_INDEX) {
+    params.IndexName = OPEN_ITEMS_INDEX;
+    params.ScanIndexForward = false;
+  }
+  if (request.limit) {
+    params.Limit = request.limit;
+  }
+  if (exclusiveStartKey) {
+    params.ExclusiveStartKey = exclusiveStartKey;
+  }
+  if (request.fields) {
+    params.ProjectionExpression = request.fields
+      .map((field, i) => {
+        params.ExpressionAttributeNames[`#f${i}`] = field;
+        return `#f${i}`;
+      })
+      .join(", ");
+  }
+
   return docClient.query(params);
 }
 
+// A single page when limit is set, otherwise every page, so that
+// the 1 MB DynamoDB page size never truncates the list silently
+async function listRecords(username, request) {
+  let items = [];
+  let scannedCount = 0;
+  let startKey = request.startKey;
+  do {
+    let page = await getRecords(username, request, startKey).promise();
+    items.push(...page.Items);
+    scannedCount += page.ScannedCount;
+    startKey = page.LastEvaluatedKey;
+  } while (startKey && !request.limit);
+
+  let result = { Items: items, Count: items.length, ScannedCount: scannedCount };
+  if (startKey) {
+    result.next = encodeNextToken(startKey);
+  }
+  return result;
+}
+
+// A page of archived items, the archive objects of the user in key (date) order.
+// With archived=true, limit is the number of archive objects of a page.
+async function listArchivedRecords(username, request) {
+  let params = {
+    Bucket: ARCHIVE_BUCKET,
+    Prefix: `${ARCHIVE_PREFIX}${encodeURIComponent(username)}/`,
+    MaxKeys: Math.min(request.limit || MAX_ARCHIVE_OBJECTS, MAX_ARCHIVE_OBJECTS),
+  };
+  if (request.startKey) {
+    params.ContinuationToken = request.startKey.ContinuationToken;
+  }
+  let listing = await s3.listObjectsV2(params).promise();
+  let objects = await Promise.all(
+    listing.Contents.map((object) =>
+      s3.getObject({ Bucket: ARCHIVE_BUCKET, Key: object.Key }).promise()
+    )
+  );
+
+  // a retried stream batch may archive an item twice
+  let items = new Map();
+  for (let object of objects) {
+    for (let line of zlib.gunzipSync(object.Body).toString("utf8").split("\n")) {
+      if (line !== "") {
+        let item = JSON.parse(line);
+        items.set(item.id, item);
+      }
+    }
+  }
+  let result = [...items.values()];
+  if (request.fields) {
+    result = result.map((item) =>
+      Object.fromEntries(request.fields.filter((f) => f in item).map((f) => [f, item[f]]))
+    );
+  }
+
+  let data = { Items: result, Count: result.length, ScannedCount: objects.length };
+  if (listing.IsTruncated) {
+    data.next = encodeNextToken({ ContinuationToken: listing.NextContinuationToken });
+  }
+  return data;
+}
+
+// Per-container read cache, see aws-serverless-app/read_cache.py. Entries are
+// only served for the user's current write version, which the write handlers bump.
+const cacheMaxEntries = Number(READ_CACHE_MAX_ENTRIES || 500);
+const cacheTtlMs = Number(READ_CACHE_TTL_SECONDS || 60) * 1000;
+// LRU: a Map iterates in insertion order, used entries are moved to the end
+const cache = new Map();
+
+function cacheGet(key, version) {
+  let entry = cache.get(key);
+  if (entry === undefined) {
+    return undefined;
+  }
+  cache.delete(key);
+  if (entry.version !== version || entry.expires <= Date.now()) {
+    return undefined;
+  }
+  cache.set(key, entry);
+  return entry.value;
+}
+
+function cacheSet(key, version, value) {
+  cache.delete(key);
+  cache.set(key, { version, value, expires: Date.now() + cacheTtlMs });
+  if (cache.size > cacheMaxEntries) {
+    cache.delete(cache.keys().next().value);
+  }
+}
+
+// One strongly consistent read of a small item instead of the items query
+async function getVersion(username) {
+  let data = await docClient
+    .get({
+      TableName: VERSIONS_TABLE_NAME,
+      Key: { "cognito-username": username },
+      ConsistentRead: true,
+    })
+    .promise();
+  return data.Item ? data.Item.version : 0;
+}
+
+async function cachedRead(metrics, username, key, load) {
+  if (!VERSIONS_TABLE_NAME) {
+    return load();
+  }
+  let version = await getVersion(username);
+  let cacheKey = `${username}\n${key}`;
+  let value = cacheGet(cacheKey, version);
+  metrics.putMetric("CacheHit", value === undefined ? 0 : 1, Unit.Count);
+  metrics.putMetric("CacheMiss", value === undefined ? 1 : 0, Unit.Count);
+  if (value === undefined) {
+    value = await load();
+    cacheSet(cacheKey, version, value);
+  }
+  return value;
+}
+
+function getHeader(event, name) {
+  let headers = event.headers || {};
+  let key = Object.keys(headers).find((h) => h.toLowerCase() === name);
+  return key ? headers[key] : undefined;
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
 // Lambda Handler
-exports.getAllToDoItem = metricScope((metrics) => async (event, context) => {
+exports.getAllToDoItem = metricScope(invocationMetrics((metrics) => async (event, context) => {
   metrics.setNamespace("TodoApp");
   metrics.putDimensions({ Service: "getAllTodo" });
   metrics.setProperty("RequestId", context.requestId);
 
   try {
     let username = getCognitoUsername(event);
-    let data = await getRecords(username).promise();
+    let request = parseListRequest(event);
+    // the archive only changes by TTL, without a write version, it is not cached
+    let data = request.archived
+      ? await listArchivedRecords(username, request)
+      : await cachedRead(metrics, username, `list/${JSON.stringify(request)}`, () =>
+          listRecords(username, request)
+        );
+
+    let body = JSON.stringify(data);
+    let etag = `"${crypto.createHash("sha1").update(body).digest("base64url")}"`;
     metrics.putMetric("Success", 1, Unit.Count);
-    return response(200, data);
+
+    if (getHeader(event, "if-none-match") === etag) {
+      metrics.putMetric("NotModified", 1, Unit.Count);
+      return {
+        statusCode: 304,
+        body: "",
+        headers: { ETag: etag, "Access-Control-Allow-Origin": "*" },
+      };
+    }
+    return response(200, data, { ETag: etag });
   } catch (err) {
     metrics.putMetric("Error", 1, Unit.Count);
     console.error(err.message);
     return response(400, { message: err.message });
   }
-});
+}));
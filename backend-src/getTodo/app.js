@@ -2,13 +2,22 @@
 // SPDX-License-Identifier: MIT-0
 
 // default imports
-const AWSXRay = require("aws-xray-sdk-core");
-const AWS = AWSXRay.captureAWS(require("aws-sdk"));
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
 const { metricScope, Unit } = require("aws-embedded-metrics");
-const DDB = new AWS.DynamoDB({ apiVersion: "2012-10-08" });
 
 // environment variables
-const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION } = process.env;
+const {
+  TABLE_NAME,
+  ENDPOINT_OVERRIDE,
+  REGION,
+  VERSIONS_TABLE_NAME,
+  READ_CACHE_MAX_ENTRIES,
+  READ_CACHE_TTL_SECONDS,
+} = process.env;
 const options = { region: REGION };
 AWS.config.update({ region: REGION });
 
@@ -28,6 +37,12 @@ const response = (statusCode, body, additionalHeaders) => ({
   },
 });
 
+// The consumed capacity is requested for the invocation metrics only, it is not part of the API
+const withoutCapacity = (data) => {
+  delete data.ConsumedCapacity;
+  return data;
+};
+
 function isValidRequest(event) {
   return (
     event !== null &&
@@ -39,8 +54,10 @@ function isValidRequest(event) {
 
 function getCognitoUsername(event) {
   let authHeader = event.requestContext.authorizer;
-  if (authHeader !== null) {
-    return authHeader.claims["cognito:username"];
+  if (authHeader) {
+    // REST API Cognito authorizer (claims) or HTTP API JWT authorizer (jwt.claims)
+    let claims = authHeader.jwt ? authHeader.jwt.claims : authHeader.claims;
+    return claims["cognito:username"];
   }
   return null;
 }
@@ -57,23 +74,120 @@ function getRecordById(username, recordId) {
   return docClient.get(params);
 }
 
+// Per-container read cache, see aws-serverless-app/read_cache.py. Entries are
+// only served for the user's current write version, which the write handlers bump.
+const cacheMaxEntries = Number(READ_CACHE_MAX_ENTRIES || 500);
+const cacheTtlMs = Number(READ_CACHE_TTL_SECONDS || 60) * 1000;
+// LRU: a Map iterates in insertion order, used entries are moved to the end
+const cache = new Map();
+
+function cacheGet(key, version) {
+  let entry = cache.get(key);
+  if (entry === undefined) {
+    return undefined;
+  }
+  cache.delete(key);
+  if (entry.version !== version || entry.expires <= Date.now()) {
+    return undefined;
+  }
+  cache.set(key, entry);
+  return entry.value;
+}
+
+function cacheSet(key, version, value) {
+  cache.delete(key);
+  cache.set(key, { version, value, expires: Date.now() + cacheTtlMs });
+  if (cache.size > cacheMaxEntries) {
+    cache.delete(cache.keys().next().value);
+  }
+}
+
+// One strongly consistent read of a small item instead of the items query
+async function getVersion(username) {
+  let data = await docClient
+    .get({
+      TableName: VERSIONS_TABLE_NAME,
+      Key: { "cognito-username": username },
+      ConsistentRead: true,
+    })
+    .promise();
+  return data.Item ? data.Item.version : 0;
+}
+
+async function cachedRead(metrics, username, key, load) {
+  if (!VERSIONS_TABLE_NAME) {
+    return load();
+  }
+  let version = await getVersion(username);
+  let cacheKey = `${username}\n${key}`;
+  let value = cacheGet(cacheKey, version);
+  metrics.putMetric("CacheHit", value === undefined ? 0 : 1, Unit.Count);
+  metrics.putMetric("CacheMiss", value === undefined ? 1 : 0, Unit.Count);
+  if (value === undefined) {
+    value = await load();
+    cacheSet(cacheKey, version, value);
+  }
+  return value;
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
 // Lambda Handler
-exports.getToDoItem = metricScope((metrics) => async (event, context) => {
+exports.getToDoItem = metricScope(invocationMetrics((metrics) => async (event, context) => {
   metrics.setNamespace("TodoApp");
   metrics.putDimensions({ Service: "getTodo" });
   metrics.setProperty("RequestId", context.requestId);
-  if (!isValidRequest(context, event)) {
+  if (!isValidRequest(event)) {
     metrics.putMetric("Error", 1, Unit.Count);
     return response(400, { message: "Error: Invalid request" });
   }
 
   try {
     let username = getCognitoUsername(event);
-    let data = await getRecordById(username, event.pathParameters.id).promise();
+    let id = event.pathParameters.id;
+    let data = await cachedRead(metrics, username, `item/${id}`, () =>
+      getRecordById(username, id).promise().then(withoutCapacity)
+    );
     metrics.putMetric("Success", 1, Unit.Count);
     return response(200, data);
   } catch (err) {
     metrics.putMetric("Error", 1, Unit.Count);
     return response(400, { message: err.message });
   }
-});
+}));
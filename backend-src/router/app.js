@@ -0,0 +1,111 @@
+// Single-function deployment of the todo API.
+//
+// Every handler of backend-src is packaged next to this file (handlers/<name>/)
+// together with routes.json, the route table of aws-serverless-app/api.py.
+// Requests are dispatched on the HTTP method and the request path, so one warm
+// container serves every route, behind a REST API (payload 1.0) or an HTTP API
+// (payload 2.0). Handler modules are loaded on their first request.
+
+const routeTable = require("./routes.json");
+
+// response helper
+const response = (statusCode, body, additionalHeaders) => ({
+  statusCode,
+  body: JSON.stringify(body),
+  headers: {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    ...additionalHeaders,
+  },
+});
+
+// "/item/{id}/done" -> /^\/item\/([^/]+)\/done$/ and its parameter names
+function compilePath(path) {
+  const names = [];
+  let greedy = false;
+  const pattern = path
+    .split("/")
+    .map((part) => {
+      const match = /^\{([\w-]+)(\+?)\}$/.exec(part);
+      if (!match) {
+        return part.replace(/[.*+?^${}()|[\]\\]/g, "\\$&");
+      }
+      names.push(match[1]);
+      greedy = greedy || match[2] === "+";
+      return match[2] ? "(.+)" : "([^/]+)";
+    })
+    .join("/");
+  return { regex: new RegExp(`^${pattern}$`), names, greedy };
+}
+
+// Like API Gateway, static segments take precedence over path parameters
+// (/item/batch over /item/{id}) and greedy parameters come last
+const specificity = (route) => route.names.length + (route.greedy ? routeTable.length : 0);
+const routes = routeTable
+  .map((route) => ({ ...route, ...compilePath(route.path) }))
+  .sort((a, b) => specificity(a) - specificity(b));
+const handlers = {};
+
+function getHandler(route) {
+  const key = `${route.module}.${route.export}`;
+  if (!(key in handlers)) {
+    handlers[key] = require(route.module)[route.export];
+  }
+  return handlers[key];
+}
+
+function matchRoute(method, path, resource) {
+  // Explicit API Gateway resources name the route, {proxy+} resources only carry the path
+  let candidates = routes.filter((route) => route.path === resource);
+  if (candidates.length === 0) {
+    candidates = routes;
+  }
+  let pathMatched = false;
+  for (let route of candidates) {
+    let match = route.regex.exec(path);
+    if (!match && resource !== route.path) {
+      continue;
+    }
+    pathMatched = true;
+    if (route.method === method) {
+      let pathParameters = {};
+      if (match) {
+        route.names.forEach((name, i) => {
+          pathParameters[name] = decodeURIComponent(match[i + 1]);
+        });
+      }
+      return { route, pathParameters };
+    }
+  }
+  return { route: null, pathMatched };
+}
+
+// Lambda Handler
+exports.handler = async (event, context) => {
+  let method, path, resource;
+  if (event.version === "2.0") {
+    // HTTP API payload: the route key is "<METHOD> <path>", rawPath includes a named stage
+    method = event.requestContext.http.method;
+    path = event.rawPath;
+    resource = event.routeKey.split(" ").pop();
+  } else {
+    method = event.httpMethod || (event.requestContext && event.requestContext.httpMethod);
+    path = event.path || "";
+    resource = event.resource;
+  }
+  const { route, pathParameters, pathMatched } = matchRoute(method, path, resource);
+  if (!route) {
+    return pathMatched
+      ? response(405, { message: `Error: ${method} is not allowed` })
+      : response(404, { message: "Error: Not found" });
+  }
+
+  const routedEvent = {
+    ...event,
+    resource: route.path,
+    pathParameters: Object.keys(pathParameters).length
+      ? { ...(event.pathParameters || {}), ...pathParameters }
+      : event.pathParameters,
+  };
+  return getHandler(route)(routedEvent, context);
+};
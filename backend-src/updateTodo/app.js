@@ -2,13 +2,15 @@
 // SPDX-License-Identifier: MIT-0
 
 // default imports
-const AWSXRay = require("aws-xray-sdk-core");
-const AWS = AWSXRay.captureAWS(require("aws-sdk"));
+// X-Ray only wraps the SDK when tracing is on, see aws-serverless-app/tracing.py
+const AWS =
+  process.env.XRAY_TRACING === "1"
+    ? require("aws-xray-sdk-core").captureAWS(require("aws-sdk"))
+    : require("aws-sdk");
 const { metricScope, Unit } = require("aws-embedded-metrics");
-const DDB = new AWS.DynamoDB({ apiVersion: "2012-10-08" });
 
 // environment variables
-const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION } = process.env;
+const { TABLE_NAME, ENDPOINT_OVERRIDE, REGION, COMPLETED_TTL_SECONDS, VERSIONS_TABLE_NAME } = process.env;
 const options = { region: REGION };
 AWS.config.update({ region: REGION });
 
@@ -28,6 +30,12 @@ const response = (statusCode, body, additionalHeaders) => ({
   },
 });
 
+// The consumed capacity is requested for the invocation metrics only, it is not part of the API
+const withoutCapacity = (data) => {
+  delete data.ConsumedCapacity;
+  return data;
+};
+
 function isValidRequest(event) {
   let isIdValid =
     event !== null &&
@@ -44,21 +52,31 @@ function isValidRequest(event) {
 
 function getCognitoUsername(event) {
   let authHeader = event.requestContext.authorizer;
-  if (authHeader !== null) {
-    return authHeader.claims["cognito:username"];
+  if (authHeader) {
+    // REST API Cognito authorizer (claims) or HTTP API JWT authorizer (jwt.claims)
+    let claims = authHeader.jwt ? authHeader.jwt.claims : authHeader.claims;
+    return claims["cognito:username"];
   }
   return null;
 }
 
 function updateRecord(username, recordId, eventBody) {
   let d = new Date();
+  // open items are kept in the sparse open items index,
+  // completed items expire (table TTL) and reopened items do not
+  let expires = eventBody.completed === true && COMPLETED_TTL_SECONDS;
+  let openExpression =
+    eventBody.completed === true
+      ? (expires ? ", expires_at = :expires" : "") + " remove open_lastupdate_date"
+      : ", open_lastupdate_date = :lud remove expires_at";
   const params = {
     TableName: TABLE_NAME,
     Key: {
       "cognito-username": username,
       id: recordId,
     },
-    UpdateExpression: "set completed = :c, lastupdate_date = :lud, #i = :i",
+    UpdateExpression:
+      "set completed = :c, lastupdate_date = :lud, #i = :i" + openExpression,
     ExpressionAttributeNames: {
       // using ExpressionAttributeNames to show how to
       // overcome reserved names, in this case <item>
@@ -71,31 +89,99 @@ function updateRecord(username, recordId, eventBody) {
     },
     ReturnValues: "ALL_NEW",
   };
+  if (expires) {
+    params.ExpressionAttributeValues[":expires"] =
+      Math.floor(Date.now() / 1000) + Number(COMPLETED_TTL_SECONDS);
+  }
 
   return docClient.update(params);
 }
 
+// Invalidates the read caches of the user's items, see aws-serverless-app/read_cache.py.
+// The write is already done when this fails, cached reads then expire after READ_CACHE_TTL_SECONDS.
+async function bumpVersion(metrics, username) {
+  if (!VERSIONS_TABLE_NAME) {
+    return;
+  }
+  try {
+    await docClient
+      .update({
+        TableName: VERSIONS_TABLE_NAME,
+        Key: { "cognito-username": username },
+        UpdateExpression: "ADD #version :one",
+        ExpressionAttributeNames: { "#version": "version" },
+        ExpressionAttributeValues: { ":one": 1 },
+      })
+      .promise();
+  } catch (err) {
+    console.error(err.message);
+    metrics.putMetric("VersionBumpError", 1, Unit.Count);
+  }
+}
+
+// Invocation metrics, see aws-serverless-app/monitoring.py. DynamoDB returns the
+// consumed capacity of every call, summed per invocation (one at a time per container).
+let coldStart = true;
+let consumedCapacity = 0;
+AWS.events.on("validate", (request) => {
+  if (request.service.serviceIdentifier === "dynamodb") {
+    request.params.ReturnConsumedCapacity = "TOTAL";
+  }
+});
+AWS.events.on("success", (response) => {
+  let capacity = response.data && response.data.ConsumedCapacity;
+  for (let entry of [].concat(capacity || [])) {
+    consumedCapacity += entry.CapacityUnits || 0;
+  }
+});
+
+// Duration, cold start, consumed capacity and response size of every invocation,
+// per route and per function (default dimensions only), so that the router's add up
+const invocationMetrics = (handler) => (metrics) => async (event, context) => {
+  let started = Date.now();
+  let cold = coldStart;
+  coldStart = false;
+  consumedCapacity = 0;
+  let result;
+  try {
+    result = await handler(metrics)(event, context);
+    return result;
+  } finally {
+    metrics.putMetric("Duration", Date.now() - started, Unit.Milliseconds);
+    metrics.putMetric("ColdStart", cold ? 1 : 0, Unit.Count);
+    metrics.putMetric("ConsumedCapacity", consumedCapacity, Unit.Count);
+    if (result && typeof result.body === "string") {
+      metrics.putMetric("ResponseSize", Buffer.byteLength(result.body), Unit.Bytes);
+    }
+    metrics.putDimensions({});
+  }
+};
+
 // Lambda Handler
-exports.updateToDoItem = metricScope((metrics) => async (event, context) => {
+exports.updateToDoItem = metricScope(invocationMetrics((metrics) => async (event, context) => {
   metrics.setNamespace("TodoApp");
   metrics.putDimensions({ Service: "updateTodo" });
   metrics.setProperty("RequestId", context.requestId);
 
-  if (!isValidRequest(context, event)) {
+  if (!isValidRequest(event)) {
     metrics.putMetric("Error", 1, Unit.Count);
     return response(400, { message: "Error: Invalid request" });
   }
 
   try {
     let username = getCognitoUsername(event);
+    let body =
+      typeof event.body === "string" ? JSON.parse(event.body) : event.body;
     let data = await updateRecord(
+      username,
       event.pathParameters.id,
-      event.body
+      body
     ).promise();
+    await bumpVersion(metrics, username);
     metrics.putMetric("Success", 1, Unit.Count);
-    return response(200, data);
+    return response(200, withoutCapacity(data));
   } catch (err) {
     metrics.putMetric("Error", 1, Unit.Count);
     return response(400, { message: err.message });
   }
-});
+}));
@@ -0,0 +1,474 @@
+"""Local load test and latency benchmark of the todo handlers.
+
+Replays the `event.json` fixtures of backend-src against every handler, running
+each handler in long-lived Node workers (one worker per simulated container)
+against a local DynamoDB stand-in that the handlers reach through
+ENDPOINT_OVERRIDE, eg DynamoDB Local:
+
+    docker run -p 8000:8000 amazon/dynamodb-local
+    python benchmark/benchmark.py --endpoint http://localhost:8000 --users 20 --items 50
+
+Reports throughput, p50/p95/p99 latency, the cold/warm split and the consumed
+capacity per route, and writes them as JSON so that runs can be diffed.
+
+Both Lambda deployments (`lambdaDeployment` stack config) can be measured:
+"per-route" runs a pool of workers per route, "router" runs the router package
+of backend-src/router, so one pool of workers serves every route, the way one
+warm container serves the whole API.
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import boto3
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend-src")
+APP_DIR = os.path.join(ROOT_DIR, "aws-serverless-app")
+SCHEMA_FILE = os.path.join(ROOT_DIR, "dynamodb", "attributes.json")
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "handler_worker.js")
+ROUTER_DIR = os.path.join(BACKEND_DIR, "router")
+ROUTER_HANDLER = "app.handler"
+MODES = ("per-route", "router")
+
+STACK_TEMPLATE = os.path.join(APP_DIR, "Pulumi.stack_template.yaml")
+
+
+def api_routes() -> List[Dict[str, Any]]:
+    """The Lambda routes of api.get_api_resources() with the stack template config, in replay order (deletes last)
+
+    Routes are {"name", "source", "handler", "method", "path"}, `source` being the
+    function directory in backend-src.
+    """
+    import pulumi
+    import yaml
+
+    with open(STACK_TEMPLATE, "r", encoding="utf-8") as f:
+        stack_config = yaml.safe_load(f)["config"]
+    project = pulumi.get_project()
+    os.environ["PULUMI_CONFIG"] = json.dumps({
+        (key if ":" in key else f"{project}:{key}"): (value if isinstance(value, str) else json.dumps(value))
+        for key, value in stack_config.items()
+    })
+    sys.path.insert(0, APP_DIR)
+    from api import get_api_resources
+
+    routes = [
+        {
+            "name": api_function.name,
+            "source": os.path.basename(os.path.normpath(api_function.filename)),
+            "handler": api_function.handler,
+            "method": method,
+            "path": path,
+        }
+        for path, resource in get_api_resources().items()
+        for method, api_function in resource.methods.items()
+        if api_function.is_lambda
+    ]
+    return sorted(routes, key=lambda route: route["method"] == "DELETE")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return round(ordered[rank - 1], 3)
+
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+class HandlerWorker:
+    """One Node process serving a handler, the local equivalent of a Lambda container"""
+
+    def __init__(self, handler_dir: str, handler: str, env: Dict[str, str]):
+        self.process = subprocess.Popen(
+            ["node", WORKER, handler_dir, handler],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            text=True,
+            bufsize=1,
+        )
+        self._ids = 0
+
+    def invoke(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self._ids += 1
+        self.process.stdin.write(json.dumps({"id": self._ids, "event": event}) + "\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("handler worker exited")
+        return json.loads(line)
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.process.wait(timeout=10)
+
+
+def _source_dir(route: Dict[str, Any]) -> str:
+    return os.path.join(BACKEND_DIR, route.get("source", route["name"]))
+
+
+def prepare_handlers(routes: List[Dict[str, Any]], work_dir: str, install: bool, router: bool = False) -> Dict[str, str]:
+    """Extract the deployment archives built by lambda_packaging, so the benchmark runs the shipped code.
+
+    With `router`, the router package of the routes is built as well, under the name "router".
+    """
+    sys.path.insert(0, APP_DIR)
+    from lambda_packaging import build_archives, assemble_router_source
+
+    cache_path = os.path.join(APP_DIR, ".lambda-build")
+    source_dirs = sorted({_source_dir(route) for route in routes})
+    if router:
+        router_routes = [
+            {"method": route["method"], "path": route["path"], "handler": route["handler"], "source_dir": _source_dir(route)}
+            for route in routes
+        ]
+        source_dirs.append(
+            assemble_router_source(router_routes, ROUTER_DIR, target_dir=os.path.join(cache_path, "src", "router"))
+        )
+    archives = build_archives(source_dirs, cache_path=cache_path, install_dependencies=install)
+    handler_dirs = {}
+    for source_dir, archive in archives.items():
+        target = os.path.join(work_dir, os.path.basename(source_dir))
+        with zipfile.ZipFile(archive) as zf:
+            zf.extractall(target)
+        handler_dirs[os.path.basename(source_dir)] = target
+    return handler_dirs
+
+
+def create_table(dynamodb, table_name: str) -> None:
+    with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    if isinstance(schema, list):
+        schema = {"attributes": schema}
+
+    key_schema = [
+        {"AttributeName": attr["name"], "KeyType": "HASH" if attr["index"] == "hash_key" else "RANGE"}
+        for attr in sorted(schema["attributes"], key=lambda a: a.get("index") != "hash_key")
+        if attr.get("index")
+    ]
+
+    def index_args(index, hash_key):
+        projection = {"ProjectionType": index.get("projection_type", "ALL")}
+        if index.get("non_key_attributes"):
+            projection["NonKeyAttributes"] = index["non_key_attributes"]
+        keys = [{"AttributeName": hash_key, "KeyType": "HASH"}]
+        if index.get("range_key"):
+            keys.append({"AttributeName": index["range_key"], "KeyType": "RANGE"})
+        return {"IndexName": index["name"], "KeySchema": keys, "Projection": projection}
+
+    table_hash_key = key_schema[0]["AttributeName"]
+    args = {
+        "TableName": table_name,
+        "AttributeDefinitions": [{"AttributeName": a["name"], "AttributeType": a["type"]} for a in schema["attributes"]],
+        "KeySchema": key_schema,
+        "BillingMode": "PAY_PER_REQUEST",
+    }
+    if schema.get("global_secondary_indexes"):
+        args["GlobalSecondaryIndexes"] = [index_args(i, i["hash_key"]) for i in schema["global_secondary_indexes"]]
+    if schema.get("local_secondary_indexes"):
+        args["LocalSecondaryIndexes"] = [index_args(i, table_hash_key) for i in schema["local_secondary_indexes"]]
+
+    dynamodb.create_table(**args)
+    dynamodb.get_waiter("table_exists").wait(TableName=table_name)
+
+
+def seed_items(table, users: List[str], items_per_user: int) -> Dict[str, List[str]]:
+    now = "2020-01-01T00:00:00.000Z"
+    item_ids: Dict[str, List[str]] = {}
+    with table.batch_writer() as batch:
+        for user in users:
+            item_ids[user] = []
+            for n in range(items_per_user):
+                item_id = str(uuid.uuid1())
+                item_ids[user].append(item_id)
+                batch.put_item(Item={
+                    "cognito-username": user,
+                    "id": item_id,
+                    "item": f"benchmark item {n}",
+                    "completed": False,
+                    "creation_date": now,
+                    "lastupdate_date": now,
+                    "open_lastupdate_date": now,
+                })
+    return item_ids
+
+
+def load_event(name: str) -> Dict[str, Any]:
+    with open(os.path.join(BACKEND_DIR, name, "event.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Items read or created by one batch request
+BATCH_SIZE = 10
+
+
+def build_event(
+    template: Dict[str, Any],
+    route: Dict[str, Any],
+    user: str,
+    item_id: Optional[str],
+    user_item_ids: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    event = copy.deepcopy(template)
+    path = route["path"].replace("{id}", item_id or "")
+    event.update({
+        "resource": route["path"],
+        "path": path,
+        "httpMethod": route["method"],
+        "pathParameters": {"id": item_id} if item_id else None,
+        "queryStringParameters": None,
+        "body": None,
+    })
+    event.setdefault("requestContext", {})
+    event["requestContext"].update({"resourcePath": route["path"], "httpMethod": route["method"]})
+    event["requestContext"]["authorizer"] = {"claims": {"cognito:username": user}}
+    event["headers"] = {**(event.get("headers") or {}), "Authorization": f"token-{user}"}
+    if route["name"] == "addTodo":
+        event["body"] = json.dumps({"item": "benchmark item", "completed": False})
+    elif route["name"] == "updateTodo":
+        event["body"] = json.dumps({"item": "benchmark item updated", "completed": False})
+    elif route["name"] == "batchGetTodo":
+        event["queryStringParameters"] = {"ids": ",".join((user_item_ids or [])[:BATCH_SIZE])}
+    elif route["name"] == "batchWriteTodo":
+        event["body"] = json.dumps({"create": [{"item": f"benchmark batch item {n}", "completed": False} for n in range(BATCH_SIZE)]})
+    return event
+
+
+def run_route(
+    route: Dict[str, Any],
+    workers: List[HandlerWorker],
+    users: List[str],
+    item_ids: Dict[str, List[str]],
+    requests_per_user: int,
+) -> Dict[str, Any]:
+    template = load_event(route.get("source", route["name"]))
+    needs_id = "{id}" in route["path"]
+
+    # Every user sends requests_per_user requests, items are consumed in order so deletes hit existing items
+    events = []
+    for user in users:
+        for n in range(requests_per_user):
+            ids = item_ids[user]
+            item_id = ids[n % len(ids)] if needs_id and ids else None
+            events.append(build_event(template, route, user, item_id, ids))
+
+    concurrency = len(workers)
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def drive(worker_index: int) -> None:
+        worker = workers[worker_index]
+        for event in events[worker_index::concurrency]:
+            start = time.perf_counter()
+            result = worker.invoke(event)
+            result["wall_ms"] = (time.perf_counter() - start) * 1000
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(drive, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(route, results, elapsed)
+
+
+def run_mode(
+    mode: str,
+    routes: List[Dict[str, Any]],
+    handler_dirs: Dict[str, str],
+    env: Dict[str, str],
+    users: List[str],
+    item_ids: Dict[str, List[str]],
+    requests_per_user: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """Replay every route in one Lambda deployment mode"""
+    results = {}
+    shared_workers = None
+    if mode == "router":
+        # One pool of containers for the whole API
+        shared_workers = [HandlerWorker(handler_dirs["router"], ROUTER_HANDLER, env) for _ in range(concurrency)]
+    try:
+        for route in routes:
+            if shared_workers:
+                workers = shared_workers
+            else:
+                workers = [
+                    HandlerWorker(handler_dirs[route.get("source", route["name"])], route["handler"], env)
+                    for _ in range(concurrency)
+                ]
+            try:
+                results[route["name"]] = run_route(route, workers, users, item_ids, requests_per_user)
+            finally:
+                if not shared_workers:
+                    for worker in workers:
+                        worker.close()
+    finally:
+        for worker in shared_workers or []:
+            worker.close()
+
+    return {
+        "cold_starts": sum(route["cold_starts"] for route in results.values()),
+        "routes": results,
+    }
+
+
+def summarize(route: Dict[str, Any], results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    errors = [r for r in results if r["error"] or (r["status_code"] or 500) >= 400]
+    cold = [r for r in results if r["cold"]]
+    warm = [r for r in results if not r["cold"]]
+    capacity = sum(r["consumed_capacity"] for r in results)
+    return {
+        "method": route["method"],
+        "path": route["path"],
+        "requests": len(results),
+        "errors": len(errors),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_ms": latency_summary([r["duration_ms"] for r in results]),
+        "cold_starts": len(cold),
+        "cold_latency_ms": latency_summary([r["duration_ms"] for r in cold]),
+        "cold_init_ms": latency_summary([r["init_ms"] for r in cold]),
+        "warm_latency_ms": latency_summary([r["duration_ms"] for r in warm]),
+        "consumed_capacity": {
+            "total": round(capacity, 3),
+            "per_request": round(capacity / len(results), 3) if results else None,
+            "dynamodb_calls": sum(r["dynamodb_calls"] for r in results),
+        },
+        "response_bytes": latency_summary([r["response_size"] for r in results]),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay event.json fixtures against the todo handlers")
+    parser.add_argument("--endpoint", default="http://localhost:8000", help="local DynamoDB endpoint")
+    parser.add_argument("--region", default="eu-west-1")
+    parser.add_argument("--users", type=int, default=10, help="simulated users")
+    parser.add_argument("--items", type=int, default=20, help="seeded items per user")
+    parser.add_argument("--requests", type=int, default=5, help="requests per user and route")
+    parser.add_argument("--concurrency", type=int, default=4, help="workers (containers) per route")
+    parser.add_argument("--routes", nargs="*", help="route names to run (default: all)")
+    parser.add_argument("--mode", choices=[*MODES, "both"], default="both", help="Lambda deployment to measure")
+    parser.add_argument("--xray", action="store_true", help="wrap the AWS SDK with X-Ray, like `tracing.enabled`")
+    parser.add_argument("--no-install", action="store_true", help="do not run npm when building archives")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def run_benchmark(args: argparse.Namespace, routes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    routes = [route for route in routes if not args.routes or route["name"] in args.routes]
+    table_name = f"todo-benchmark-{uuid.uuid4().hex[:8]}"
+    session = boto3.Session(aws_access_key_id="local", aws_secret_access_key="local", region_name=args.region)
+    dynamodb = session.client("dynamodb", endpoint_url=args.endpoint)
+
+    env = {
+        **os.environ,
+        "TABLE_NAME": table_name,
+        "ENDPOINT_OVERRIDE": args.endpoint,
+        "REGION": args.region,
+        "AWS_REGION": args.region,
+        "AWS_ACCESS_KEY_ID": "local",
+        "AWS_SECRET_ACCESS_KEY": "local",
+        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+        "AWS_EMF_ENVIRONMENT": "Local",
+        "AWS_XRAY_CONTEXT_MISSING": "IGNORE_ERROR",
+    }
+    if args.xray:
+        env["XRAY_TRACING"] = "1"
+
+    modes = MODES if args.mode == "both" else (args.mode,)
+    users = [f"bench-user-{n}" for n in range(args.users)]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="todo-bench-") as work_dir:
+        handler_dirs = prepare_handlers(routes, work_dir, install=not args.no_install, router="router" in modes)
+        for mode in modes:
+            # Every mode starts from the same freshly seeded table
+            create_table(dynamodb, table_name)
+            try:
+                item_ids = seed_items(
+                    session.resource("dynamodb", endpoint_url=args.endpoint).Table(table_name), users, args.items
+                )
+                results[mode] = run_mode(
+                    mode,
+                    routes,
+                    handler_dirs,
+                    env,
+                    users,
+                    item_ids,
+                    requests_per_user=args.requests,
+                    concurrency=args.concurrency,
+                )
+            finally:
+                dynamodb.delete_table(TableName=table_name)
+
+    return {
+        "parameters": {
+            "users": args.users,
+            "items_per_user": args.items,
+            "requests_per_user": args.requests,
+            "concurrency": args.concurrency,
+            "xray": args.xray,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "node": subprocess.run(["node", "--version"], capture_output=True, text=True).stdout.strip(),
+            "platform": platform.platform(),
+        },
+        "modes": results,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for mode, results in report["modes"].items():
+        print(f"{mode}: {results['cold_starts']} cold starts")
+        print(f"{'route':<14}{'req':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'cold':>6}{'cold p50':>10}{'RCU/WCU':>9}")
+        for name, route in results["routes"].items():
+            latency = route["latency_ms"]
+            print(
+                f"{name:<14}{route['requests']:>6}{route['errors']:>5}{route['throughput_rps']:>9}"
+                f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}{route['cold_starts']:>6}"
+                f"{str(route['cold_latency_ms']['p50']):>10}{route['consumed_capacity']['total']:>9}"
+            )
+        print()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = run_benchmark(args, api_routes())
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print_report(report)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
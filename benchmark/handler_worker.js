@@ -0,0 +1,94 @@
+// Runs one Lambda handler in a long-lived process, like a Lambda container.
+//
+// Usage: node handler_worker.js <handler dir> <module.export>
+// Reads one JSON request per line on stdin ({"id", "event"}) and writes one
+// JSON result per line on stdout. The first invocation of a worker is cold.
+
+const path = require("path");
+const readline = require("readline");
+
+const [handlerDir, handlerName] = process.argv.slice(2);
+const [moduleName, exportName] = handlerName.split(".");
+
+// Handler logs and embedded metrics go to stderr, stdout is the result channel
+const write = (result) => process.stdout.write(JSON.stringify(result) + "\n");
+console.log = console.error;
+console.info = console.error;
+
+// Ask DynamoDB for the consumed capacity of every call made by the handler
+let consumedCapacity = 0;
+let dynamodbCalls = 0;
+let itemsRead = 0;
+try {
+  const AWS = require(require.resolve("aws-sdk", { paths: [handlerDir] }));
+  AWS.events.on("validate", (request) => {
+    if (request.service.serviceIdentifier === "dynamodb") {
+      request.params.ReturnConsumedCapacity = "TOTAL";
+    }
+  });
+  AWS.events.on("success", (response) => {
+    if (response.request.service.serviceIdentifier !== "dynamodb") {
+      return;
+    }
+    dynamodbCalls += 1;
+    let data = response.data || {};
+    // items returned by Query/Scan, GetItem and BatchGetItem
+    itemsRead += data.Count || (data.Item ? 1 : 0);
+    for (let items of Object.values(data.Responses || {})) {
+      itemsRead += items.length;
+    }
+    let capacity = data.ConsumedCapacity;
+    for (let entry of [].concat(capacity || [])) {
+      consumedCapacity += entry.CapacityUnits || 0;
+    }
+  });
+} catch (err) {
+  // bundled handlers (no aws-sdk v2) report no consumed capacity
+}
+
+const initStart = process.hrtime.bigint();
+const handler = require(path.join(handlerDir, moduleName))[exportName];
+const initMs = Number(process.hrtime.bigint() - initStart) / 1e6;
+let invocations = 0;
+
+const rl = readline.createInterface({ input: process.stdin });
+rl.on("line", async (line) => {
+  const request = JSON.parse(line);
+  const context = { requestId: `bench-${request.id}`, functionName: moduleName };
+  consumedCapacity = 0;
+  dynamodbCalls = 0;
+  itemsRead = 0;
+
+  const start = process.hrtime.bigint();
+  let statusCode = null;
+  let responseSize = 0;
+  let batchItemFailures = null;
+  let error = null;
+  try {
+    const response = await handler(request.event, context);
+    statusCode = response.statusCode;
+    responseSize = response.body ? Buffer.byteLength(response.body) : 0;
+    // SQS event sources report the failed messages of the batch
+    if (response.batchItemFailures) {
+      batchItemFailures = response.batchItemFailures.map((failure) => failure.itemIdentifier);
+    }
+  } catch (err) {
+    error = err.message;
+  }
+  const durationMs = Number(process.hrtime.bigint() - start) / 1e6;
+
+  write({
+    id: request.id,
+    cold: invocations === 0,
+    init_ms: invocations === 0 ? initMs : 0,
+    duration_ms: durationMs,
+    status_code: statusCode,
+    response_size: responseSize,
+    consumed_capacity: consumedCapacity,
+    dynamodb_calls: dynamodbCalls,
+    items_read: itemsRead,
+    batch_item_failures: batchItemFailures,
+    error: error,
+  });
+  invocations += 1;
+});
@@ -0,0 +1,255 @@
+"""Local end-to-end run of the queued write path (`writeIngestion: queue`).
+
+Plays the part of API Gateway and of the Lambda SQS event source against local
+SQS and DynamoDB stand-ins, eg moto in server mode:
+
+    moto_server -p 5000
+    python benchmark/ingestion.py --endpoint http://localhost:5000 --users 5 --items 40
+
+Requests are sent to the queue the way the API Gateway integration sends them
+(the body as message, the username and the item id as message attributes),
+batches are received and handed to the addTodoConsumer handler as SQS events,
+the messages reported in `batchItemFailures` stay on the queue and the others
+are deleted. Malformed messages (`--invalid`) must end up in the dead-letter
+queue and every valid item in the table, the completed ones with their
+`expires_at` TTL with `--completed-ttl-seconds`. The same run is a test of
+aws-serverless-app/tests/test_ingestion.py, against moto.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import boto3
+
+from benchmark import HandlerWorker, create_table, prepare_handlers
+
+
+CONSUMER = {"name": "addTodoConsumer", "handler": "app.addToDoItems"}
+# SQS returns at most 10 messages per receive, the event source polls until the batch is full
+RECEIVE_LIMIT = 10
+
+
+def send_requests(sqs, queue_url: str, users: List[str], items_per_user: int, invalid: int) -> int:
+    """Enqueue the requests like the API Gateway integration, returns the number of valid messages"""
+    messages = []
+    for user in users:
+        for n in range(items_per_user):
+            body = json.dumps({"item": f"queued item {n}", "completed": n % 4 == 0})
+            messages.append((body, user))
+    for n in range(invalid):
+        messages.append(("not json", users[n % len(users)]))
+
+    for start in range(0, len(messages), 10):
+        entries = [
+            {
+                "Id": str(i),
+                "MessageBody": body,
+                "MessageAttributes": {
+                    "username": {"DataType": "String", "StringValue": user},
+                    # $context.requestId
+                    "itemId": {"DataType": "String", "StringValue": str(uuid.uuid4())},
+                },
+            }
+            for i, (body, user) in enumerate(messages[start:start + 10])
+        ]
+        sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    return len(messages) - invalid
+
+
+def sqs_record(message: Dict[str, Any], queue_arn: str, region: str) -> Dict[str, Any]:
+    """A received message in the format of the Lambda SQS event"""
+    return {
+        "messageId": message["MessageId"],
+        "receiptHandle": message["ReceiptHandle"],
+        "body": message["Body"],
+        "attributes": message.get("Attributes", {}),
+        "messageAttributes": {
+            name: {"stringValue": value.get("StringValue"), "dataType": value["DataType"]}
+            for name, value in message.get("MessageAttributes", {}).items()
+        },
+        "md5OfBody": message["MD5OfBody"],
+        "eventSource": "aws:sqs",
+        "eventSourceARN": queue_arn,
+        "awsRegion": region,
+    }
+
+
+def receive_batch(sqs, queue_url: str, batch_size: int) -> List[Dict[str, Any]]:
+    messages: List[Dict[str, Any]] = []
+    while len(messages) < batch_size:
+        received = sqs.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=min(RECEIVE_LIMIT, batch_size - len(messages)),
+            AttributeNames=["All"],
+            MessageAttributeNames=["All"],
+        ).get("Messages", [])
+        if not received:
+            break
+        messages.extend(received)
+    return messages
+
+
+def queue_depth(sqs, queue_url: str) -> int:
+    attributes = sqs.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+    )["Attributes"]
+    return int(attributes["ApproximateNumberOfMessages"]) + int(attributes["ApproximateNumberOfMessagesNotVisible"])
+
+
+def drain(
+    sqs,
+    worker: HandlerWorker,
+    queue_url: str,
+    queue_arn: str,
+    region: str,
+    batch_size: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    """Event source loop: receive, invoke, delete what the handler did not report as failed"""
+    invocations = []
+    deadline = time.monotonic() + timeout
+    while queue_depth(sqs, queue_url) and time.monotonic() < deadline:
+        messages = receive_batch(sqs, queue_url, batch_size)
+        if not messages:
+            continue
+        result = worker.invoke({"Records": [sqs_record(m, queue_arn, region) for m in messages]})
+        # a failed invocation returns the whole batch to the queue
+        failed = set(result["batch_item_failures"] or []) if not result["error"] else {m["MessageId"] for m in messages}
+        done = [m for m in messages if m["MessageId"] not in failed]
+        for start in range(0, len(done), 10):
+            sqs.delete_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]} for i, m in enumerate(done[start:start + 10])],
+            )
+        # failed messages are visible again at once, instead of after the visibility timeout
+        for m in messages:
+            if m["MessageId"] in failed:
+                sqs.change_message_visibility(QueueUrl=queue_url, ReceiptHandle=m["ReceiptHandle"], VisibilityTimeout=0)
+        invocations.append({"messages": len(messages), "failed": len(failed), "duration_ms": result["duration_ms"]})
+    return {
+        "invocations": len(invocations),
+        "messages": sum(i["messages"] for i in invocations),
+        "failed": sum(i["failed"] for i in invocations),
+        "mean_batch": round(sum(i["messages"] for i in invocations) / len(invocations), 2) if invocations else None,
+        "drained": queue_depth(sqs, queue_url) == 0,
+    }
+
+
+def count_items(dynamodb, table_name: str) -> int:
+    count = 0
+    for page in dynamodb.get_paginator("scan").paginate(TableName=table_name, Select="COUNT"):
+        count += page["Count"]
+    return count
+
+
+def count_completed_items(dynamodb, table_name: str) -> Dict[str, int]:
+    """Completed items, and the ones of them that expire"""
+    counts = {"completed_items": 0, "expiring_completed_items": 0}
+    for page in dynamodb.get_paginator("scan").paginate(
+        TableName=table_name,
+        FilterExpression="completed = :completed",
+        ExpressionAttributeValues={":completed": {"BOOL": True}},
+        ProjectionExpression="expires_at",
+    ):
+        counts["completed_items"] += page["Count"]
+        counts["expiring_completed_items"] += sum("expires_at" in item for item in page["Items"])
+    return counts
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the queued addTodo write path against local SQS and DynamoDB")
+    parser.add_argument("--endpoint", default="http://localhost:5000", help="local DynamoDB endpoint")
+    parser.add_argument("--sqs-endpoint", help="local SQS endpoint (default: --endpoint)")
+    parser.add_argument("--region", default="eu-west-1")
+    parser.add_argument("--users", type=int, default=5, help="simulated users")
+    parser.add_argument("--items", type=int, default=20, help="queued items per user")
+    parser.add_argument("--invalid", type=int, default=2, help="malformed messages, expected in the dead-letter queue")
+    parser.add_argument("--batch-size", type=int, default=100, help="messages per consumer invocation")
+    parser.add_argument("--max-receive-count", type=int, default=5, help="deliveries before the dead-letter queue")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to drain the queue")
+    parser.add_argument("--completed-ttl-seconds", type=int, help="COMPLETED_TTL_SECONDS of the consumer (completedItems)")
+    parser.add_argument("--no-install", action="store_true", help="do not run npm when building archives")
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Report of one run, see main"""
+    suffix = uuid.uuid4().hex[:8]
+    table_name = f"todo-ingestion-{suffix}"
+    session = boto3.Session(aws_access_key_id="local", aws_secret_access_key="local", region_name=args.region)
+    dynamodb = session.client("dynamodb", endpoint_url=args.endpoint)
+    sqs = session.client("sqs", endpoint_url=args.sqs_endpoint or args.endpoint)
+
+    env = {
+        **os.environ,
+        "TABLE_NAME": table_name,
+        "ENDPOINT_OVERRIDE": args.endpoint,
+        "REGION": args.region,
+        "AWS_REGION": args.region,
+        "AWS_ACCESS_KEY_ID": "local",
+        "AWS_SECRET_ACCESS_KEY": "local",
+        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+        "AWS_EMF_ENVIRONMENT": "Local",
+        "AWS_XRAY_CONTEXT_MISSING": "IGNORE_ERROR",
+    }
+    if args.completed_ttl_seconds:
+        env["COMPLETED_TTL_SECONDS"] = str(args.completed_ttl_seconds)
+
+    users = [f"ingestion-user-{n}" for n in range(args.users)]
+    create_table(dynamodb, table_name)
+    dlq_url = sqs.create_queue(QueueName=f"{table_name}-dlq")["QueueUrl"]
+    dlq_arn = sqs.get_queue_attributes(QueueUrl=dlq_url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+    queue_url = sqs.create_queue(
+        QueueName=f"{table_name}-queue",
+        Attributes={
+            "RedrivePolicy": json.dumps({"deadLetterTargetArn": dlq_arn, "maxReceiveCount": args.max_receive_count}),
+        },
+    )["QueueUrl"]
+    queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+    try:
+        expected = send_requests(sqs, queue_url, users, args.items, args.invalid)
+        with tempfile.TemporaryDirectory(prefix="todo-ingestion-") as work_dir:
+            handler_dirs = prepare_handlers([CONSUMER], work_dir, install=not args.no_install)
+            worker = HandlerWorker(handler_dirs[CONSUMER["name"]], CONSUMER["handler"], env)
+            try:
+                report = drain(sqs, worker, queue_url, queue_arn, args.region, args.batch_size, args.timeout)
+            finally:
+                worker.close()
+        report.update({
+            "expected_items": expected,
+            "written_items": count_items(dynamodb, table_name),
+            "expected_dead_letters": args.invalid,
+            "dead_letters": queue_depth(sqs, dlq_url),
+            **count_completed_items(dynamodb, table_name),
+        })
+    finally:
+        sqs.delete_queue(QueueUrl=queue_url)
+        sqs.delete_queue(QueueUrl=dlq_url)
+        dynamodb.delete_table(TableName=table_name)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    print(json.dumps(report, indent=2, sort_keys=True))
+    ok = (
+        report["drained"]
+        and report["written_items"] == report["expected_items"]
+        and report["dead_letters"] == report["expected_dead_letters"]
+        and (not args.completed_ttl_seconds
+             or report["expiring_completed_items"] == report["completed_items"])
+    )
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
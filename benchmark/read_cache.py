@@ -0,0 +1,175 @@
+"""Benchmark of the getTodo/getAllTodo read cache (`readCache` stack config).
+
+Replays user sessions shaped like the frontend (App.js reloads the list after
+every add, complete and update) against warm handler workers, once without
+and once with the read cache, and reports the DynamoDB reads per session:
+
+    python benchmark/read_cache.py --endpoint http://localhost:8000 --users 20 --items 50
+
+With the cache, a re-read of unchanged items costs one strongly consistent
+GetItem of the user's write version instead of the items query; reads after
+a write miss, because every write handler bumps the version.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import uuid
+from typing import Any, Dict, List, Optional
+
+import boto3
+
+from benchmark import (HandlerWorker, api_routes, build_event, create_table, latency_summary, load_event,
+                       prepare_handlers, seed_items)
+
+
+READ_ROUTES = ("getAllTodo", "getTodo")
+# One session of a user, in order. Item ids are taken from the seeded items.
+SESSION = [
+    "getAllTodo", "getAllTodo", "addTodo", "getAllTodo", "getTodo", "getTodo",
+    "completeTodo", "getAllTodo", "getAllTodo", "getTodo", "updateTodo", "getAllTodo",
+    "getAllTodo", "deleteTodo", "getAllTodo",
+]
+
+
+def create_versions_table(dynamodb, table_name: str) -> None:
+    dynamodb.create_table(
+        TableName=table_name,
+        AttributeDefinitions=[{"AttributeName": "cognito-username", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "cognito-username", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.get_waiter("table_exists").wait(TableName=table_name)
+
+
+def run_sessions(
+    routes: Dict[str, Dict[str, Any]],
+    handler_dirs: Dict[str, str],
+    env: Dict[str, str],
+    users: List[str],
+    item_ids: Dict[str, List[str]],
+    sessions: int,
+) -> Dict[str, Any]:
+    """Every user runs its sessions on one warm worker per handler, like one busy container per function"""
+    templates = {name: load_event(route.get("source", name)) for name, route in routes.items()}
+    workers = {name: HandlerWorker(handler_dirs[route.get("source", name)], route["handler"], env) for name, route in routes.items()}
+    results: Dict[str, List[Dict[str, Any]]] = {name: [] for name in routes}
+    try:
+        for session in range(sessions):
+            for user in users:
+                # each session works on the next seeded item, deleted at its end
+                item_id = item_ids[user][session % len(item_ids[user])]
+                for name in SESSION:
+                    route = routes[name]
+                    event = build_event(templates[name], route, user, item_id if "{id}" in route["path"] else None)
+                    result = workers[name].invoke(event)
+                    if not result["cold"]:
+                        results[name].append(result)
+    finally:
+        for worker in workers.values():
+            worker.close()
+
+    def totals(names):
+        invocations = [r for name in names for r in results[name]]
+        return {
+            "invocations": len(invocations),
+            "dynamodb_calls": sum(r["dynamodb_calls"] for r in invocations),
+            "consumed_capacity": round(sum(r["consumed_capacity"] for r in invocations), 3),
+            "items_read": sum(r["items_read"] for r in invocations),
+            "errors": sum(1 for r in invocations if r["error"] or (r["status_code"] or 500) >= 400),
+        }
+
+    reads = totals(READ_ROUTES)
+    session_count = sessions * len(users)
+    return {
+        "reads": reads,
+        "writes": totals([name for name in routes if name not in READ_ROUTES]),
+        "read_capacity_per_session": round(reads["consumed_capacity"] / session_count, 3) if session_count else None,
+        "items_read_per_session": round(reads["items_read"] / session_count, 2) if session_count else None,
+        "read_latency_ms": latency_summary([r["duration_ms"] for name in READ_ROUTES for r in results[name]]),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare DynamoDB reads per session with and without the read cache")
+    parser.add_argument("--endpoint", default="http://localhost:8000", help="local DynamoDB endpoint")
+    parser.add_argument("--region", default="eu-west-1")
+    parser.add_argument("--users", type=int, default=10, help="simulated users")
+    parser.add_argument("--items", type=int, default=50, help="seeded items per user")
+    parser.add_argument("--sessions", type=int, default=3, help="sessions per user")
+    parser.add_argument("--cache-ttl", type=int, default=60, help="READ_CACHE_TTL_SECONDS")
+    parser.add_argument("--cache-entries", type=int, default=500, help="READ_CACHE_MAX_ENTRIES")
+    parser.add_argument("--no-install", action="store_true", help="do not run npm when building archives")
+    parser.add_argument("--output", default="read-cache-results.json", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    routes = {route["name"]: route for route in api_routes() if route["name"] in SESSION}
+    suffix = uuid.uuid4().hex[:8]
+    table_name = f"todo-read-cache-{suffix}"
+    versions_table_name = f"{table_name}-versions"
+    session = boto3.Session(aws_access_key_id="local", aws_secret_access_key="local", region_name=args.region)
+    dynamodb = session.client("dynamodb", endpoint_url=args.endpoint)
+
+    env = {
+        **os.environ,
+        "TABLE_NAME": table_name,
+        "ENDPOINT_OVERRIDE": args.endpoint,
+        "REGION": args.region,
+        "AWS_REGION": args.region,
+        "AWS_ACCESS_KEY_ID": "local",
+        "AWS_SECRET_ACCESS_KEY": "local",
+        "AWS_NODEJS_CONNECTION_REUSE_ENABLED": "1",
+        "AWS_EMF_ENVIRONMENT": "Local",
+        "AWS_XRAY_CONTEXT_MISSING": "IGNORE_ERROR",
+    }
+    cached_env = {
+        **env,
+        "VERSIONS_TABLE_NAME": versions_table_name,
+        "READ_CACHE_MAX_ENTRIES": str(args.cache_entries),
+        "READ_CACHE_TTL_SECONDS": str(args.cache_ttl),
+    }
+
+    users = [f"cache-user-{n}" for n in range(args.users)]
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="todo-read-cache-") as work_dir:
+        handler_dirs = prepare_handlers(list(routes.values()), work_dir, install=not args.no_install)
+        for mode, mode_env in (("uncached", env), ("cached", cached_env)):
+            # Both runs start from the same freshly seeded tables
+            create_table(dynamodb, table_name)
+            create_versions_table(dynamodb, versions_table_name)
+            try:
+                item_ids = seed_items(
+                    session.resource("dynamodb", endpoint_url=args.endpoint).Table(table_name), users, args.items
+                )
+                report[mode] = run_sessions(routes, handler_dirs, mode_env, users, item_ids, args.sessions)
+            finally:
+                dynamodb.delete_table(TableName=table_name)
+                dynamodb.delete_table(TableName=versions_table_name)
+
+    report["parameters"] = {"users": args.users, "items_per_user": args.items, "sessions_per_user": args.sessions}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print(f"{'mode':<10}{'reads':>7}{'calls':>7}{'items':>8}{'items/session':>15}{'RCU/session':>13}{'p50 ms':>9}{'errors':>8}")
+    for mode in ("uncached", "cached"):
+        reads = report[mode]["reads"]
+        print(
+            f"{mode:<10}{reads['invocations']:>7}{reads['dynamodb_calls']:>7}{reads['items_read']:>8}"
+            f"{report[mode]['items_read_per_session']:>15}{report[mode]['read_capacity_per_session']:>13}"
+            f"{report[mode]['read_latency_ms']['p50']:>9}{reads['errors']:>8}"
+        )
+    # the version check reads one small item, the items query reads the whole list
+    uncached, cached = report["uncached"]["items_read_per_session"], report["cached"]["items_read_per_session"]
+    if uncached:
+        print(f"Items read from DynamoDB per session: {round(100 * (1 - cached / uncached), 1)}% less with the cache")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -58,12 +58,15 @@ function App() {
     });
   };
 
-  const getAllTodos = async () => {
+  // invalidate flushes the cached list of this user after a change
+  const getAllTodos = async (invalidate = false) => {
+    const headers = { Authorization: idToken };
+    if (invalidate) {
+      headers['Cache-Control'] = 'max-age=0';
+    }
     const result = await axios({
       url: `${config.api_base_url}/item/`,
-      headers: {
-        Authorization: idToken
-      }
+      headers: headers
     }).catch(error => {
       console.log(error);
     });
@@ -101,7 +104,11 @@ function App() {
     if (result && result.status === 401) {
       clearCredentials();
     } else if (result && result.status === 200) {
-      getAllTodos();
+      getAllTodos(true);
+      newToDoInput.value = '';
+    } else if (result && result.status === 202) {
+      // queued write (writeIngestion: queue), the item is shown before it is stored
+      setToDos([...toDos, { ...newToDo, id: result.data.id }]);
       newToDoInput.value = '';
     }
   }
@@ -123,6 +130,7 @@ function App() {
     } else if (result && result.status === 200) {
       const newToDos = toDos.filter((item, index) => index !== indexToRemove);
       setToDos(newToDos);
+      getAllTodos(true);
     }
   }
 
@@ -138,10 +146,49 @@ function App() {
     });
 
     if (result && result.status === 200) {
-      getAllTodos();
+      getAllTodos(true);
     }
   }
 
+  // One POST /item/batch per 100 operations and a single list refresh,
+  // instead of a request and a refresh per item
+  const batchToDos = async ({ complete = [], remove = [] }) => {
+    const operations = [
+      ...complete.map(id => ['complete', id]),
+      ...remove.map(id => ['delete', id])
+    ];
+    for (let i = 0; i < operations.length; i += 100) {
+      const data = { complete: [], delete: [] };
+      operations.slice(i, i + 100).forEach(([operation, id]) => data[operation].push(id));
+      const result = await axios({
+        method: 'POST',
+        url: `${config.api_base_url}/item/batch`,
+        headers: {
+          Authorization: idToken
+        },
+        data: data
+      });
+      if (result && result.status === 401) {
+        clearCredentials();
+        return;
+      }
+    }
+    getAllTodos(true);
+  }
+
+  const completeAllToDos = async () => {
+    const ids = toDos.filter(item => !item.completed).map(item => item.id);
+    if (ids.length === 0) return;
+    await batchToDos({ complete: ids });
+  }
+
+  const clearCompletedToDos = async () => {
+    const ids = toDos.filter(item => item.completed).map(item => item.id);
+    if (ids.length === 0) return;
+    setToDos(toDos.filter(item => !item.completed));
+    await batchToDos({ remove: ids });
+  }
+
   return (
     <div className="App">
       <Container>
@@ -161,7 +208,7 @@ function App() {
             <Col md="6">
               {idToken.length > 0 ?
                 (
-                  <ToDo updateAlert={updateAlert} toDos={toDos} addToDo={addToDo} deleteToDo={deleteToDo} completeToDo={completeToDo} />
+                  <ToDo updateAlert={updateAlert} toDos={toDos} addToDo={addToDo} deleteToDo={deleteToDo} completeToDo={completeToDo} completeAllToDos={completeAllToDos} clearCompletedToDos={clearCompletedToDos} />
                 ) : (
                   <Button
                     href={`https://${config.cognito_hosted_domain}/login?response_type=token&client_id=${config.aws_user_pools_web_client_id}&redirect_uri=${config.redirect_url}`}
@@ -3,7 +3,7 @@ import { Button, ButtonGroup, Form, FormGroup, Input, Label, Row, Col } from 're
 
 import './ToDo.css';
 
-function ToDo({ toDos, addToDo, deleteToDo, completeToDo }) {
+function ToDo({ toDos, addToDo, deleteToDo, completeToDo, completeAllToDos, clearCompletedToDos }) {
   const [filter, setFilter] = useState('all');
 
   const changeFilter = (newFilter) => {
@@ -28,6 +28,10 @@ function ToDo({ toDos, addToDo, deleteToDo, completeToDo }) {
             <Button onClick={(e) => changeFilter('complete')} color={(filter === 'complete') ? 'primary' : 'secondary'}>Complete</Button>
             <Button onClick={(e) => changeFilter('incomplete')} color={(filter === 'incomplete') ? 'primary' : 'secondary'}>Incomplete</Button>
           </ButtonGroup>
+          <ButtonGroup className="ml-1">
+            <Button onClick={completeAllToDos} color="success" outline title="Complete all ToDos">Complete all</Button>
+            <Button onClick={clearCompletedToDos} color="danger" outline title="Delete completed ToDos">Clear completed</Button>
+          </ButtonGroup>
         </Col>
         <Col xs="12" className="mt-1 mb-1">
           <ul className="list-group">
@@ -0,0 +1,21 @@
+// Settings of the stack, published by the Pulumi program as /config.json
+// (see aws-serverless-app/cloudfront.py), so that one build works for any stack.
+// For `npm start`, put a config.json with the outputs of your stack into public/.
+const config = {
+  aws_user_pools_web_client_id: null,   // CognitoClientID
+  api_base_url: null,                   // TodoFunctionApi
+  cognito_hosted_domain: null,          // CognitoDomainName
+  redirect_url: null,                   // AmplifyURL
+};
+
+export async function loadConfig() {
+  // Revalidated on every load, a new deployment applies without a new build
+  const response = await fetch(`${process.env.PUBLIC_URL}/config.json`, { cache: 'no-cache' });
+  if (!response.ok) {
+    throw new Error(`Could not load config.json (${response.status})`);
+  }
+  Object.assign(config, await response.json());
+  return config;
+}
+
+export default config;
@@ -4,9 +4,13 @@ import ReactDOM from 'react-dom';
 import 'bootstrap/dist/css/bootstrap.css';
 import './index.css';
 import App from './App';
+import { loadConfig } from './config';
 import * as serviceWorker from './serviceWorker';
 
-ReactDOM.render(<App />, document.getElementById('root'));
+// The app reads the stack settings of config.js, they are loaded first
+loadConfig()
+  .then(() => ReactDOM.render(<App />, document.getElementById('root')))
+  .catch((err) => ReactDOM.render(<p>{err.message}</p>, document.getElementById('root')));
 
 // If you want your app to work offline and load faster, you can change
 // unregister() to register() below. Note this comes with some pitfalls.